@@ -6,9 +6,10 @@ Flask application factory and configuration
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 import os
+from app.storage import RoutingSession
 
 # Initialize extensions
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 
 def create_app():
     """Create and configure the Flask application"""
@@ -19,8 +20,72 @@ def create_app():
     app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///muims.db')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     
+    # Incident list: hard cap on ?per_page= and how long filtered totals are cached
+    app.config['INCIDENTS_MAX_PER_PAGE'] = int(os.environ.get('INCIDENTS_MAX_PER_PAGE', 100))
+    app.config['INCIDENTS_COUNT_TTL'] = int(os.environ.get('INCIDENTS_COUNT_TTL', 30))
+    
+    # Gzip the streamed CSV export for clients that accept it
+    app.config['EXPORT_GZIP'] = os.environ.get('EXPORT_GZIP', 'True').lower() == 'true'
+
+    # Background CSV exports: pool threads per process, most jobs queued or
+    # running per process, where the files go, how long they are kept and
+    # after how long an unfinished job counts as failed
+    app.config['EXPORT_WORKERS'] = int(os.environ.get('EXPORT_WORKERS', 2))
+    app.config['EXPORT_QUEUE_MAX'] = int(os.environ.get('EXPORT_QUEUE_MAX', 10))
+    app.config['EXPORT_DIR'] = os.environ.get('EXPORT_DIR', os.path.join(app.instance_path, 'exports'))
+    app.config['EXPORT_RETENTION_HOURS'] = float(os.environ.get('EXPORT_RETENTION_HOURS', 24))
+    app.config['EXPORT_TIMEOUT_MINUTES'] = float(os.environ.get('EXPORT_TIMEOUT_MINUTES', 60))
+
+    # Most incidents one bulk status request may change
+    app.config['BULK_STATUS_MAX'] = int(os.environ.get('BULK_STATUS_MAX', 1000))
+
+    # Most changes one /api/incidents/changes request may return
+    app.config['CHANGES_MAX_BATCH'] = int(os.environ.get('CHANGES_MAX_BATCH', 10000))
+
+    # Compiled templates cached on disk across processes and restarts (empty disables)
+    app.config['JINJA_CACHE_DIR'] = os.environ.get('JINJA_CACHE_DIR', os.path.join(app.instance_path, 'jinja'))
+
+    # Compile templates and load the reference caches in create_app (see app/warmup.py)
+    app.config['WARMUP_ON_START'] = os.environ.get('WARMUP_ON_START', 'False').lower() == 'true'
+
+    # Rendered incident rows/detail bodies kept per process (0 disables)
+    app.config['RENDER_CACHE_SIZE'] = int(os.environ.get('RENDER_CACHE_SIZE', 5000))
+
+    # SQLite storage profile, applied to every connection (see app/storage.py)
+    app.config['SQLITE_JOURNAL_MODE'] = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+    app.config['SQLITE_SYNCHRONOUS'] = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+    app.config['SQLITE_BUSY_TIMEOUT_MS'] = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    app.config['SQLITE_MMAP_SIZE'] = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+    app.config['SQLITE_CACHE_SIZE'] = int(os.environ.get('SQLITE_CACHE_SIZE', -32768))  # KiB when negative
+
+    # Engine for @read_only views; defaults to the main database opened query-only
+    app.config['READONLY_DATABASE_URL'] = os.environ.get('READONLY_DATABASE_URL')
+
+    # Opt-in per-request SQL instrumentation: Server-Timing header plus a log
+    # line for slow requests, slow statements and repeated (N+1) statements
+    app.config['SQL_PROFILING'] = os.environ.get('SQL_PROFILING', 'False').lower() == 'true'
+    app.config['SLOW_QUERY_MS'] = float(os.environ.get('SLOW_QUERY_MS', 100))
+    app.config['SLOW_REQUEST_MS'] = float(os.environ.get('SLOW_REQUEST_MS', 500))
+    app.config['N_PLUS_ONE_THRESHOLD'] = int(os.environ.get('N_PLUS_ONE_THRESHOLD', 5))
+
+    # Prometheus metrics at /metrics; workers share snapshots through METRICS_DIR
+    app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', 'True').lower() == 'true'
+    app.config['METRICS_DIR'] = os.environ.get('METRICS_DIR', os.path.join(app.instance_path, 'metrics'))
+    app.config['METRICS_FLUSH_SECONDS'] = float(os.environ.get('METRICS_FLUSH_SECONDS', 1))
+    if app.config['METRICS_ENABLED']:
+        from app.metrics import TimedQueuePool
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'poolclass': TimedQueuePool}
+
     # Initialize extensions with app
     db.init_app(app)
+
+    from app.storage import configure_storage
+    configure_storage(app, db)
+
+    if app.config['JINJA_CACHE_DIR']:
+        from jinja2 import FileSystemBytecodeCache
+        os.makedirs(app.config['JINJA_CACHE_DIR'], exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config['JINJA_CACHE_DIR'])
     
     # Add template filters
     @app.template_filter('nl2br')
@@ -73,17 +138,32 @@ def create_app():
             return "N/A"
     
     app.jinja_env.filters["human_duration"] = _human_duration
+
+    @app.template_filter("minutes")
+    def _minutes(value):
+        """Format a number of minutes like '2h 15m'."""
+        from app.models import format_minutes
+        return format_minutes(None if value is None else round(value))
     
     # Register blueprints
     from app.routes import main
     app.register_blueprint(main)
-    
+
+    # Per-request SQL/timing instrumentation (no-op unless SQL_PROFILING)
+    from app.profiling import init_profiling
+    init_profiling(app)
+
+    # Request/pool metrics and the /metrics endpoint (unless METRICS_ENABLED is off)
+    from app.metrics import init_metrics
+    init_metrics(app)
+
     # Register CLI commands
     from app.cli import register_cli
     register_cli(app)
     
-    # Create database tables
-    with app.app_context():
-        db.create_all()
+    # The schema is created and upgraded by `flask db-upgrade`, not on every start
+    if app.config['WARMUP_ON_START']:
+        from app.warmup import warmup
+        warmup(app)
     
     return app
@@ -0,0 +1,231 @@
+"""
+Hot/cold archival of long-resolved incidents.
+
+`flask archive --older-than 180d` moves resolved incidents whose repair
+ended, and that nobody has edited, more than that long ago into
+incident_archive, and their incident_parts rows into
+incident_parts_archive, one batch per transaction. The incident table and
+its indexes then hold open and recent work, so list pages, counts, facets
+and search stay that size however much history builds up.
+
+The list and the CSV export read the incident table alone unless a date
+filter reaches back to the newest archived creation time; then both tables
+are filtered the same way and merged in one UNION ALL. Archived incidents
+are read-only.
+
+Moving a row out of incident fires its delete triggers. Counters and the
+search index follow (they describe the hot table), while the rollup and
+change-log triggers skip rows already in the archive, and reliability
+recomputes over both tables, so trends, MTBF and the change feed keep
+archived history.
+"""
+
+import re
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import String, text, type_coerce
+from sqlalchemy.orm import lazyload
+from . import db
+from .export import EXPORT_BATCH_SIZE, export_columns
+from .filters import filtered_query
+from .models import AppState, ArchivedIncident, Incident, incident_archive, incident_parts, incident_parts_archive
+from .pagination import NumberedPage, cached_count, keyset_paginate_rows
+
+# WHEN clause for incident delete triggers that must ignore archival moves
+NOT_ARCHIVED = "NOT EXISTS (SELECT 1 FROM incident_archive WHERE id = old.id)"
+
+# Every incident, live or archived, as a FROM clause for the rollup and
+# reliability rebuilds. Only the columns they read, all present by migration
+# 0006: migrations 0007 and 0008 rebuild before later columns are added.
+REBUILD_COLUMNS = ", ".join((
+    "id", "customer_name", "site_name", "machine_model", "machine_serial", "fault_code",
+    "category", "severity", "status", "start_time", "end_time", "preventive_maintenance",
+    "created_at", "downtime_minutes",
+))
+ALL_INCIDENTS = (
+    f"(SELECT {REBUILD_COLUMNS} FROM incident "
+    f"UNION ALL SELECT {REBUILD_COLUMNS} FROM incident_archive)"
+)
+
+# Columns copied on the way out; the archive computes downtime_minutes itself
+_COPIED = [c.name for c in Incident.__table__.columns if c.computed is None]
+
+# app_state['archive_horizon']: Unix time of the newest archived created_at
+HORIZON_KEY = "archive_horizon"
+
+_AGE = re.compile(r"^(\d+)\s*([dw]?)$")
+
+
+def parse_age(value):
+    """Parse '180d', '26w' or a bare number of days into a timedelta."""
+    match = _AGE.match((value or "").strip().lower())
+    if not match:
+        raise ValueError(f"Not an age like 180d or 26w: {value!r}")
+    days = int(match.group(1)) * (7 if match.group(2) == "w" else 1)
+    return timedelta(days=days)
+
+
+def _candidates(cutoff, limit):
+    return (
+        db.select(Incident.id)
+        .where(
+            Incident.status == "Resolved",
+            db.func.coalesce(Incident.end_time, Incident.created_at) < cutoff,
+            db.func.coalesce(Incident.updated_at, Incident.created_at) < cutoff,
+        )
+        .order_by(Incident.id)
+        .limit(limit)
+    )
+
+
+def _move_batch(conn, cutoff, batch_size):
+    """Move one batch to the archive; return the ids moved."""
+    incident = Incident.__table__
+    # Selecting inside the INSERT makes the first statement a write, so
+    # nothing can change the chosen rows before they are deleted
+    ids = conn.execute(
+        incident_archive.insert()
+        .from_select(_COPIED, db.select(*(incident.c[name] for name in _COPIED))
+                     .where(incident.c.id.in_(_candidates(cutoff, batch_size))))
+        .returning(incident_archive.c.id)
+    ).scalars().all()
+    if not ids:
+        return ids
+    conn.execute(
+        incident_parts_archive.insert().from_select(
+            ["incident_id", "part_id", "quantity"],
+            db.select(incident_parts.c.incident_id, incident_parts.c.part_id, incident_parts.c.quantity)
+            .where(incident_parts.c.incident_id.in_(ids)),
+        )
+    )
+    # Incidents before their links: the parts change trigger only logs live incidents
+    conn.execute(incident.delete().where(incident.c.id.in_(ids)))
+    conn.execute(incident_parts.delete().where(incident_parts.c.incident_id.in_(ids)))
+    conn.execute(text(
+        f"INSERT INTO app_state(key, value) "
+        f"SELECT '{HORIZON_KEY}', CAST(strftime('%s', max(created_at)) AS INTEGER) FROM incident_archive WHERE true "
+        "ON CONFLICT(key) DO UPDATE SET value = excluded.value"
+    ))
+    return ids
+
+
+def archive_incidents(older_than, batch_size=1000, log=None):
+    """Archive incidents resolved and untouched for longer than ``older_than``.
+
+    Each batch is its own transaction, so writers are held up for one batch
+    at most. Returns the number of incidents moved.
+    """
+    from .reliability import refresh
+    cutoff = datetime.utcnow() - older_than
+    moved = 0
+    while True:
+        with db.engine.begin() as conn:
+            ids = _move_batch(conn, cutoff, batch_size)
+            # The deletes marked the serials dirty; their history is unchanged
+            refresh(conn)
+        if not ids:
+            return moved
+        moved += len(ids)
+        if log:
+            log(f"{moved:,} incident(s) archived")
+
+
+def archive_status(conn):
+    """Return (live incidents, archived incidents, newest archived created_at)."""
+    return tuple(conn.execute(text(
+        "SELECT (SELECT count(*) FROM incident), count(*), max(created_at) FROM incident_archive"
+    )).one())
+
+
+def archive_horizon():
+    """The newest archived creation time (naive UTC), or None if nothing is archived."""
+    value = db.session.execute(
+        db.select(AppState.value).where(AppState.key == HORIZON_KEY)
+    ).scalar()
+    return datetime.fromtimestamp(value, timezone.utc).replace(tzinfo=None) if value else None
+
+
+def includes_archive(filters):
+    """True when the filters' date range reaches back into archived history."""
+    date_from, date_to = filters.date_from_dt, filters.date_to_dt
+    if not (date_from or date_to):
+        return False
+    horizon = archive_horizon()
+    return horizon is not None and (date_from is None or date_from <= horizon)
+
+
+# ---------------------------------------------------------------------------
+# Lists and exports over both tables
+# ---------------------------------------------------------------------------
+
+def _merged(filters, columns):
+    """UNION ALL of the live and archived incidents matching ``filters``."""
+    hot, _rank = filtered_query(filters, db.select(*columns(Incident)))
+    cold, _rank = filtered_query(filters, db.select(*columns(ArchivedIncident)), model=ArchivedIncident)
+    return db.union_all(hot, cold).subquery("merged")
+
+
+def _ordering(merged, sort=""):
+    """ORDER BY for merged rows; search results come newest first (no rank in the archive)."""
+    if sort == "duration_desc":
+        return [merged.c.duration_minutes.desc().nulls_last(), merged.c.id.desc()]
+    if sort == "duration_asc":
+        return [merged.c.duration_minutes.asc().nulls_last(), merged.c.id.desc()]
+    return [merged.c.created_at.desc(), merged.c.id.desc()]
+
+
+def _key_columns(model):
+    return [
+        db.literal(model is ArchivedIncident).label("archived"),
+        model.id.label("id"),
+        # Raw text, as the cursors of the live list compare it
+        type_coerce(model.created_at, String).label("created_at"),
+        model.duration_minutes.label("duration_minutes"),
+    ]
+
+
+def _load(rows):
+    """The Incident/ArchivedIncident objects for merged key rows, in order."""
+    wanted = {True: [], False: []}
+    for r in rows:
+        wanted[bool(r.archived)].append(r.id)
+    found = {}
+    if wanted[False]:
+        found.update(((False, x.id), x) for x in db.session.scalars(
+            db.select(Incident).where(Incident.id.in_(wanted[False]))
+            .options(lazyload(Incident.parts), lazyload(Incident.usage))
+        ))
+    if wanted[True]:
+        found.update(((True, x.id), x) for x in db.session.scalars(
+            db.select(ArchivedIncident).where(ArchivedIncident.id.in_(wanted[True]))
+        ))
+    return [found[(bool(r.archived), r.id)] for r in rows]
+
+
+def merged_page(filters, per_page, sort="", page=None, after=None, before=None, count=True):
+    """A page of live and archived incidents matching ``filters``.
+
+    Cursor pages (``after``/``before``) when ``page`` is None and there is
+    no sort, like the live list; page numbers otherwise.
+    """
+    merged = _merged(filters, _key_columns)
+    if page is None and not sort:
+        pagination = keyset_paginate_rows(merged, per_page, after=after, before=before)
+    else:
+        page = page or 1
+        rows = db.session.execute(
+            db.select(merged).order_by(*_ordering(merged, sort))
+            .limit(per_page).offset((page - 1) * per_page)
+        ).all()
+        pagination = NumberedPage(rows, page, per_page)
+    if count:
+        pagination.total = cached_count(db.select(merged))
+    pagination.items = _load(pagination.items)
+    return pagination
+
+
+def merged_export_rows(filters, sort="", batch_size=EXPORT_BATCH_SIZE):
+    """Export rows of live and archived incidents matching ``filters``."""
+    merged = _merged(filters, export_columns)
+    return db.session.execute(
+        db.select(merged).order_by(*_ordering(merged, sort)).execution_options(yield_per=batch_size)
+    )
@@ -0,0 +1,76 @@
+"""
+Bulk status transitions.
+
+A list of incident ids, or every incident matching a list filter, moves to
+one status with a single set-based UPDATE ... RETURNING in one transaction.
+Rows already in that status are left alone (no row_version or updated_at
+bump), and the result says per id what happened.
+"""
+
+from . import db
+from .filters import IncidentFilters, filtered_query
+from .forms import STATUS_CHOICES
+from .models import Incident
+
+STATUSES = tuple(value for value, _label in STATUS_CHOICES)
+
+
+class BulkError(ValueError):
+    """A bulk request that cannot be applied as asked."""
+
+
+def _target_ids(ids, filters, limit):
+    if ids is not None:
+        try:
+            ids = sorted({int(i) for i in ids})
+        except (TypeError, ValueError):
+            raise BulkError("ids must be a list of integers")
+        if not ids:
+            raise BulkError("No incidents selected")
+        if len(ids) > limit:
+            raise BulkError(f"At most {limit} incidents per request")
+        return ids
+    if not isinstance(filters, dict):
+        raise BulkError("Send either ids or a filter")
+    values = {name: str(value) for name, value in filters.items() if value is not None}
+    query, _rank = filtered_query(IncidentFilters(**values), db.select(Incident.id))
+    # Empty, sort-only or unparseable filters would match every incident
+    if query.whereclause is None:
+        raise BulkError("The filter has no conditions; select incidents or set a filter")
+    found = db.session.execute(query.limit(limit + 1)).scalars().all()
+    if len(found) > limit:
+        raise BulkError(f"The filter matches more than {limit} incidents; narrow it down")
+    return sorted(found)
+
+
+def bulk_set_status(status, ids=None, filters=None, limit=1000):
+    """Move incidents to ``status``; return {"updated", "unchanged", "not_found"} id lists.
+
+    ``ids`` is a list of incident ids; otherwise ``filters`` is a dict of
+    list filter values (as in the /incidents query string). Raises
+    BulkError for a bad request; nothing is written then.
+    """
+    if status not in STATUSES:
+        raise BulkError(f"Unknown status {status!r}")
+    try:
+        ids = _target_ids(ids, filters, limit)
+        # The UPDATE takes the write lock first, so the existence check
+        # below sees the same rows it did
+        updated = db.session.execute(
+            db.update(Incident)
+            .where(Incident.id.in_(ids), Incident.status.is_distinct_from(status))
+            .values(status=status)
+            .returning(Incident.id)
+            .execution_options(synchronize_session=False)
+        ).scalars().all()
+        existing = db.session.execute(db.select(Incident.id).where(Incident.id.in_(ids))).scalars().all()
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    updated, existing = set(updated), set(existing)
+    return {
+        "updated": sorted(updated),
+        "unchanged": sorted(existing - updated),
+        "not_found": sorted(set(ids) - existing),
+    }
@@ -0,0 +1,150 @@
+"""
+Incremental change feed for downstream sync.
+
+incident_change holds one row per incident with the sequence number of its
+latest change. Triggers on incident (insert, update, delete) and on
+incident_parts (parts relinked) REPLACE that row, which deletes it and
+inserts it again with the next AUTOINCREMENT seq, so the table holds one
+row per incident and seqs only go up. SQLite runs one write transaction at
+a time, so seqs also become visible in order and a client that has seen
+everything up to N only ever needs the rows after N: a range scan of the
+primary key whose cost follows the number of changes, not the table size.
+Moving an incident to the archive is not a change; its line comes from
+incident_archive if it is read after the move.
+"""
+
+import json
+from datetime import date, datetime
+from sqlalchemy import text
+from . import db
+from .archive import NOT_ARCHIVED
+from .models import ArchivedIncident, Incident, IncidentChange, Part, incident_parts, incident_parts_archive
+
+# Changes read per query while a batch streams out
+CHUNK_SIZE = 500
+
+CHANGE_DDL = [
+    """
+    CREATE TRIGGER IF NOT EXISTS incident_change_ai AFTER INSERT ON incident BEGIN
+        REPLACE INTO incident_change(incident_id, deleted) VALUES (new.id, 0);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS incident_change_au AFTER UPDATE ON incident BEGIN
+        REPLACE INTO incident_change(incident_id, deleted) VALUES (new.id, 0);
+    END
+    """,
+    # Archived incidents are not deleted; they keep their last seq
+    f"""
+    CREATE TRIGGER IF NOT EXISTS incident_change_ad AFTER DELETE ON incident
+    WHEN {NOT_ARCHIVED} BEGIN
+        REPLACE INTO incident_change(incident_id, deleted) VALUES (old.id, 1);
+    END
+    """,
+] + [
+    # Only while the incident exists: deleting one cascades to its links
+    f"""
+    CREATE TRIGGER IF NOT EXISTS incident_parts_change_{event} AFTER {event.upper()} ON incident_parts BEGIN
+        REPLACE INTO incident_change(incident_id, deleted)
+        SELECT id, 0 FROM incident WHERE id = {row}.incident_id;
+    END
+    """
+    for event, row in (("insert", "new"), ("update", "new"), ("delete", "old"))
+]
+
+# Incident columns in every change line
+COLUMNS = list(Incident.__table__.columns)
+NAMES = [c.name for c in COLUMNS]
+ARCHIVED_COLUMNS = [ArchivedIncident.__table__.c[name] for name in NAMES]
+
+
+def install_change_triggers(conn):
+    for ddl in CHANGE_DDL:
+        conn.execute(text(ddl))
+
+
+def rebuild_changes(conn):
+    """Log incidents missing from incident_change and tombstone vanished ones.
+
+    For loads that ran with the triggers suspended; incidents already
+    logged keep their seq.
+    """
+    conn.execute(text(
+        "REPLACE INTO incident_change(incident_id, deleted) "
+        "SELECT id, 0 FROM incident WHERE NOT EXISTS ("
+        "  SELECT 1 FROM incident_change c WHERE c.incident_id = incident.id AND NOT c.deleted"
+        ") ORDER BY coalesce(updated_at, created_at), id"
+    ))
+    conn.execute(text(
+        "REPLACE INTO incident_change(incident_id, deleted) "
+        "SELECT incident_id, 1 FROM incident_change c WHERE NOT c.deleted "
+        "AND NOT EXISTS (SELECT 1 FROM incident WHERE id = c.incident_id) "
+        "AND NOT EXISTS (SELECT 1 FROM incident_archive WHERE id = c.incident_id) ORDER BY seq"
+    ))
+
+
+def _json_value(value):
+    return value.isoformat() if isinstance(value, (date, datetime)) else value
+
+
+def _parts(ids, links=incident_parts):
+    """Return {incident id: [{"id", "name", "quantity"}]} for ``ids``."""
+    out = {}
+    rows = db.session.execute(
+        db.select(links.c.incident_id, Part.id, Part.name, links.c.quantity)
+        .join(Part, Part.id == links.c.part_id)
+        .where(links.c.incident_id.in_(ids))
+        .order_by(links.c.incident_id, Part.name)
+    )
+    for incident_id, part_id, name, quantity in rows:
+        out.setdefault(incident_id, []).append({"id": part_id, "name": name, "quantity": quantity})
+    return out
+
+
+def change_feed(since=0, limit=1000):
+    """Return (next token, more, lines) for up to ``limit`` changes after ``since``.
+
+    ``lines`` yields one NDJSON line per changed incident in seq order,
+    ``{"seq", "id", "deleted", "incident"}`` (no "incident" for deleted
+    ones; each line's seq is a valid resume token), then a last line
+    ``{"next", "more"}``. An incident changed again while the batch streams
+    moves past its end and comes in the next batch instead.
+    """
+    seqs = db.session.execute(
+        db.select(IncidentChange.seq).where(IncidentChange.seq > since)
+        .order_by(IncidentChange.seq).limit(limit + 1)
+    ).scalars().all()
+    more = len(seqs) > limit
+    until = seqs[:limit][-1] if seqs else since
+    return str(until), more, _lines(since, until, more)
+
+
+def _lines(since, until, more):
+    while since < until:
+        rows = db.session.execute(
+            db.select(IncidentChange.seq, IncidentChange.incident_id, IncidentChange.deleted, *COLUMNS)
+            .outerjoin(Incident, Incident.id == IncidentChange.incident_id)
+            .where(IncidentChange.seq > since, IncidentChange.seq <= until)
+            .order_by(IncidentChange.seq)
+            .limit(CHUNK_SIZE)
+        ).all()
+        if not rows:
+            break
+        parts = _parts([r.incident_id for r in rows if r.id is not None])
+        # Not in the incident table any more: archived, or deleted since the log row was read
+        gone = [r.incident_id for r in rows if r.id is None and not r.deleted]
+        archived = {}
+        if gone:
+            archived = {a.id: a for a in db.session.execute(
+                db.select(*ARCHIVED_COLUMNS).where(ArchivedIncident.id.in_(gone))
+            )}
+            parts.update(_parts(list(archived), incident_parts_archive))
+        for r in rows:
+            values = r[3:] if r.id is not None else archived.get(r.incident_id)
+            line = {"seq": str(r.seq), "id": r.incident_id, "deleted": bool(r.deleted) or values is None}
+            if not line["deleted"]:
+                line["incident"] = dict(zip(NAMES, map(_json_value, values)))
+                line["incident"]["parts"] = parts.get(r.incident_id, [])
+            yield json.dumps(line) + "\n"
+        since = rows[-1].seq
+    yield json.dumps({"next": str(until), "more": more}) + "\n"
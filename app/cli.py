@@ -1,13 +1,122 @@
-from . import db
-from .models import Incident, Part
+import json
+import click
+from . import db, migrations
+from .models import ExportJob, Incident, Part
+from .counters import rebuild_counters
+from .rollup import rebuild_rollups, rollup_status
+from .reference import load_reference, load_default_reference
+from .importer import import_incidents
+from .export_jobs import cleanup_exports
+from .archive import archive_incidents, archive_status, parse_age
+from .synthetic import seed_synthetic
+from .warmup import warmup
 from datetime import datetime, timedelta
 
 def register_cli(app):
     @app.cli.command("init-db")
     def init_db():
-        db.drop_all(); db.create_all()
+        migrations.reset()
         print("DB reset.")
 
+    @app.cli.command("db-upgrade")
+    def db_upgrade():
+        """Create missing tables and apply pending migrations."""
+        applied = migrations.upgrade(log=print)
+        print(f"Applied {len(applied)} migration(s)." if applied else "Database is up to date.")
+
+    @app.cli.command("db-status")
+    def db_status():
+        """List migrations and whether each has been applied."""
+        done = migrations.applied_versions()
+        for m in migrations.MIGRATIONS:
+            applied_at = done.get(m.version)
+            mark = f"applied {applied_at}" if applied_at else "pending"
+            print(f"{m.version:04d}  {m.description:<60} {mark}")
+
+    @app.cli.command("warmup")
+    def warmup_cmd():
+        """Compile templates into the bytecode cache and load the reference caches."""
+        result = warmup(app)
+        cache = app.config["JINJA_CACHE_DIR"] or "no bytecode cache"
+        print(f"Compiled {result['templates']} template(s) ({cache}) in {result['seconds'] * 1000:.0f} ms.")
+
+    @app.cli.command("rebuild-counters")
+    def rebuild_counters_cmd():
+        """Recompute the dashboard counters from the incident table."""
+        with db.engine.begin() as conn:
+            rebuild_counters(conn)
+        print("Counters rebuilt.")
+
+    @app.cli.command("rollup")
+    @click.option("--rebuild", is_flag=True, help="Recompute the rollups from the incident table.")
+    def rollup_cmd(rebuild):
+        """Show the daily trend rollups, or rebuild them (e.g. after a backfill)."""
+        with db.engine.begin() as conn:
+            if rebuild:
+                rebuild_rollups(conn)
+                print("Rollups rebuilt.")
+            for table, (rows, first, last, incidents) in rollup_status(conn).items():
+                print(f"{table:<22} {rows:>9,} rows  {first or '-'} .. {last or '-'}  {incidents:,} incidents")
+
+    @app.cli.command("exports")
+    @click.option("--cleanup", is_flag=True, help="Delete jobs and files past EXPORT_RETENTION_HOURS first.")
+    def exports_cmd(cleanup):
+        """List background export jobs, newest first."""
+        if cleanup:
+            print(f"Deleted {cleanup_exports()} export job(s).")
+        for job in db.session.scalars(db.select(ExportJob).order_by(ExportJob.created_at.desc())):
+            print(f"{job.id}  {job.status:<8} {job.rows:>9,} rows  {job.created_at:%Y-%m-%d %H:%M}  {job.error or ''}")
+
+    @app.cli.command("archive")
+    @click.option("--older-than", default="180d", show_default=True,
+                  help="Archive incidents resolved and untouched for this long (e.g. 180d, 26w).")
+    @click.option("--batch-size", default=1000, show_default=True, help="Incidents moved per transaction.")
+    @click.option("--status", "status_only", is_flag=True, help="Only show how many incidents are archived.")
+    def archive_cmd(older_than, batch_size, status_only):
+        """Move long-resolved incidents and their parts to the archive tables."""
+        if not status_only:
+            try:
+                age = parse_age(older_than)
+            except ValueError as e:
+                raise click.BadParameter(str(e), param_hint="--older-than")
+            moved = archive_incidents(age, batch_size=batch_size, log=print)
+            print(f"Archived {moved:,} incident(s).")
+        with db.engine.connect() as conn:
+            live, archived, newest = archive_status(conn)
+        print(f"{live:,} live incident(s), {archived:,} archived (newest created {newest or '-'}).")
+
+    @app.cli.command("load-reference")
+    @click.argument("path", required=False)
+    def load_reference_cmd(path):
+        """Replace the customer/site/machine/fault tables.
+
+        PATH is a JSON file shaped like /api/reference; without it the
+        defaults from app/reference_data.py are loaded.
+        """
+        with db.engine.begin() as conn:
+            if path:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                load_reference(conn, data["customer_map"], data["fault_map"], data["site_serial_map"])
+            else:
+                load_default_reference(conn)
+        print("Reference data loaded.")
+
+    @app.cli.command("import-incidents")
+    @click.argument("path", type=click.Path(exists=True, dir_okay=False))
+    @click.option("--format", "fmt", type=click.Choice(["csv", "jsonl"]), help="Defaults from the file extension.")
+    @click.option("--batch-size", default=1000, show_default=True, help="Rows per INSERT/commit.")
+    @click.option("--checkpoint", help="Name of the progress record; defaults to PATH.")
+    @click.option("--resume", is_flag=True, help="Skip the rows recorded in the checkpoint.")
+    @click.option("--rejects", type=click.Path(dir_okay=False), help="Write invalid rows here as JSON Lines.")
+    def import_incidents_cmd(path, fmt, batch_size, checkpoint, resume, rejects):
+        """Bulk-import incidents from a CSV or JSON Lines file."""
+        inserted, rejected = import_incidents(
+            path, fmt=fmt, batch_size=batch_size, checkpoint=checkpoint,
+            resume=resume, rejects=rejects,
+        )
+        print(f"Imported {inserted:,} incident(s); {rejected:,} row(s) rejected.")
+
     @app.cli.command("seed")
     def seed():
         # Clear existing incidents
@@ -121,15 +230,32 @@ def register_cli(app):
         if not os.path.exists(path):
             print("No parts file found:", path)
             return
-        added = 0
+        # One query for the existing names instead of one per line
+        known = {name.lower() for (name,) in db.session.execute(db.select(Part.name))}
+        new = []
         with open(path, "r", encoding="utf-8") as f:
             for raw in f:
                 name = raw.strip()
-                if not name:
-                    continue
-                exists = Part.query.filter(db.func.lower(Part.name) == name.lower()).first()
-                if not exists:
-                    db.session.add(Part(name=name))
-                    added += 1
+                if name and name.lower() not in known:
+                    known.add(name.lower())
+                    new.append({"name": name, "created_at": datetime.utcnow()})
+        if new:
+            db.session.execute(db.insert(Part), new)
         db.session.commit()
-        print(f"Seeded {added} parts.")
+        print(f"Seeded {len(new)} parts.")
+
+    @app.cli.command("seed-synthetic")
+    @click.option("--incidents", default=10000, show_default=True, help="Number of incidents to generate.")
+    @click.option("--machines", default=500, show_default=True, help="Number of machines in the fleet.")
+    @click.option("--customers", type=int, help="Number of customers (default: one per 50 machines, max 15).")
+    @click.option("--days", default=730, show_default=True, help="Spread incidents over this many past days.")
+    @click.option("--seed", default=42, show_default=True, help="Random seed; same seed, same data.")
+    @click.option("--batch-size", default=20000, show_default=True, help="Rows per INSERT.")
+    def seed_synthetic_cmd(incidents, machines, customers, days, seed, batch_size):
+        """Generate a reproducible synthetic fleet and failure history.
+
+        The fleet is merged into the reference tables. Incident triggers are
+        suspended during the load, so run it against an idle database.
+        """
+        seed_synthetic(incidents, machines, customers=customers, days=days,
+                       seed=seed, batch_size=batch_size)
@@ -0,0 +1,66 @@
+"""
+Conditional GET for incident pages and the CSV export.
+
+Validators come from change tracking that costs a primary-key read or two:
+the incident's row_version/updated_at for the detail page, and the
+incident data version and last-change time in app_state for the list and
+export. A request whose If-None-Match or If-Modified-Since still matches
+gets a 304 before any template is rendered or CSV row is read.
+
+Durations of open incidents change with the clock, so a response that can
+show one is treated as modified every minute: the ETag includes the
+current minute, and Last-Modified is at least the start of it.
+"""
+
+import hashlib
+from datetime import datetime, timezone
+from flask import request
+from werkzeug.wrappers import Response
+
+CACHE_CONTROL = "private, no-cache"
+
+
+def _utc(value):
+    if value is None:
+        return None
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+def current_minute():
+    return datetime.now(timezone.utc).replace(second=0, microsecond=0)
+
+
+def validators(*parts, last_modified=None, live=False):
+    """Return (etag, last_modified) for a response built from ``parts``.
+
+    ``parts`` are whatever the response depends on (versions, filters);
+    ``live`` marks responses that can show an open incident's duration.
+    """
+    last_modified = _utc(last_modified)
+    if live:
+        minute = current_minute()
+        parts += (minute.isoformat(),)
+        last_modified = max(last_modified, minute) if last_modified else minute
+    etag = hashlib.sha1(repr(parts).encode()).hexdigest()[:20]
+    return etag, last_modified
+
+
+def not_modified(etag, last_modified=None):
+    """Return a 304 response if the request's validators still match, else None."""
+    response = Response(status=200)
+    apply_validators(response, etag, last_modified)
+    response.make_conditional(request)
+    return response if response.status_code == 304 else None
+
+
+def apply_validators(response, etag, last_modified=None):
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.headers["Cache-Control"] = CACHE_CONTROL
+    return response
+
+
+def request_args():
+    """The query string as a sorted tuple, for ETags of filtered responses."""
+    return tuple(sorted(request.args.items(multi=True)))
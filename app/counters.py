@@ -0,0 +1,157 @@
+"""
+Incrementally maintained incident counters for the dashboard.
+
+incident_counter holds one row per (dimension, value) with the number of
+incidents that have that value, plus a ('total', '') row. Triggers adjust
+the rows on every insert, update and delete of an incident, inside the same
+transaction as the write, so reading the dashboard numbers is a handful of
+primary-key lookups however large the incident table grows. Archived
+incidents stay counted: moving one to the archive skips the delete trigger.
+"""
+
+from sqlalchemy import text
+from . import db
+from .archive import NOT_ARCHIVED
+from .models import AppState, IncidentCounter
+
+# counter dimension -> incident column
+DIMENSIONS = {
+    "status": "status",
+    "severity": "severity",
+    "category": "category",
+    "customer": "customer_name",
+}
+
+_UPSERT = "ON CONFLICT(dimension, value) DO UPDATE SET count = count + excluded.count"
+
+
+def _values(row, delta):
+    """VALUES tuples for every dimension of ``row`` ('new' or 'old')."""
+    return ", ".join(
+        f"('{dim}', coalesce({row}.{col}, ''), {delta})" for dim, col in DIMENSIONS.items()
+    )
+
+
+COUNTER_DDL = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS incident_counter_ai AFTER INSERT ON incident BEGIN
+        INSERT INTO incident_counter(dimension, value, count)
+        VALUES ('total', '', 1), {_values('new', 1)}
+        {_UPSERT};
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS incident_counter_ad AFTER DELETE ON incident
+    WHEN {NOT_ARCHIVED} BEGIN
+        INSERT INTO incident_counter(dimension, value, count)
+        VALUES ('total', '', -1), {_values('old', -1)}
+        {_UPSERT};
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS incident_counter_au
+    AFTER UPDATE OF {", ".join(DIMENSIONS.values())} ON incident BEGIN
+        INSERT INTO incident_counter(dimension, value, count)
+        VALUES {_values('old', -1)}, {_values('new', 1)}
+        {_UPSERT};
+    END
+    """,
+]
+
+
+# app_state['incident_version'] moves on every incident write; caches of
+# data derived from incidents (facets, reports) are keyed on it.
+VERSION_KEY = "incident_version"
+
+VERSION_DDL = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS incident_version_{event} AFTER {event.upper()} ON incident BEGIN
+        INSERT INTO app_state(key, value) VALUES ('{VERSION_KEY}', 1)
+        ON CONFLICT(key) DO UPDATE SET value = value + 1;
+    END
+    """
+    for event in ("insert", "update", "delete")
+]
+
+
+# app_state['incident_changed_at']: Unix time of the last incident write, for
+# Last-Modified on responses built from many incidents (deletes included).
+CHANGED_KEY = "incident_changed_at"
+
+CHANGED_DDL = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS incident_changed_{event} AFTER {event.upper()} ON incident BEGIN
+        INSERT INTO app_state(key, value) VALUES ('{CHANGED_KEY}', CAST(strftime('%s', 'now') AS INTEGER))
+        ON CONFLICT(key) DO UPDATE SET value = excluded.value;
+    END
+    """
+    for event in ("insert", "update", "delete")
+]
+
+
+def install_counter_triggers(conn):
+    for ddl in COUNTER_DDL:
+        conn.execute(text(ddl))
+
+
+def install_version_triggers(conn):
+    for ddl in VERSION_DDL:
+        conn.execute(text(ddl))
+
+
+def install_changed_triggers(conn):
+    for ddl in CHANGED_DDL:
+        conn.execute(text(ddl))
+
+
+def incident_data_version():
+    """Return the current incident data version (0 if nothing written yet)."""
+    return db.session.execute(
+        db.select(AppState.value).where(AppState.key == VERSION_KEY)
+    ).scalar() or 0
+
+
+def incident_state():
+    """Return (data version, last change as Unix time) in one read."""
+    values = dict(db.session.execute(
+        db.select(AppState.key, AppState.value).where(AppState.key.in_((VERSION_KEY, CHANGED_KEY)))
+    ).all())
+    return values.get(VERSION_KEY, 0), values.get(CHANGED_KEY, 0)
+
+
+def rebuild_counters(conn):
+    """Recompute every counter row from the incidents, archived ones included."""
+    columns = ", ".join(DIMENSIONS.values())
+    incidents = f"(SELECT {columns} FROM incident UNION ALL SELECT {columns} FROM incident_archive)"
+    conn.execute(text("DELETE FROM incident_counter"))
+    conn.execute(text(
+        "INSERT INTO incident_counter(dimension, value, count) "
+        f"SELECT 'total', '', count(*) FROM {incidents}"
+    ))
+    for dim, col in DIMENSIONS.items():
+        conn.execute(text(
+            f"INSERT INTO incident_counter(dimension, value, count) "
+            f"SELECT '{dim}', coalesce({col}, ''), count(*) FROM {incidents} GROUP BY 1, 2"
+        ))
+
+
+def counter_values(*dimensions):
+    """Return {dimension: {value: count}} for the given dimensions."""
+    rows = db.session.execute(
+        db.select(IncidentCounter.dimension, IncidentCounter.value, IncidentCounter.count)
+        .where(IncidentCounter.dimension.in_(dimensions))
+    )
+    out = {d: {} for d in dimensions}
+    for dim, value, count in rows:
+        out[dim][value] = count
+    return out
+
+
+def dashboard_counts():
+    """Return (total, open, high) for the dashboard cards in one read."""
+    counts = counter_values("total", "status", "severity")
+    return (
+        counts["total"].get("", 0),
+        counts["status"].get("Open", 0),
+        counts["severity"].get("High", 0),
+    )
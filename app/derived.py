@@ -0,0 +1,60 @@
+"""
+Data derived from incident rows by triggers: the search index, counters,
+daily rollups, reliability projections, the change log and version numbers.
+
+Triggers keep it current one row at a time. Bulk loaders that write
+hundreds of thousands of rows into an idle database can instead suspend
+the triggers, load, and rebuild everything in a few set-based statements.
+"""
+
+from contextlib import contextmanager
+from sqlalchemy import text
+
+# Tables whose triggers maintain derived data
+TRIGGER_TABLES = ("incident", "incident_parts")
+
+
+@contextmanager
+def triggers_suspended(conn, tables=TRIGGER_TABLES):
+    """Drop the triggers on ``tables`` for the block, then recreate them.
+
+    Only for loads into a database nothing else is writing to: changes made
+    by other connections meanwhile are not reflected until
+    rebuild_derived() runs.
+    """
+    saved = conn.execute(
+        text(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name IN (%s)"
+            % ", ".join(f"'{t}'" for t in tables)
+        )
+    ).all()
+    for name, _sql in saved:
+        conn.execute(text(f'DROP TRIGGER IF EXISTS "{name}"'))
+    try:
+        yield
+    finally:
+        for _name, sql in saved:
+            conn.execute(text(sql))
+
+
+def rebuild_derived(conn):
+    """Recompute everything the incident triggers maintain."""
+    from .changes import rebuild_changes
+    from .counters import CHANGED_KEY, VERSION_KEY, rebuild_counters
+    from .reliability import rebuild_reliability
+    from .rollup import rebuild_rollups
+    from .search import rebuild_search_index
+
+    rebuild_search_index(conn)
+    rebuild_counters(conn)
+    rebuild_reliability(conn)
+    rebuild_rollups(conn)
+    rebuild_changes(conn)
+    conn.execute(text(
+        f"INSERT INTO app_state(key, value) VALUES ('{VERSION_KEY}', 1) "
+        "ON CONFLICT(key) DO UPDATE SET value = value + 1"
+    ))
+    conn.execute(text(
+        f"INSERT INTO app_state(key, value) VALUES ('{CHANGED_KEY}', CAST(strftime('%s', 'now') AS INTEGER)) "
+        "ON CONFLICT(key) DO UPDATE SET value = excluded.value"
+    ))
@@ -0,0 +1,71 @@
+"""
+CSV export of incidents.
+
+Rows are read with yield_per() over a projected column query (no ORM
+objects, no relationship loads) and written out in chunks, so an export of
+the full history streams with flat memory and the first bytes go out as soon
+as the first batch is read.
+"""
+
+import csv
+import io
+import zlib
+from .models import Incident, format_minutes
+
+EXPORT_HEADER = ["ID", "Title", "Customer", "Severity", "Status", "Created", "Duration", "Parts Used"]
+
+# Only the columns the CSV needs
+EXPORT_FIELDS = ("id", "title", "customer_name", "severity", "status", "created_at", "duration_minutes", "parts_used")
+
+# Rows fetched from the cursor per round trip, and rows per emitted chunk
+EXPORT_BATCH_SIZE = 1000
+
+
+def _fmt_dt(dt):
+    """Return 'YYYY-MM-DD HH:MM' or empty string if None."""
+    return dt.strftime("%Y-%m-%d %H:%M") if dt else ""
+
+
+def export_columns(model=Incident):
+    """The export columns of ``model`` (Incident or ArchivedIncident)."""
+    return [getattr(model, name).label(name) for name in EXPORT_FIELDS]
+
+
+def export_rows(query, batch_size=EXPORT_BATCH_SIZE):
+    """Project a filtered Incident query down to the export columns."""
+    return query.with_entities(*export_columns()).yield_per(batch_size)
+
+
+def csv_chunks(rows, batch_size=EXPORT_BATCH_SIZE):
+    """Yield the CSV (header first) as text chunks of ``batch_size`` rows."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(EXPORT_HEADER)
+    for n, r in enumerate(rows, 1):
+        writer.writerow([
+            r.id,
+            r.title or "",
+            r.customer_name or "",
+            r.severity or "",
+            r.status or "",
+            _fmt_dt(r.created_at),
+            format_minutes(r.duration_minutes),
+            r.parts_used or "",
+        ])
+        if n % batch_size == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate(0)
+    tail = buf.getvalue()
+    if tail:
+        yield tail
+
+
+def gzip_chunks(chunks, level=6):
+    """Gzip-compress a stream of text chunks on the fly."""
+    z = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = z.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield z.flush()
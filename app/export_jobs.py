@@ -0,0 +1,184 @@
+"""
+Background CSV exports.
+
+POST /api/exports queues an export of the list filters it is given. A
+bounded per-process thread pool runs it with the same query and CSV writer
+as the streamed export and writes instance/exports/<job id>.csv, so the web
+worker that took the request is free again at once. Job state lives in the
+export_job table, so whichever worker gets the status poll or the download
+can answer it. Jobs and files older than EXPORT_RETENTION_HOURS are removed
+whenever a new job is queued, or by `flask exports --cleanup`; that also
+fails jobs still unfinished after EXPORT_TIMEOUT_MINUTES, such as those of
+a worker that died mid-export.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask import current_app, g
+from . import db
+from .archive import includes_archive, merged_export_rows
+from .export import csv_chunks, export_rows
+from .filters import FILTER_NAMES, IncidentFilters, filtered_query, ordering
+from .models import ExportJob
+
+log = logging.getLogger(__name__)
+
+# Rows between progress updates of a running job
+PROGRESS_EVERY = 10000
+
+
+class ExportBusy(Exception):
+    """This process already has EXPORT_QUEUE_MAX exports queued or running."""
+
+
+_pool = None
+_pool_pid = None
+_pending = 0
+_lock = threading.Lock()
+
+
+def export_path(job_id, app=None):
+    return os.path.join((app or current_app).config["EXPORT_DIR"], f"{job_id}.csv")
+
+
+def _check_fork():
+    # A pool inherited over fork (gunicorn --preload) has no threads left
+    global _pool, _pool_pid, _pending
+    if _pool_pid != os.getpid():
+        _pool, _pool_pid, _pending = None, os.getpid(), 0
+
+
+def _executor(app):
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=app.config["EXPORT_WORKERS"], thread_name_prefix="export")
+    return _pool
+
+
+def _update(job_id, **values):
+    with db.engine.begin() as conn:
+        conn.execute(db.update(ExportJob).where(ExportJob.id == job_id).values(**values))
+
+
+def submit_export(args):
+    """Queue an export of the incidents matching ``args`` (list filters and sort).
+
+    Returns the new job id. Raises ExportBusy when the pool's queue is full.
+    """
+    global _pending
+    app = current_app._get_current_object()
+    params = {name: args[name] for name in FILTER_NAMES + ("sort",) if args.get(name)}
+    with _lock:
+        _check_fork()
+        if _pending >= app.config["EXPORT_QUEUE_MAX"]:
+            raise ExportBusy("Too many exports in progress; try again shortly")
+        _pending += 1
+    try:
+        os.makedirs(app.config["EXPORT_DIR"], exist_ok=True)
+        cleanup_exports()
+        job_id = uuid.uuid4().hex
+        db.session.add(ExportJob(id=job_id, params=json.dumps(params, sort_keys=True)))
+        db.session.commit()
+        with _lock:
+            _executor(app).submit(_run, app, job_id)
+    except Exception:
+        with _lock:
+            _pending -= 1
+        raise
+    return job_id
+
+
+def _run(app, job_id):
+    global _pending
+    try:
+        with app.app_context():
+            _export(job_id)
+    finally:
+        with _lock:
+            _pending -= 1
+
+
+def _export(job_id):
+    path = export_path(job_id)
+    partial = path + ".part"
+    written = 0
+
+    def counted(rows):
+        nonlocal written
+        for row in rows:
+            written += 1
+            if written % PROGRESS_EVERY == 0:
+                _update(job_id, rows=written)
+            yield row
+
+    try:
+        job = db.session.get(ExportJob, job_id)
+        if job is None:
+            return  # cleaned up before it got to run
+        params = json.loads(job.params)
+        _update(job_id, status="running", started_at=datetime.utcnow())
+        sort = params.pop("sort", "")
+
+        # Read the incidents like a @read_only view
+        g.read_only = True
+        filters = IncidentFilters(**params)
+        if includes_archive(filters):
+            rows = counted(merged_export_rows(filters, sort))
+        else:
+            query, rank = filtered_query(filters)
+            rows = counted(export_rows(query.order_by(*ordering(rank, sort))))
+        with open(partial, "w", newline="", encoding="utf-8") as f:
+            for chunk in csv_chunks(rows):
+                f.write(chunk)
+        os.replace(partial, path)
+        _update(job_id, status="done", rows=written, finished_at=datetime.utcnow())
+    except Exception as e:
+        log.exception("Export %s failed", job_id)
+        if os.path.exists(partial):
+            os.remove(partial)
+        _update(job_id, status="failed", rows=written, error=str(e)[:500], finished_at=datetime.utcnow())
+
+
+def cleanup_exports(hours=None):
+    """Delete jobs created more than ``hours`` ago and any export file as old.
+
+    ``hours`` defaults to EXPORT_RETENTION_HOURS. Jobs queued or running
+    for longer than EXPORT_TIMEOUT_MINUTES are marked failed. Returns the
+    number of jobs deleted.
+    """
+    config = current_app.config
+    hours = config["EXPORT_RETENTION_HOURS"] if hours is None else hours
+    now = datetime.utcnow()
+    with db.engine.begin() as conn:
+        # A job whose worker died would otherwise stay queued or running
+        conn.execute(
+            db.update(ExportJob)
+            .where(
+                ExportJob.status.in_(("queued", "running")),
+                db.func.coalesce(ExportJob.started_at, ExportJob.created_at)
+                < now - timedelta(minutes=config["EXPORT_TIMEOUT_MINUTES"]),
+            )
+            .values(status="failed", error="Did not finish in time; the worker may have stopped", finished_at=now)
+        )
+        deleted = conn.execute(
+            db.delete(ExportJob)
+            .where(ExportJob.created_at < now - timedelta(hours=hours))
+            .returning(ExportJob.id)
+        ).scalars().all()
+
+    # Files by age rather than by job, so leftovers of a killed worker go too
+    cutoff = time.time() - hours * 3600
+    if os.path.isdir(config["EXPORT_DIR"]):
+        for entry in os.scandir(config["EXPORT_DIR"]):
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass  # another worker got there first
+    return len(deleted)
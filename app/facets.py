@@ -0,0 +1,90 @@
+"""
+Facet values and counts for the incident filter form.
+
+For each facet (customer, severity, status, category) this returns the
+distinct values with the number of incidents having them, under every
+*other* active filter, so a selected value never hides its alternatives.
+
+Results are cached per process, keyed on app_state['incident_version']
+(moved by triggers on every incident write) and the filters, plus the
+current minute under a duration filter. A warm cache costs one primary-key
+read per request; when a facet has no other filters applied, and nothing
+has been archived, its counts come straight from the incident_counter table
+instead of a GROUP BY over incidents.
+"""
+
+import threading
+from collections import OrderedDict
+from . import db
+from .archive import archive_horizon
+from .conditional import current_minute
+from .counters import counter_values, incident_data_version
+from .filters import EQUALITY_FILTERS, filtered_query
+
+FACETS = tuple(EQUALITY_FILTERS)   # customer, severity, status, category
+
+_CACHE_SIZE = 512
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+def _compute(facet, filters):
+    """[(value, count), ...] for ``facet`` under ``filters``, largest first."""
+    column = EQUALITY_FILTERS[facet]
+    others = filters.without(facet)
+    # The counters include archived incidents, which the unfiltered list doesn't show
+    if not others and archive_horizon() is None:
+        counts = counter_values(facet)[facet]
+        rows = [(v, n) for v, n in counts.items() if v and n > 0]
+    else:
+        query, _rank = filtered_query(others)
+        rows = (
+            query.with_entities(column, db.func.count())
+            .filter(column.isnot(None), column != "")
+            .group_by(column)
+            .order_by(None)
+            .all()
+        )
+    return sorted(rows, key=lambda r: (-r[1], r[0]))
+
+
+def facet_counts(filters):
+    """Return {facet: [(value, count), ...]} for the current filters."""
+    version = incident_data_version()
+    # Open incidents cross a duration bound as the clock moves, with no write
+    minute = current_minute() if filters.duration else None
+    out = {}
+    for facet in FACETS:
+        key = (version, minute, facet, filters.without(facet).key())
+        with _lock:
+            hit = _cache.get(key)
+            if hit is not None:
+                _cache.move_to_end(key)
+        if hit is None:
+            hit = _compute(facet, filters)
+            with _lock:
+                _cache[key] = hit
+                while len(_cache) > _CACHE_SIZE:
+                    _cache.popitem(last=False)
+        out[facet] = hit
+    return out
+
+
+def facet_choices(counts, blank_label, selected="", static=None):
+    """SelectField choices like ('VLTX', 'VLTX (1,204)') from facet counts.
+
+    ``static`` is a fixed (value, label) vocabulary such as SEVERITY_CHOICES;
+    its order is kept and values without matches show (0). The selected
+    value is always present so the form shows what is being filtered on.
+    """
+    by_value = dict(counts)
+    if static:
+        known = dict(static)
+        options = list(static) + [(v, v) for v, _n in counts if v not in known]
+    else:
+        options = [(v, v) for v, _n in counts]
+    if selected and selected not in {v for v, _label in options}:
+        options.append((selected, selected))
+    return [("", blank_label)] + [
+        (v, f"{label} ({by_value.get(v, 0):,})") for v, label in options
+    ]
@@ -0,0 +1,163 @@
+"""
+Incident list filters shared by the list page, CSV export and facet counts.
+"""
+
+import re
+from datetime import datetime, timedelta
+from sqlalchemy import and_, or_
+from . import db
+from .models import Incident
+from .search import apply_search
+
+# Query-string filter names, in the order they appear in URLs
+FILTER_NAMES = ("q", "customer", "severity", "status", "category", "date_from", "date_to", "duration")
+
+# Equality filters: filter name -> incident column
+EQUALITY_FILTERS = {
+    "customer": Incident.customer_name,
+    "severity": Incident.severity,
+    "status": Incident.status,
+    "category": Incident.category,
+}
+
+
+_DURATION_FILTER = re.compile(r"^(>=|<=|>|<)?\s*(\d+(?:\.\d+)?|(?:\d+(?:\.\d+)?\s*[dhm]\s*)+)$")
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)\s*([dhm]?)")
+_UNIT_MINUTES = {"d": 1440, "h": 60, "m": 1, "": 1}
+
+
+def parse_duration_filter(value):
+    """Parse '> 4h', '<=90m', '1h30m' (means >=) into (operator, minutes).
+
+    Bare numbers are minutes. Returns None if ``value`` doesn't parse.
+    """
+    match = _DURATION_FILTER.match((value or "").strip().lower())
+    if not match:
+        return None
+    minutes = sum(float(n) * _UNIT_MINUTES[unit] for n, unit in _DURATION_PART.findall(match.group(2)))
+    return match.group(1) or ">=", int(minutes)
+
+
+def _compare(column, op, minutes):
+    return {
+        ">": column > minutes,
+        ">=": column >= minutes,
+        "<": column < minutes,
+        "<=": column <= minutes,
+    }[op]
+
+
+def duration_condition(op, minutes, now=None, model=Incident):
+    """WHERE clause for ``model``.duration_minutes ``op`` ``minutes``.
+
+    Split in two so each half has an index: closed incidents compare the
+    stored downtime, open ones turn the duration bound into a start_time
+    bound (whole minutes, as duration_minutes counts them).
+    """
+    now = now or datetime.utcnow()
+    start = model.start_time
+    # "> 4h" and "<= 4h" split at 4h 1m of whole minutes
+    cutoff = now - timedelta(minutes=minutes + 1 if op in (">", "<=") else minutes)
+    if op in (">", ">="):
+        open_cond = start <= cutoff
+    else:
+        open_cond = and_(start > cutoff, start <= now)
+    return or_(
+        _compare(model.downtime_minutes, op, minutes),
+        and_(model.end_time.is_(None), open_cond),
+    )
+
+
+def _parse_dt(value):
+    """Parse a datetime-local string ('YYYY-MM-DDTHH:MM'), or return None."""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace('T', ' '))
+    except ValueError:
+        return None
+
+
+class IncidentFilters:
+    """The filter values of one list/export request, as raw strings."""
+
+    def __init__(self, **values):
+        for name in FILTER_NAMES:
+            setattr(self, name, (values.get(name) or "").strip())
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(**{name: args.get(name, '') for name in FILTER_NAMES})
+
+    @property
+    def date_from_dt(self):
+        return _parse_dt(self.date_from)
+
+    @property
+    def date_to_dt(self):
+        return _parse_dt(self.date_to)
+
+    def without(self, name):
+        """Return a copy with one filter cleared."""
+        values = self.as_args()
+        values.pop(name, None)
+        return IncidentFilters(**values)
+
+    def as_args(self):
+        """Non-empty filters as a dict, for url_for() and cache keys."""
+        return {name: getattr(self, name) for name in FILTER_NAMES if getattr(self, name)}
+
+    def key(self):
+        return tuple(sorted(self.as_args().items()))
+
+    def __bool__(self):
+        return bool(self.as_args())
+
+
+def filtered_query(filters, query=None, model=Incident):
+    """Apply ``filters`` to an Incident query (Incident.query by default).
+
+    Returns (query, rank); rank is the search relevance column when ``q`` is
+    served from the full-text index, else None. ``model`` may be
+    ArchivedIncident for a query over the archive.
+    """
+    if query is None:
+        query = model.query
+    rank = None
+
+    # Text search filter (FTS5 index over title, description, fault, parts)
+    if filters.q:
+        query, rank = apply_search(query, filters.q, model)
+
+    # Customer / status / severity / category filters
+    for name, column in EQUALITY_FILTERS.items():
+        value = getattr(filters, name)
+        if value:
+            query = query.filter(getattr(model, column.key) == value)
+
+    # Date range filters (unparseable dates are ignored)
+    date_from = filters.date_from_dt
+    if date_from:
+        query = query.filter(model.created_at >= date_from)
+
+    date_to = filters.date_to_dt
+    if date_to:
+        query = query.filter(model.created_at <= date_to)
+
+    # Duration filter, e.g. "> 4h" (unparseable values are ignored)
+    duration = parse_duration_filter(filters.duration)
+    if duration:
+        query = query.filter(duration_condition(*duration, model=model))
+
+    return query, rank
+
+
+def ordering(rank, sort=""):
+    """ORDER BY clauses: ``sort`` if given, else best search match first, then newest first."""
+    if sort == "duration_desc":
+        return [Incident.duration_minutes.desc().nulls_last(), Incident.id.desc()]
+    if sort == "duration_asc":
+        return [Incident.duration_minutes.asc().nulls_last(), Incident.id.desc()]
+    if rank is not None:
+        return [rank.asc(), Incident.created_at.desc(), Incident.id.desc()]
+    return [Incident.created_at.desc(), Incident.id.desc()]
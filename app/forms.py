@@ -7,6 +7,7 @@ from datetime import datetime
 SEVERITY_CHOICES = [("Low","Low"), ("Medium","Medium"), ("High","High")]
 CATEGORY_CHOICES = [("mechanical","Mechanical"), ("electrical","Electrical"), ("software","Software")]
 STATUS_CHOICES = [("Open","Open"), ("In Progress","In Progress"), ("Resolved","Resolved")]
+SORT_CHOICES = [("", "Newest first"), ("duration_desc", "Longest downtime"), ("duration_asc", "Shortest downtime")]
 
 # Parts drop-down options (value, label)
 PART_CHOICES = [
@@ -178,12 +179,15 @@ class IncidentForm(FlaskForm):
         return ok
 
 class FilterForm(FlaskForm):
-    q = StringField("Search", validators=[Optional()], render_kw={"placeholder": "Search title or description..."})
+    q = StringField("Search", validators=[Optional()], render_kw={"placeholder": 'Search title, description, fault or parts (use "quotes" for phrases)...'})
     customer = SelectField("Customer", choices=[("", "All Customers")], validators=[Optional()])
     severity = SelectField("Severity", choices=[("", "All Severities")] + SEVERITY_CHOICES, validators=[Optional()])
     status = SelectField("Status", choices=[("", "All Statuses")] + STATUS_CHOICES, validators=[Optional()])
+    category = SelectField("Category", choices=[("", "All Categories")] + CATEGORY_CHOICES, validators=[Optional()])
     date_from = DateTimeLocalField("From Date", format="%Y-%m-%dT%H:%M", validators=[Optional()])
     date_to = DateTimeLocalField("To Date", format="%Y-%m-%dT%H:%M", validators=[Optional()])
+    duration = StringField("Duration", validators=[Optional()], render_kw={"placeholder": "e.g. > 4h, < 30m"})
+    sort = SelectField("Sort", choices=SORT_CHOICES, validators=[Optional()])
     
     submit = SubmitField("Filter")
     clear = SubmitField("Clear Filters")
@@ -0,0 +1,102 @@
+"""
+Render cache for incident list rows and detail bodies.
+
+Rendered HTML is kept per process in a size-bounded LRU keyed on
+(kind, incident id) and stamped with the incident's row_version and the
+part catalogue version. A write to the incident bumps row_version, so the
+next lookup misses and the entry is replaced; other processes notice the
+same way.
+
+Durations of open incidents count up with the clock, so fragments hold
+markers where the duration goes and every response fills them in fresh.
+"""
+
+import threading
+from collections import OrderedDict
+from flask import current_app, render_template
+from markupsafe import Markup, escape
+from sqlalchemy.orm import selectinload
+from . import db
+from .models import Incident
+from .parts import part_version
+
+DURATION = "<!--duration-->"
+DURATION_MINUTES = "<!--duration-minutes-->"
+
+
+class FragmentCache:
+    """LRU of key -> (stamp, html); a lookup with another stamp misses."""
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, stamp):
+        with self._lock:
+            hit = self._entries.get(key)
+            if hit is None or hit[0] != stamp:
+                return None
+            self._entries.move_to_end(key)
+            return hit[1]
+
+    def put(self, key, stamp, html, maxsize):
+        with self._lock:
+            self._entries[key] = (stamp, html)
+            self._entries.move_to_end(key)
+            while len(self._entries) > maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_cache = FragmentCache()
+
+
+def _fill(html, incident):
+    minutes = incident.duration_minutes
+    return Markup(
+        html.replace(DURATION, str(escape(incident.human_duration())))
+        .replace(DURATION_MINUTES, "" if minutes is None else str(minutes))
+    )
+
+
+def _render(kind, incident, template, **context):
+    maxsize = current_app.config["RENDER_CACHE_SIZE"]
+    kind = "archived-" + kind if incident.archived else kind
+    key, stamp = (kind, incident.id), (incident.row_version, part_version())
+    html = _cache.get(key, stamp) if maxsize else None
+    if html is None:
+        html = render_template(template, duration=Markup(DURATION),
+                               duration_minutes=Markup(DURATION_MINUTES), **context)
+        if maxsize:
+            _cache.put(key, stamp, html, maxsize)
+    return _fill(html, incident)
+
+
+def render_rows(items):
+    """Return the <tr> HTML for each incident in ``items``.
+
+    ``items`` may be loaded without their parts; the parts of cache misses
+    are fetched in one query. Archived incidents (ArchivedIncident) render
+    without the row's edit controls.
+    """
+    stamp = part_version()
+    missing = [x.id for x in items
+               if not x.archived and _cache.get(("row", x.id), (x.row_version, stamp)) is None]
+    if missing:
+        db.session.scalars(
+            db.select(Incident).where(Incident.id.in_(missing))
+            .options(selectinload(Incident.parts))
+            .execution_options(populate_existing=True)
+        ).all()
+    return [_render("row", x, "_incident_row.html", x=x) for x in items]
+
+
+def render_detail(incident):
+    """Return the body HTML of the incident detail page."""
+    return _render("detail", incident, "_incident_detail.html", i=incident)
@@ -0,0 +1,246 @@
+"""
+Bulk incident import from CSV or JSON Lines.
+
+Rows are streamed from the file, checked against the same rules as the
+incident form (required fields, choice lists, the customer/site/serial/fault
+reference data, start/end order), and written in batches: one executemany
+INSERT for the incidents of a batch, one for their incident_parts links,
+then a commit. Each commit also records in app_state how many input rows
+are done, so an interrupted import can be resumed with --resume without
+duplicating rows.
+
+Columns are the Incident attribute names (title, customer_name, site_name,
+machine_serial, fault_code, start_time, ...). ``parts_used`` is a comma
+separated list of part names, each optionally with a quantity ('Belt x2');
+every part is linked through incident_parts, and names not yet in the
+catalogue are added to it. ``created_at`` defaults to ``start_time`` so
+backfilled history sorts where it happened. Times with a UTC offset are
+stored as naive UTC, like every other incident time.
+"""
+
+import csv
+import hashlib
+import json
+import os
+import time
+from datetime import datetime, timezone
+from sqlalchemy import text
+from . import db
+from .forms import CATEGORY_CHOICES, SEVERITY_CHOICES, STATUS_CHOICES
+from .models import AppState, Incident, incident_parts
+from .parts import ensure_parts, part_catalogue, parse_parts, parts_text
+from .reference import get_reference
+
+TEXT_FIELDS = (
+    "title", "description", "customer_name", "site_name", "location",
+    "machine_model", "machine_serial", "fault_code", "fault",
+    "category", "severity", "status",
+)
+TIME_FIELDS = ("start_time", "end_time", "created_at")
+
+_CHOICES = {
+    "category": {v for v, _label in CATEGORY_CHOICES},
+    "severity": {v for v, _label in SEVERITY_CHOICES},
+    "status": {v for v, _label in STATUS_CHOICES},
+}
+_DEFAULTS = {"category": "mechanical", "severity": "Medium", "status": "Open"}
+_TRUE = {"1", "true", "yes", "y", "on"}
+
+
+class RowError(ValueError):
+    """A row failed validation; ``errors`` maps field name to message."""
+
+    def __init__(self, errors):
+        super().__init__("; ".join(f"{k}: {v}" for k, v in errors.items()))
+        self.errors = errors
+
+
+def read_records(path, fmt=None):
+    """Yield one dict per input record from a CSV or JSON Lines file.
+
+    A JSON line that does not parse is yielded as its text, for prepare_row
+    to reject.
+    """
+    fmt = fmt or ("jsonl" if path.endswith((".jsonl", ".ndjson", ".json")) else "csv")
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if fmt == "csv":
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                line = line.strip()
+                if line:
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        yield line
+
+
+def _parse_time(value):
+    if value in (None, ""):
+        return None
+    if isinstance(value, datetime):
+        return value
+    parsed = datetime.fromisoformat(str(value).strip().replace("T", " ").replace("Z", "+00:00"))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def prepare_row(record, ref):
+    """Validate one input record; return (incident_values, [(part, quantity)]).
+
+    Raises RowError with every problem found.
+    """
+    if not isinstance(record, dict):
+        raise RowError({"record": "Not a JSON object."})
+    row = {}
+    errors = {}
+    for name in TEXT_FIELDS:
+        value = record.get(name)
+        value = str(value).strip() if value not in (None, "") else None
+        row[name] = value or _DEFAULTS.get(name)
+
+    if not row["title"]:
+        errors["title"] = "This field is required."
+    if not row["customer_name"]:
+        errors["customer_name"] = "This field is required."
+    for name, allowed in _CHOICES.items():
+        if row[name] not in allowed:
+            errors[name] = "Not a valid choice."
+
+    if row["customer_name"]:
+        errors.update(ref.validate(
+            row["customer_name"],
+            site=row["site_name"],
+            location=row["location"],
+            model=row["machine_model"],
+            serial=row["machine_serial"],
+            fault_code=row["fault_code"],
+            fault=row["fault"],
+        ))
+    # Same as the form: the serial decides the model, the code the description
+    if row["machine_serial"] and "machine_serial" not in errors:
+        row["machine_model"] = ref.model_for(row["site_name"], row["machine_serial"])
+    if row["fault_code"] and not row["fault"] and "fault_code" not in errors:
+        row["fault"] = ref.fault_map[row["fault_code"]]
+
+    for name in TIME_FIELDS:
+        try:
+            row[name] = _parse_time(record.get(name))
+        except (TypeError, ValueError):
+            row[name] = None
+            errors[name] = "Not a valid datetime value."
+    if row["start_time"] and row["end_time"] and row["end_time"] < row["start_time"]:
+        errors["end_time"] = "End time cannot be before start time."
+    if errors:
+        raise RowError(errors)
+
+    row["created_at"] = row["created_at"] or row["start_time"] or datetime.utcnow()
+    # Historical rows were last touched when they closed, not when imported
+    row["updated_at"] = max(row["created_at"], row["end_time"]) if row["end_time"] else row["created_at"]
+    row["preventive_maintenance"] = str(record.get("preventive_maintenance") or "").strip().lower() in _TRUE
+
+    parts = parse_parts(record.get("parts_used") or "")
+    row["parts_used"] = parts_text(parts)
+    return row, parts
+
+
+def _checkpoint_keys(name):
+    digest = hashlib.sha1(name.encode("utf-8")).hexdigest()[:20]
+    return f"import:{digest}:rows", f"import:{digest}:inserted"
+
+
+def _record_checkpoint(name, done, inserted):
+    """Record progress in the current transaction, so it commits with the batch."""
+    for key, value in zip(_checkpoint_keys(name), (done, inserted)):
+        db.session.execute(text(
+            "INSERT INTO app_state(key, value) VALUES (:key, :value) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value"
+        ), {"key": key, "value": value})
+
+
+def read_checkpoint(name):
+    """Return (rows_done, inserted) recorded under checkpoint ``name``, or (0, 0)."""
+    rows_key, inserted_key = _checkpoint_keys(name)
+    values = dict(db.session.execute(
+        db.select(AppState.key, AppState.value).where(AppState.key.in_((rows_key, inserted_key)))
+    ).all())
+    return values.get(rows_key, 0), values.get(inserted_key, 0)
+
+
+def insert_batch(rows, row_parts, catalogue):
+    """Insert one batch of prepared rows and their part links; return ids.
+
+    ``row_parts`` holds one [(name, quantity)] list per row; names missing
+    from ``catalogue`` (see part_catalogue()) are added to the catalogue.
+    """
+    ensure_parts([name for parts in row_parts for name, _qty in parts], catalogue)
+    ids = db.session.execute(
+        db.insert(Incident).returning(Incident.id, sort_by_parameter_order=True),
+        rows,
+    ).scalars().all()
+    links = [
+        {"incident_id": incident_id, "part_id": catalogue[name.lower()], "quantity": qty}
+        for incident_id, parts in zip(ids, row_parts)
+        for name, qty in parts
+    ]
+    if links:
+        db.session.execute(db.insert(incident_parts), links)
+    return ids
+
+
+def import_incidents(path, fmt=None, batch_size=1000, checkpoint=None, resume=False,
+                     rejects=None, log=print):
+    """Import incidents from ``path``; return (inserted, rejected).
+
+    ``checkpoint`` names the progress record and defaults to the absolute
+    path; with ``resume`` the rows it records as done are skipped. Invalid rows are reported through
+    ``log`` and, if ``rejects`` is a path, written there as JSON Lines with
+    their errors.
+    """
+    checkpoint = checkpoint or os.path.abspath(path)
+    skip, already = read_checkpoint(checkpoint) if resume else (0, 0)
+    ref = get_reference()
+    catalogue = part_catalogue()
+
+    reject_file = open(rejects, "a" if resume else "w", encoding="utf-8") if rejects else None
+    done, inserted, rejected = skip, 0, 0
+    batch, batch_parts = [], []
+    started = time.monotonic()
+
+    def flush():
+        nonlocal inserted
+        if batch:
+            insert_batch(batch, batch_parts, catalogue)
+            inserted += len(batch)
+        _record_checkpoint(checkpoint, done, already + inserted)
+        db.session.commit()
+        rate = (inserted + rejected) / max(time.monotonic() - started, 1e-6)
+        log(f"{done:,} rows read, {inserted:,} imported, {rejected:,} rejected ({rate:,.0f} rows/s)")
+        batch.clear()
+        batch_parts.clear()
+
+    try:
+        for n, record in enumerate(read_records(path, fmt), 1):
+            if n <= skip:
+                continue
+            try:
+                row, names = prepare_row(record, ref)
+            except RowError as e:
+                rejected += 1
+                if rejected <= 20:
+                    log(f"Row {n}: {e}")
+                if reject_file:
+                    reject_file.write(json.dumps({"row": n, "errors": e.errors, "record": record}, default=str) + "\n")
+            else:
+                batch.append(row)
+                batch_parts.append(names)
+            done = n
+            if len(batch) >= batch_size:
+                flush()
+        flush()
+    finally:
+        db.session.rollback()
+        if reject_file:
+            reject_file.close()
+    return inserted, rejected
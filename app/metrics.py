@@ -0,0 +1,254 @@
+"""
+Built-in metrics, served at /metrics in the Prometheus text format.
+
+Per blueprint endpoint: request counts by method and status, 5xx error
+counts, a latency histogram and a response size histogram. Latency and size
+are recorded when the response is closed, so streamed responses (the CSV
+export) include the time and bytes of their body. For the database pool:
+a histogram of connection checkout waits and a count of failed checkouts.
+
+Each process keeps its own registry. Under gunicorn every worker writes a
+snapshot to METRICS_DIR (``<pid>.json``, from a background thread at most once per
+METRICS_FLUSH_SECONDS) and /metrics sums the snapshots of all workers, so a
+scrape sees the whole server whichever worker answers it. Snapshots of
+exited workers are kept so counters never go backwards; clear the directory
+when the server is restarted from scratch.
+"""
+
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+from flask import Response, request
+from sqlalchemy.pool import QueuePool
+
+# name -> (type, help, histogram buckets)
+METRICS = {
+    "muims_http_requests_total": (
+        "counter", "HTTP requests by endpoint, method and status.", None),
+    "muims_http_request_errors_total": (
+        "counter", "HTTP requests that ended in a 5xx response.", None),
+    "muims_http_request_duration_seconds": (
+        "histogram", "Time from request start to the end of the response body.",
+        (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)),
+    "muims_http_response_size_bytes": (
+        "histogram", "Response body size.",
+        (1_000, 10_000, 50_000, 100_000, 500_000, 1_000_000, 10_000_000, 100_000_000)),
+    "muims_db_pool_checkout_seconds": (
+        "histogram", "Time spent waiting for a database connection from the pool.",
+        (0.0001, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)),
+    "muims_db_pool_checkout_errors_total": (
+        "counter", "Database connection checkouts that failed or timed out.", None),
+}
+
+
+class Registry:
+    """Counters and histograms of one process, keyed by (name, labels)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+        self.directory = None
+        self.flush_seconds = 1.0
+        self._dirty = False
+        self._flusher = None  # pid whose flush thread is running
+
+    def _reset(self):
+        self.pid = os.getpid()
+        self.counters = {}
+        self.histograms = {}  # key -> [bucket counts..., +Inf count, sum]
+
+    def _check_fork(self):
+        # A registry inherited over fork (gunicorn --preload) starts empty
+        if os.getpid() != self.pid:
+            self._reset()
+
+    def inc(self, name, labels=(), value=1):
+        with self._lock:
+            self._check_fork()
+            key = (name, labels)
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=()):
+        buckets = METRICS[name][2]
+        with self._lock:
+            self._check_fork()
+            key = (name, labels)
+            slots = self.histograms.get(key)
+            if slots is None:
+                slots = self.histograms[key] = [0] * (len(buckets) + 1) + [0.0]
+            slots[bisect.bisect_left(buckets, value)] += 1
+            slots[-1] += value
+
+    def snapshot(self):
+        with self._lock:
+            self._check_fork()
+            return {
+                "counters": [[n, list(l), v] for (n, l), v in self.counters.items()],
+                "histograms": [[n, list(l), list(s)] for (n, l), s in self.histograms.items()],
+            }
+
+    def flush(self):
+        """Write this process's snapshot to the shared directory."""
+        data = self.snapshot()
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp, path)
+
+    def changed(self):
+        """Schedule a flush; a daemon thread per process writes at most once per interval."""
+        if not self.directory:
+            return
+        self._dirty = True
+        if self._flusher != os.getpid():
+            with self._lock:
+                if self._flusher != os.getpid():
+                    self._flusher = os.getpid()
+                    threading.Thread(target=self._flush_loop, name="metrics-flush", daemon=True).start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_seconds)
+            if self._dirty:
+                self._dirty = False
+                self.flush()
+
+    def collect(self):
+        """Return (counters, histograms) summed over every process's snapshot."""
+        if self.directory:
+            self.flush()
+            snapshots = []
+            for path in glob.glob(os.path.join(self.directory, "*.json")):
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue  # being replaced or truncated; next scrape gets it
+        else:
+            snapshots = [self.snapshot()]
+
+        counters, histograms = {}, {}
+        for snap in snapshots:
+            for name, labels, value in snap["counters"]:
+                key = (name, tuple(map(tuple, labels)))
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, slots in snap["histograms"]:
+                key = (name, tuple(map(tuple, labels)))
+                total = histograms.setdefault(key, [0] * len(slots))
+                for i, v in enumerate(slots):
+                    total[i] += v
+        return counters, histograms
+
+
+registry = Registry()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def render(counters, histograms):
+    """Format collected metrics in the Prometheus text exposition format."""
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == "counter":
+            for (n, labels), value in sorted(counters.items()):
+                if n == name:
+                    lines.append(f"{name}{_labels(labels)} {value:g}")
+            continue
+        for (n, labels), slots in sorted(histograms.items()):
+            if n != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets, slots):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(labels, [('le', f'{bound:g}')])} {cumulative}")
+            count = cumulative + slots[len(buckets)]
+            lines.append(f"{name}_bucket{_labels(labels, [('le', '+Inf')])} {count}")
+            lines.append(f"{name}_sum{_labels(labels)} {float(slots[-1])!r}")
+            lines.append(f"{name}_count{_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records checkout waits and failures in the registry."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except Exception:
+            registry.inc("muims_db_pool_checkout_errors_total")
+            raise
+        registry.observe("muims_db_pool_checkout_seconds", time.perf_counter() - started)
+        return conn
+
+
+def _counted(body, on_close):
+    """Yield ``body`` unchanged, passing the total byte count to ``on_close``."""
+    size = 0
+    try:
+        for chunk in body:
+            size += len(chunk)
+            yield chunk
+    finally:
+        if hasattr(body, "close"):
+            body.close()
+        on_close(size)
+
+
+def init_metrics(app):
+    """Register the request hooks and the /metrics endpoint if METRICS_ENABLED."""
+    if not app.config["METRICS_ENABLED"]:
+        return
+
+    registry.directory = app.config["METRICS_DIR"]
+    registry.flush_seconds = app.config["METRICS_FLUSH_SECONDS"]
+    if registry.directory:
+        os.makedirs(registry.directory, exist_ok=True)
+
+    @app.before_request
+    def _start_timer():
+        request.environ["muims.started"] = time.perf_counter()
+
+    @app.after_request
+    def _record(response):
+        started = request.environ.get("muims.started")
+        if started is None:
+            return response
+        endpoint = request.endpoint or "unmatched"
+        method, status = request.method, response.status_code
+
+        def done(size):
+            labels = (("endpoint", endpoint),)
+            registry.inc("muims_http_requests_total", labels + (("method", method), ("status", str(status))))
+            if status >= 500:
+                registry.inc("muims_http_request_errors_total", labels)
+            registry.observe("muims_http_request_duration_seconds", time.perf_counter() - started, labels)
+            registry.observe("muims_http_response_size_bytes", size, labels)
+            registry.changed()
+
+        if response.is_streamed:
+            response.response = _counted(response.response, done)
+        else:
+            length = response.calculate_content_length() or 0
+            response.call_on_close(lambda: done(length))
+        return response
+
+    @app.route("/metrics", endpoint="metrics")
+    def metrics():
+        counters, histograms = registry.collect()
+        return Response(render(counters, histograms), mimetype="text/plain; version=0.0.4")
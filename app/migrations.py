@@ -0,0 +1,301 @@
+"""
+Versioned schema migrations.
+
+db.create_all() only creates missing tables; it never touches a table that
+already exists. Everything an existing database needs on top of that
+(indexes, triggers, new columns, backfills) is a numbered step here, applied
+in order by `flask db-upgrade` and recorded in the schema_version table.
+
+Steps must be idempotent: a fresh database already has the model's indexes
+and columns from create_all(), and two workers may race on the same step.
+"""
+
+import re
+from collections import namedtuple
+from sqlalchemy import inspect, text
+from . import db
+from . import models  # noqa: F401  (register model tables before create_all)
+
+Migration = namedtuple("Migration", "version description apply")
+
+MIGRATIONS = []
+
+schema_version = db.Table(
+    "schema_version",
+    db.Column("version", db.Integer, primary_key=True),
+    db.Column("description", db.String(200), nullable=False),
+    db.Column("applied_at", db.DateTime, server_default=db.func.now(), nullable=False),
+)
+
+
+def migration(version, description):
+    """Register ``fn(conn)`` as migration ``version``."""
+    def decorator(fn):
+        MIGRATIONS.append(Migration(version, description, fn))
+        MIGRATIONS.sort(key=lambda m: m.version)
+        return fn
+    return decorator
+
+
+# ---------------------------------------------------------------------------
+# Helpers for migration steps
+# ---------------------------------------------------------------------------
+
+def create_indexes(conn, table_name, *index_names):
+    """Create the named indexes declared on a model table if missing."""
+    table = db.metadata.tables[table_name]
+    by_name = {ix.name: ix for ix in table.indexes}
+    for name in index_names:
+        by_name[name].create(conn, checkfirst=True)
+
+
+def add_column(conn, table_name, column_name, ddl):
+    """ALTER TABLE ... ADD COLUMN unless the column already exists."""
+    existing = {c["name"] for c in inspect(conn).get_columns(table_name)}
+    if column_name not in existing:
+        conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {ddl}"))
+
+
+# ---------------------------------------------------------------------------
+# Migrations
+# ---------------------------------------------------------------------------
+
+@migration(1, "Full-text search index over incidents")
+def _incident_fts(conn):
+    from .search import install_search_index
+    if conn.dialect.name == "sqlite":
+        install_search_index(conn)
+
+
+@migration(2, "Incident indexes for list filters and dashboard counts")
+def _incident_filter_indexes(conn):
+    create_indexes(
+        conn, "incident",
+        "ix_incident_created_at",
+        "ix_incident_status_created_at",
+        "ix_incident_severity_created_at",
+        "ix_incident_customer_created_at",
+        "ix_incident_customer_status_created_at",
+        "ix_incident_status_severity_created_at",
+        "ix_incident_machine_serial_start_time",
+        "ix_incident_fault_code",
+    )
+    if conn.dialect.name == "sqlite":
+        conn.execute(text("ANALYZE incident"))
+
+
+@migration(3, "Dashboard counters maintained by incident triggers")
+def _incident_counters(conn):
+    from .counters import install_counter_triggers, rebuild_counters
+    install_counter_triggers(conn)
+    rebuild_counters(conn)
+
+
+@migration(4, "Reference data tables with version triggers")
+def _reference_data(conn):
+    from .reference import install_reference_triggers, load_default_reference
+    install_reference_triggers(conn)
+    if not conn.execute(text("SELECT 1 FROM customer LIMIT 1")).first():
+        load_default_reference(conn)
+
+
+@migration(5, "Incident data version for caches, category filter index")
+def _incident_version(conn):
+    from .counters import install_version_triggers
+    install_version_triggers(conn)
+    create_indexes(conn, "incident", "ix_incident_category_created_at")
+
+
+@migration(6, "Incident downtime column and duration indexes")
+def _incident_downtime(conn):
+    from .models import DOWNTIME_SQL
+    add_column(conn, "incident", "downtime_minutes",
+               f"INTEGER GENERATED ALWAYS AS ({DOWNTIME_SQL}) VIRTUAL")
+    create_indexes(conn, "incident", "ix_incident_downtime_minutes", "ix_incident_open_start_time")
+
+
+@migration(7, "Reliability (MTTR/MTBF) projections and dirty-serial triggers")
+def _reliability(conn):
+    from .reliability import install_reliability_triggers, rebuild_reliability
+    install_reliability_triggers(conn)
+    rebuild_reliability(conn)
+
+
+@migration(8, "Daily incident rollups for trend reporting")
+def _incident_rollups(conn):
+    from .rollup import install_rollup_triggers, rebuild_rollups
+    install_rollup_triggers(conn)
+    rebuild_rollups(conn)
+
+
+@migration(9, "Part quantities, part usage index, free-text parts linked")
+def _part_usage(conn):
+    from .parts import parse_parts
+    add_column(conn, "incident_parts", "quantity", "INTEGER NOT NULL DEFAULT 1")
+    create_indexes(conn, "incident_parts", "ix_incident_parts_part_id")
+
+    # Free-text parts only ever lived in the parts_used text: give each name
+    # a Part row and link it (the last time that text is parsed)
+    catalogue = {name.lower(): pid for pid, name in conn.execute(text("SELECT id, name FROM part"))}
+    linked = set(conn.execute(text("SELECT incident_id, part_id FROM incident_parts")).all())
+    links = []
+    for incident_id, parts_used in conn.execute(text(
+        "SELECT id, parts_used FROM incident WHERE coalesce(parts_used, '') != ''"
+    )).all():
+        for name, qty in parse_parts(parts_used):
+            if name.lower() not in catalogue:
+                catalogue[name.lower()] = conn.execute(
+                    text("INSERT INTO part(name, created_at) VALUES (:name, CURRENT_TIMESTAMP) RETURNING id"),
+                    {"name": name},
+                ).scalar()
+            key = (incident_id, catalogue[name.lower()])
+            if key not in linked:
+                linked.add(key)
+                links.append({"incident_id": key[0], "part_id": key[1], "quantity": qty})
+    if links:
+        conn.execute(text(
+            "INSERT INTO incident_parts(incident_id, part_id, quantity) VALUES (:incident_id, :part_id, :quantity)"
+        ), links)
+
+
+@migration(10, "Part version triggers for the parts search index")
+def _part_version(conn):
+    from .parts import install_part_triggers
+    install_part_triggers(conn)
+
+
+@migration(11, "Incident row version for the render cache")
+def _incident_row_version(conn):
+    add_column(conn, "incident", "row_version", "INTEGER NOT NULL DEFAULT 1")
+
+
+@migration(12, "Incident updated_at and last-change time for conditional GET")
+def _incident_updated_at(conn):
+    from .counters import install_changed_triggers
+    add_column(conn, "incident", "updated_at", "DATETIME")
+    conn.execute(text("UPDATE incident SET updated_at = created_at WHERE updated_at IS NULL"))
+    install_changed_triggers(conn)
+    conn.execute(text(
+        "INSERT OR IGNORE INTO app_state(key, value) "
+        "SELECT 'incident_changed_at', CAST(strftime('%s', 'now') AS INTEGER)"
+    ))
+
+
+@migration(13, "Incident change log for the change feed")
+def _incident_changes(conn):
+    from .changes import install_change_triggers, rebuild_changes
+    install_change_triggers(conn)
+    rebuild_changes(conn)
+
+
+@migration(14, "Archive tables; rollup and change-log triggers skip archival moves")
+def _incident_archive(conn):
+    from .changes import install_change_triggers
+    from .rollup import install_rollup_triggers
+    for trigger in ("incident_rollup_ad", "incident_change_ad"):
+        conn.execute(text(f"DROP TRIGGER IF EXISTS {trigger}"))
+    install_rollup_triggers(conn)
+    install_change_triggers(conn)
+
+
+@migration(15, "Dashboard counters keep archived incidents")
+def _archived_counters(conn):
+    from .counters import install_counter_triggers, rebuild_counters
+    conn.execute(text("DROP TRIGGER IF EXISTS incident_counter_ad"))
+    install_counter_triggers(conn)
+    rebuild_counters(conn)
+
+
+@migration(16, "Incident ids never reused (AUTOINCREMENT)")
+def _incident_autoincrement(conn):
+    from .derived import triggers_suspended
+    from .models import Incident
+    if conn.dialect.name != "sqlite":
+        return
+    sql = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'incident'")).scalar()
+    if "AUTOINCREMENT" not in sql.upper():
+        # SQLite can only add AUTOINCREMENT by rebuilding the table; the
+        # triggers go with the old table and are put back on the new one
+        indexes = conn.execute(text(
+            "SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'incident' AND sql IS NOT NULL"
+        )).scalars().all()
+        # The table as it is (older databases allow NULL created_at), plus AUTOINCREMENT
+        sql, renamed = re.subn(r'^CREATE TABLE "?incident"?\s*\(', "CREATE TABLE incident_new (", sql)
+        sql, keyed = re.subn(r"\bid INTEGER NOT NULL\s*,", "id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,", sql, count=1)
+        sql, dropped = re.subn(r",\s*PRIMARY KEY \(id\)", "", sql)
+        if (renamed, keyed, dropped) != (1, 1, 1):
+            raise RuntimeError("Unexpected incident table definition; cannot add AUTOINCREMENT")
+        with triggers_suspended(conn):
+            conn.execute(text(sql))
+            columns = ", ".join(c.name for c in Incident.__table__.columns if c.computed is None)
+            conn.execute(text(f"INSERT INTO incident_new ({columns}) SELECT {columns} FROM incident"))
+            conn.execute(text("DROP TABLE incident"))
+            conn.execute(text("ALTER TABLE incident_new RENAME TO incident"))
+            for ddl in indexes:
+                conn.execute(text(ddl))
+    # Start past every id ever handed out, archived and deleted ones included
+    conn.execute(text("DELETE FROM sqlite_sequence WHERE name = 'incident'"))
+    conn.execute(text(
+        "INSERT INTO sqlite_sequence(name, seq) SELECT 'incident', max("
+        "  coalesce((SELECT max(id) FROM incident), 0),"
+        "  coalesce((SELECT max(id) FROM incident_archive), 0),"
+        "  coalesce((SELECT max(incident_id) FROM incident_change), 0))"
+    ))
+
+
+# ---------------------------------------------------------------------------
+# Runner
+# ---------------------------------------------------------------------------
+
+def applied_versions():
+    """Return {version: applied_at} for migrations already applied ({} before the first upgrade)."""
+    with db.engine.connect() as conn:
+        if not inspect(conn).has_table(schema_version.name):
+            return {}
+        rows = conn.execute(db.select(schema_version.c.version, schema_version.c.applied_at))
+        return {v: at for v, at in rows}
+
+
+def pending():
+    """Return the migrations not yet applied, in order."""
+    done = applied_versions()
+    return [m for m in MIGRATIONS if m.version not in done]
+
+
+def upgrade(log=None):
+    """Create missing tables, then apply pending migrations in order.
+
+    Each migration runs in its own transaction together with its
+    schema_version row, so a failed step leaves nothing half-applied.
+    Returns the list of migrations applied.
+    """
+    db.create_all()
+    applied = []
+    for m in pending():
+        with db.engine.begin() as conn:
+            already = conn.execute(
+                db.select(schema_version.c.version).where(schema_version.c.version == m.version)
+            ).first()
+            if already:
+                continue
+            m.apply(conn)
+            conn.execute(
+                schema_version.insert()
+                .prefix_with("OR IGNORE", dialect="sqlite")
+                .values(version=m.version, description=m.description)
+            )
+        applied.append(m)
+        if log:
+            log(f"Applied {m.version:04d} {m.description}")
+    return applied
+
+
+def reset():
+    """Drop every table (and derived index) and rebuild at the latest version."""
+    from .search import drop_search_index
+    with db.engine.begin() as conn:
+        if conn.dialect.name == "sqlite":
+            drop_search_index(conn)
+    db.drop_all()
+    db.session.remove()
+    return upgrade()
@@ -1,13 +1,39 @@
 from datetime import datetime, timezone
 from datetime import datetime as utcnow
+from sqlalchemy import case, cast
+from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.sql import func
 from . import db
 
-# Association table for many-to-many relationship between incidents and parts
+# Whole minutes between start_time and end_time, computed by SQLite from the
+# stored values (julianday() reads every datetime format we have stored).
+# NULL while the incident is open or if the times are out of order.
+DOWNTIME_SQL = (
+    "CASE WHEN julianday(end_time) >= julianday(start_time) "
+    "THEN CAST(round((julianday(end_time) - julianday(start_time)) * 86400) AS INTEGER) / 60 END"
+)
+
+
+def format_minutes(mins):
+    """Return nice text like '48m', '2h 15m', or 'N/A' for None."""
+    if mins is None:
+        return "N/A"
+    if mins < 60:
+        return f"{mins}m"
+    h, m = divmod(mins, 60)
+    return f"{h}h {m}m" if m else f"{h}h"
+
+# Association table for many-to-many relationship between incidents and parts.
+# Every part an incident used is linked here with its quantity, including
+# free-text "other" parts (they get Part rows of their own); parts_used on
+# the incident is only the display/search text built from these links.
 incident_parts = db.Table('incident_parts',
     db.Column('incident_id', db.Integer, db.ForeignKey('incident.id', ondelete='CASCADE'), nullable=False),
     db.Column('part_id', db.Integer, db.ForeignKey('part.id', ondelete='CASCADE'), nullable=False),
-    db.UniqueConstraint('incident_id', 'part_id')
+    db.Column('quantity', db.Integer, nullable=False, default=1, server_default='1'),
+    db.UniqueConstraint('incident_id', 'part_id'),
+    # Parts analytics: from a part to the incidents that used it
+    db.Index('ix_incident_parts_part_id', 'part_id', 'incident_id'),
 )
 
 class Part(db.Model):
@@ -15,7 +41,79 @@ class Part(db.Model):
     name = db.Column(db.String(120), unique=True, nullable=False)
     created_at = db.Column(db.DateTime(timezone=True), default=utcnow.utcnow, nullable=False)
 
-class Incident(db.Model):
+class IncidentPart(db.Model):
+    """One incident_parts row: a part and how many of it an incident used."""
+    __table__ = incident_parts
+    __mapper_args__ = {"primary_key": [incident_parts.c.incident_id, incident_parts.c.part_id]}
+
+    part = db.relationship("Part", lazy="joined")
+
+class DurationMixin:
+    """Duration of an incident, shared by live and archived incidents."""
+
+    @hybrid_property
+    def duration_minutes(self):
+        """Return duration in whole minutes, or None if not computable.
+
+        Open incidents count up to now. In SQL this is downtime_minutes for
+        closed incidents and the same live calculation for open ones, so
+        lists can filter, sort and aggregate on it.
+        """
+        if not self.start_time:
+            return None
+        
+        # Handle timezone-aware and naive datetime comparisons
+        start = self.start_time.replace(tzinfo=timezone.utc) if self.start_time and self.start_time.tzinfo is None else self.start_time
+        end = (self.end_time or datetime.now(timezone.utc))
+        if end.tzinfo is None:
+            end = end.replace(tzinfo=timezone.utc)
+        
+        # Guard invalid order
+        if end < start:
+            return None
+        
+        delta = end - start
+        return int(delta.total_seconds() // 60)
+
+    @duration_minutes.inplace.expression
+    @classmethod
+    def _duration_minutes_expression(cls):
+        return case((cls.end_time.is_(None), cls.live_minutes()), else_=cls.downtime_minutes)
+
+    @classmethod
+    def live_minutes(cls):
+        """SQL: whole minutes from start_time to now (NULL if it starts later)."""
+        seconds = func.round((func.julianday("now") - func.julianday(cls.start_time)) * 86400)
+        return case((seconds >= 0, cast(seconds, db.Integer) // 60))
+
+    def human_duration(self):
+        """Return nice text like '48m', '2h 15m', or 'N/A'."""
+        return format_minutes(self.duration_minutes)
+
+class Incident(DurationMixin, db.Model):
+    # Secondary indexes follow the list filters (FilterForm) and dashboard
+    # counts: each equality filter leads, created_at follows so the filtered
+    # rows come out already in list order. Existing databases get them from
+    # `flask db-upgrade` (see app/migrations.py).
+    __table_args__ = (
+        db.Index("ix_incident_created_at", "created_at"),
+        db.Index("ix_incident_status_created_at", "status", "created_at"),
+        db.Index("ix_incident_severity_created_at", "severity", "created_at"),
+        db.Index("ix_incident_customer_created_at", "customer_name", "created_at"),
+        db.Index("ix_incident_customer_status_created_at", "customer_name", "status", "created_at"),
+        db.Index("ix_incident_status_severity_created_at", "status", "severity", "created_at"),
+        db.Index("ix_incident_category_created_at", "category", "created_at"),
+        db.Index("ix_incident_machine_serial_start_time", "machine_serial", "start_time"),
+        db.Index("ix_incident_fault_code", "fault_code"),
+        db.Index("ix_incident_downtime_minutes", "downtime_minutes"),
+        # Open incidents only: their duration is computed live from start_time
+        db.Index("ix_incident_open_start_time", "start_time", sqlite_where=db.text("end_time IS NULL")),
+        # Ids are never reused: the archive and the change log keep old ones
+        {"sqlite_autoincrement": True},
+    )
+
+    archived = False
+
     id = db.Column(db.Integer, primary_key=True)
     # basics
     title = db.Column(db.String(140), nullable=False)
@@ -33,6 +131,9 @@ class Incident(db.Model):
     end_time = db.Column(db.DateTime(timezone=True))              # "End Time"
     preventive_maintenance = db.Column(db.Boolean, default=False)
     parts_used = db.Column(db.Text, nullable=True)
+    # Downtime of closed incidents in whole minutes; a virtual column, so
+    # SQLite keeps it in step with start/end on every write (see DOWNTIME_SQL)
+    downtime_minutes = db.Column(db.Integer, db.Computed(DOWNTIME_SQL, persisted=False))
 
     # classification
     category = db.Column(db.String(50), default="mechanical")
@@ -40,35 +141,204 @@ class Incident(db.Model):
     status = db.Column(db.String(20), default="Open")
 
     created_at = db.Column(db.DateTime(timezone=True), server_default=func.now(), nullable=False)
+    # Bumped by every ORM or Core UPDATE of the row; keys rendered fragments
+    # and, with updated_at, the detail page's ETag/Last-Modified
+    row_version = db.Column(db.Integer, nullable=False, default=1, server_default="1",
+                            onupdate=db.literal_column("row_version + 1"))
+    updated_at = db.Column(db.DateTime(timezone=True), default=utcnow.utcnow, onupdate=utcnow.utcnow)
 
-    # Relationships
-    parts = db.relationship("Part", secondary=incident_parts, backref=db.backref("incidents", lazy="dynamic"), lazy="selectin")
+    # Relationships: write through `usage` (see app/parts.py), read either
+    usage = db.relationship("IncidentPart", lazy="selectin", cascade="all, delete-orphan", overlaps="parts")
+    parts = db.relationship("Part", secondary=incident_parts, backref=db.backref("incidents", lazy="dynamic", viewonly=True),
+                            lazy="selectin", viewonly=True)
 
-    @property
-    def duration_minutes(self):
-        """Return duration in whole minutes, or None if not computable."""
-        if not self.start_time:
-            return None
-        
-        # Handle timezone-aware and naive datetime comparisons
-        start = self.start_time.replace(tzinfo=timezone.utc) if self.start_time and self.start_time.tzinfo is None else self.start_time
-        end = (self.end_time or datetime.now(timezone.utc))
-        if end.tzinfo is None:
-            end = end.replace(tzinfo=timezone.utc)
-        
-        # Guard invalid order
-        if end < start:
-            return None
-        
-        delta = end - start
-        return int(delta.total_seconds() // 60)
+# ---------------------------------------------------------------------------
+# Long-resolved incidents moved out of the hot tables (see app/archive.py)
+# ---------------------------------------------------------------------------
 
-    def human_duration(self):
-        """Return nice text like '48m', '2h 15m', or 'N/A'."""
-        mins = self.duration_minutes
-        if mins is None:
-            return "N/A"
-        if mins < 60:
-            return f"{mins}m"
-        h, m = divmod(mins, 60)
-        return f"{h}h {m}m" if m else f"{h}h"
+def _archive_column(column):
+    """Copy of an incident column for incident_archive, without defaults."""
+    computed = [db.Computed(column.computed.sqltext, persisted=False)] if column.computed is not None else []
+    return db.Column(column.name, column.type, *computed, primary_key=column.primary_key, nullable=column.nullable)
+
+incident_archive = db.Table('incident_archive',
+    *(_archive_column(c) for c in Incident.__table__.columns),
+    db.Column('archived_at', db.DateTime, nullable=False, server_default=func.now()),
+    # Archived rows are only read by date range
+    db.Index('ix_incident_archive_created_at', 'created_at'),
+)
+
+incident_parts_archive = db.Table('incident_parts_archive',
+    db.Column('incident_id', db.Integer, db.ForeignKey('incident_archive.id'), primary_key=True),
+    db.Column('part_id', db.Integer, db.ForeignKey('part.id'), primary_key=True),
+    db.Column('quantity', db.Integer, nullable=False, default=1, server_default='1'),
+)
+
+class ArchivedPart(db.Model):
+    """One incident_parts_archive row."""
+    __table__ = incident_parts_archive
+
+    part = db.relationship("Part", lazy="joined")
+
+class ArchivedIncident(DurationMixin, db.Model):
+    """An incident moved to incident_archive; read-only."""
+    __table__ = incident_archive
+    archived = True
+
+    usage = db.relationship("ArchivedPart", lazy="selectin", viewonly=True)
+    parts = db.relationship("Part", secondary=incident_parts_archive, lazy="selectin", viewonly=True)
+
+class IncidentCounter(db.Model):
+    """Running incident totals per (dimension, value), e.g. ('status', 'Open').
+
+    Maintained by triggers on the incident table (see app/counters.py) so it
+    changes in the same transaction as every insert, edit and delete.
+    """
+    __tablename__ = "incident_counter"
+
+    dimension = db.Column(db.String(20), primary_key=True)   # total/status/severity/category/customer
+    value = db.Column(db.String(150), primary_key=True)      # '' for NULL and for 'total'
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class AppState(db.Model):
+    """Small integer settings shared by all worker processes, e.g. cache versions."""
+    __tablename__ = "app_state"
+
+    key = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+# ---------------------------------------------------------------------------
+# Reference data behind the incident form's dependent drop-downs
+# ---------------------------------------------------------------------------
+
+class Customer(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), unique=True, nullable=False)
+    position = db.Column(db.Integer, nullable=False, default=0)   # display order
+
+class CustomerOption(db.Model):
+    """A site, location or machine model offered for a customer."""
+    __tablename__ = "customer_option"
+    __table_args__ = (db.UniqueConstraint("customer_id", "kind", "value"),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    customer_id = db.Column(db.Integer, db.ForeignKey("customer.id", ondelete="CASCADE"), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)                # site / location / model
+    value = db.Column(db.String(150), nullable=False)
+    position = db.Column(db.Integer, nullable=False, default=0)
+
+class Machine(db.Model):
+    """A machine serial installed at a site, with its model."""
+    __table_args__ = (db.UniqueConstraint("site_name", "serial"),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    site_name = db.Column(db.String(150), nullable=False)
+    serial = db.Column(db.String(150), nullable=False)
+    model = db.Column(db.String(150))
+
+class FaultCode(db.Model):
+    __tablename__ = "fault_code"
+
+    code = db.Column(db.String(20), primary_key=True)
+    description = db.Column(db.String(255), nullable=False)
+
+# ---------------------------------------------------------------------------
+# Reliability (MTTR/MTBF) projections, refreshed per machine serial
+# ---------------------------------------------------------------------------
+
+class ReliabilityFailure(db.Model):
+    """One failure (non-preventive incident with a serial and start time).
+
+    ``uptime_minutes`` runs from the end of the previous failure on the same
+    serial to this one's start. Rebuilt per serial by app/reliability.py.
+    """
+    __tablename__ = "reliability_failure"
+    __table_args__ = (
+        db.Index("ix_reliability_failure_start_time", "start_time"),
+        db.Index("ix_reliability_failure_serial", "machine_serial"),
+    )
+
+    incident_id = db.Column(db.Integer, primary_key=True)
+    machine_serial = db.Column(db.String(150), nullable=False)
+    machine_model = db.Column(db.String(150))
+    site_name = db.Column(db.String(150))
+    customer_name = db.Column(db.String(100))
+    start_time = db.Column(db.DateTime(timezone=True), nullable=False)
+    downtime_minutes = db.Column(db.Integer)
+    uptime_minutes = db.Column(db.Float)
+
+class ReliabilitySummary(db.Model):
+    """Full-history failure totals per machine serial."""
+    __tablename__ = "reliability_summary"
+
+    machine_serial = db.Column(db.String(150), primary_key=True)
+    machine_model = db.Column(db.String(150))
+    site_name = db.Column(db.String(150))
+    customer_name = db.Column(db.String(100))
+    failures = db.Column(db.Integer, nullable=False)
+    repairs = db.Column(db.Integer, nullable=False)
+    downtime_minutes = db.Column(db.Integer, nullable=False)
+    intervals = db.Column(db.Integer, nullable=False)
+    uptime_minutes = db.Column(db.Float, nullable=False)
+
+class ReliabilityDirty(db.Model):
+    """Serials whose incidents changed since their projections were built."""
+    __tablename__ = "reliability_dirty"
+
+    machine_serial = db.Column(db.String(150), primary_key=True)
+
+class IncidentDaily(db.Model):
+    """Incidents per creation day x customer x site x category x severity.
+
+    Maintained by triggers on the incident table (see app/rollup.py); ''
+    stands for NULL in the key columns.
+    """
+    __tablename__ = "incident_daily"
+
+    day = db.Column(db.String(10), primary_key=True)             # YYYY-MM-DD of created_at
+    customer_name = db.Column(db.String(100), primary_key=True)
+    site_name = db.Column(db.String(150), primary_key=True)
+    category = db.Column(db.String(50), primary_key=True)
+    severity = db.Column(db.String(20), primary_key=True)
+    incidents = db.Column(db.Integer, nullable=False, default=0)
+    resolved = db.Column(db.Integer, nullable=False, default=0)
+    repairs = db.Column(db.Integer, nullable=False, default=0)   # incidents with a downtime
+    downtime_minutes = db.Column(db.Integer, nullable=False, default=0)
+
+class IncidentDailyFault(db.Model):
+    """Incidents per creation day x customer x fault code (see app/rollup.py)."""
+    __tablename__ = "incident_daily_fault"
+
+    day = db.Column(db.String(10), primary_key=True)
+    customer_name = db.Column(db.String(100), primary_key=True)
+    fault_code = db.Column(db.String(20), primary_key=True)
+    incidents = db.Column(db.Integer, nullable=False, default=0)
+    resolved = db.Column(db.Integer, nullable=False, default=0)
+    repairs = db.Column(db.Integer, nullable=False, default=0)
+    downtime_minutes = db.Column(db.Integer, nullable=False, default=0)
+
+class IncidentChange(db.Model):
+    """Latest change sequence number of each incident, deleted ones included.
+
+    Maintained by triggers on incident and incident_parts (see
+    app/changes.py); every write gives the incident a new, higher seq.
+    """
+    __tablename__ = "incident_change"
+    __table_args__ = {"sqlite_autoincrement": True}   # seqs are never reused
+
+    seq = db.Column(db.Integer, primary_key=True)
+    incident_id = db.Column(db.Integer, unique=True, nullable=False)   # no FK: outlives the incident
+    deleted = db.Column(db.Boolean, nullable=False, default=False)
+
+class ExportJob(db.Model):
+    """A background CSV export and where it got to (see app/export_jobs.py)."""
+    __tablename__ = "export_job"
+
+    id = db.Column(db.String(32), primary_key=True)                   # random hex; also the file name
+    status = db.Column(db.String(20), nullable=False, default="queued")  # queued/running/done/failed
+    params = db.Column(db.Text, nullable=False, default="{}")         # JSON list filters and sort
+    rows = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=utcnow.utcnow, nullable=False, index=True)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
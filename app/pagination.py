@@ -0,0 +1,201 @@
+"""
+Keyset (cursor) pagination for the incident list.
+
+Pages are addressed by the (created_at, id) of the row on their edge rather
+than by an OFFSET, so page 5,000 costs the same index seek as page 1. Totals
+are counted separately and cached for a short time per filter combination,
+so paging through a result set does not re-run COUNT(*) on every click.
+"""
+
+import base64
+import binascii
+import json
+import threading
+import time
+from flask import current_app
+from sqlalchemy import Select, String, type_coerce
+from . import db
+from .models import Incident
+
+DEFAULT_PER_PAGE = 10
+
+# created_at as the raw text SQLite stores and sorts by. Comparing on the raw
+# value keeps cursor comparisons consistent with ORDER BY even when rows were
+# written with different datetime string formats.
+_created_key = type_coerce(Incident.created_at, String)
+
+
+class KeysetPage:
+    """One page of a keyset-paginated query."""
+
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None, total=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def clamp_per_page(value):
+    """Clamp a requested page size to 1..INCIDENTS_MAX_PER_PAGE."""
+    limit = current_app.config.get("INCIDENTS_MAX_PER_PAGE", 100)
+    if not value or value < 1:
+        return DEFAULT_PER_PAGE
+    return min(value, limit)
+
+
+def encode_cursor(created_raw, incident_id):
+    payload = json.dumps([created_raw, incident_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """Return (created_raw, id) from a cursor token, or None if it is invalid."""
+    if not token:
+        return None
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        created_raw, incident_id = json.loads(base64.urlsafe_b64decode(padded))
+    except (binascii.Error, ValueError, TypeError):
+        return None
+    if not isinstance(created_raw, str) or not isinstance(incident_id, int):
+        return None
+    return created_raw, incident_id
+
+
+def _keyset(query, created, ident, per_page, after, before, fetch):
+    """Rows of one page of ``query`` newest first, and (has_newer, has_older).
+
+    One extra row is fetched to tell whether another page exists in the
+    direction of travel; the opposite direction is known to exist whenever
+    a cursor was supplied.
+    """
+    key = db.tuple_(created, ident)
+    before_key = decode_cursor(before)
+    after_key = decode_cursor(after) if before_key is None else None
+
+    if before_key is not None:
+        rows = fetch(
+            query.filter(key > before_key)
+            .order_by(created.asc(), ident.asc())
+            .limit(per_page + 1)
+        )
+        return list(reversed(rows[:per_page])), len(rows) > per_page, True
+
+    if after_key is not None:
+        query = query.filter(key < after_key)
+    rows = fetch(query.order_by(created.desc(), ident.desc()).limit(per_page + 1))
+    return rows[:per_page], after_key is not None, len(rows) > per_page
+
+
+def _keyset_page(items, rows, per_page, has_newer, has_older, cursor):
+    next_cursor = prev_cursor = None
+    if rows and has_older:
+        next_cursor = encode_cursor(*cursor(rows[-1]))
+    if rows and has_newer:
+        prev_cursor = encode_cursor(*cursor(rows[0]))
+    return KeysetPage(items, per_page, next_cursor, prev_cursor)
+
+
+def keyset_paginate(query, per_page, after=None, before=None):
+    """Return a KeysetPage of ``query`` ordered newest first.
+
+    ``after`` moves forward (older rows) from a cursor, ``before`` moves back
+    (newer rows).
+    """
+    rows, has_newer, has_older = _keyset(
+        query.add_columns(_created_key), _created_key, Incident.id,
+        per_page, after, before, lambda q: q.all(),
+    )
+    return _keyset_page([r[0] for r in rows], rows, per_page, has_newer, has_older,
+                        lambda r: (r[1], r[0].id))
+
+
+def keyset_paginate_rows(subquery, per_page, after=None, before=None):
+    """keyset_paginate() over a subquery with raw ``created_at`` and ``id`` columns.
+
+    The page's items are the subquery's rows.
+    """
+    rows, has_newer, has_older = _keyset(
+        db.select(subquery), subquery.c.created_at, subquery.c.id,
+        per_page, after, before, lambda q: db.session.execute(q).all(),
+    )
+    return _keyset_page(rows, rows, per_page, has_newer, has_older, lambda r: (r.created_at, r.id))
+
+
+class NumberedPage:
+    """One page of a page-numbered list, like Flask-SQLAlchemy's pagination."""
+
+    def __init__(self, items, page, per_page, total=None):
+        self.items = items
+        self.page = page
+        self.per_page = per_page
+        self.total = total
+
+    @property
+    def pages(self):
+        return -(-self.total // self.per_page) if self.total else 0
+
+    @property
+    def has_prev(self):
+        return self.page > 1
+
+    @property
+    def prev_num(self):
+        return self.page - 1 if self.has_prev else None
+
+    @property
+    def has_next(self):
+        return self.page < self.pages
+
+    @property
+    def next_num(self):
+        return self.page + 1 if self.has_next else None
+
+
+# Process-wide cache of filtered totals: {sql+params: (expires_at, total)}
+_count_cache = {}
+_count_lock = threading.Lock()
+_COUNT_CACHE_SIZE = 256
+
+
+def cached_count(query):
+    """COUNT(*) of ``query`` (an ORM query or a select), cached for INCIDENTS_COUNT_TTL seconds.
+
+    A TTL of 0 disables caching. The total may lag real writes by up to the
+    TTL, which is fine for a "N incidents" label.
+    """
+    ttl = current_app.config.get("INCIDENTS_COUNT_TTL", 30)
+    count_query = query.order_by(None)
+    if isinstance(count_query, Select):
+        statement = count_query
+        count = lambda: db.session.execute(  # noqa: E731
+            db.select(db.func.count()).select_from(statement.subquery())
+        ).scalar()
+    else:
+        statement, count = count_query.statement, count_query.count
+    if not ttl:
+        return count()
+
+    compiled = statement.compile(compile_kwargs={"literal_binds": False})
+    key = (str(compiled), repr(sorted(compiled.params.items())))
+    now = time.monotonic()
+    with _count_lock:
+        hit = _count_cache.get(key)
+        if hit and hit[0] > now:
+            return hit[1]
+
+    total = count()
+    with _count_lock:
+        if len(_count_cache) >= _COUNT_CACHE_SIZE:
+            _count_cache.clear()
+        _count_cache[key] = (now + ttl, total)
+    return total
@@ -0,0 +1,311 @@
+"""
+Parts used on incidents: parsing, linking, typeahead search and analytics.
+
+Every part an incident used is an incident_parts row with a quantity. A
+free-text part that is not in the catalogue gets a Part row the first time
+it is used (matched case-insensitively), so analytics are grouped queries
+over incident_parts instead of parsing the parts_used text.
+
+The incident form looks parts up through /api/parts/search, served from a
+per-process prefix index over the catalogue's name tokens. Writes to the
+part table bump app_state['part_version'] through triggers, and the index
+is rebuilt when that version moves, the same scheme as the reference data.
+"""
+
+import bisect
+import re
+import threading
+from collections import OrderedDict
+from flask import g, has_request_context
+from sqlalchemy import text
+from . import db
+from .counters import incident_data_version
+from .models import AppState, Incident, IncidentPart, Part, incident_archive, incident_parts, incident_parts_archive
+
+# "Belt x2" / "Belt ×2"; no space after the x, so "Screw M6 x 20" stays a name
+_QUANTITY = re.compile(r"^(?P<name>.+?)\s+[x×](?P<qty>\d{1,4})$", re.IGNORECASE)
+
+# Analytics grouping -> incident column (or creation month) of an incident table
+GROUPS = {
+    "month": lambda t: db.func.strftime("%Y-%m", t.c.created_at),
+    "customer": lambda t: t.c.customer_name,
+    "site": lambda t: t.c.site_name,
+    "model": lambda t: t.c.machine_model,
+    "fault_code": lambda t: t.c.fault_code,
+}
+FILTERS = ("customer", "site", "model", "fault_code")
+
+VERSION_KEY = "part_version"
+
+PART_DDL = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS part_version_{event} AFTER {event.upper()} ON part BEGIN
+        INSERT INTO app_state(key, value) VALUES ('{VERSION_KEY}', 1)
+        ON CONFLICT(key) DO UPDATE SET value = value + 1;
+    END
+    """
+    for event in ("insert", "update", "delete")
+]
+
+_TOKEN = re.compile(r"[^\W_]+")
+
+
+def parse_part(entry):
+    """Return (name, quantity) for 'Belt' or 'Belt x2'; None if blank."""
+    entry = " ".join(entry.split())
+    if not entry:
+        return None
+    m = _QUANTITY.match(entry)
+    if m and int(m.group("qty")) > 0:
+        return m.group("name"), int(m.group("qty"))
+    return entry, 1
+
+
+def parse_parts(entries):
+    """Parse a comma-separated string or a list of entries; merge repeats."""
+    if isinstance(entries, str):
+        entries = entries.split(",")
+    merged = {}
+    for entry in entries or ():
+        parsed = parse_part(str(entry))
+        if parsed:
+            name, qty = parsed
+            key = name.lower()
+            prev = merged.get(key)
+            merged[key] = (prev[0] if prev else name, qty + (prev[1] if prev else 0))
+    return list(merged.values())
+
+
+def parts_text(items):
+    """The parts_used display text for [(name, quantity)]."""
+    return ", ".join(name if qty == 1 else f"{name} x{qty}" for name, qty in items) or None
+
+
+def part_catalogue():
+    """Return {lower(name): id} for the parts catalogue."""
+    return {name.lower(): pid for pid, name in db.session.execute(db.select(Part.id, Part.name))}
+
+
+def ensure_parts(names, catalogue=None):
+    """Return {lower(name): id}, inserting Part rows for unknown names.
+
+    ``catalogue`` (see part_catalogue()) is updated in place if given.
+    """
+    catalogue = part_catalogue() if catalogue is None else catalogue
+    missing = {}
+    for name in names:
+        if name.lower() not in catalogue:
+            missing.setdefault(name.lower(), name)
+    if missing:
+        db.session.execute(
+            db.insert(Part).prefix_with("OR IGNORE", dialect="sqlite"),
+            [{"name": name} for name in missing.values()],
+        )
+        rows = db.session.execute(
+            db.select(Part.id, Part.name).where(db.func.lower(Part.name).in_(list(missing)))
+        )
+        catalogue.update({name.lower(): pid for pid, name in rows})
+    return catalogue
+
+
+def install_part_triggers(conn):
+    for ddl in PART_DDL:
+        conn.execute(text(ddl))
+
+
+class PartIndex:
+    """Prefix index over the word tokens of every part name at one version."""
+
+    def __init__(self, version, parts):
+        self.version = version
+        self.parts = sorted(parts, key=lambda p: (p[1].lower(), p[0]))  # [(id, name)]
+        self.names = [name.lower() for _pid, name in self.parts]
+        # Sorted (token, position in self.parts) pairs for bisecting a prefix
+        self.tokens = sorted(
+            (token, n)
+            for n, name in enumerate(self.names)
+            for token in set(_TOKEN.findall(name))
+        )
+
+    def _prefixed(self, prefix):
+        """Positions of parts with a token starting with ``prefix``."""
+        found = set()
+        i = bisect.bisect_left(self.tokens, (prefix,))
+        while i < len(self.tokens) and self.tokens[i][0].startswith(prefix):
+            found.add(self.tokens[i][1])
+            i += 1
+        return found
+
+    def search(self, query, limit=20):
+        """Return up to ``limit`` (id, name) pairs matching every query word.
+
+        Exact names rank first, then names starting with the query, then
+        names whose first word starts with the first query word, then the
+        rest; shorter names first within each group.
+        """
+        query = " ".join(query.lower().split())
+        words = _TOKEN.findall(query)
+        if not words:
+            return self.parts[:limit]
+        matches = None
+        for word in sorted(set(words), key=len, reverse=True):
+            found = self._prefixed(word)
+            matches = found if matches is None else matches & found
+            if not matches:
+                return []
+        first = words[0]
+
+        def rank(n):
+            name = self.names[n]
+            if name == query:
+                group = 0
+            elif name.startswith(query):
+                group = 1
+            elif name.startswith(first):
+                group = 2
+            else:
+                group = 3
+            return group, len(name), n
+
+        return [self.parts[n] for n in sorted(matches, key=rank)[:limit]]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def part_version():
+    """Return the part catalogue version, read at most once per request."""
+    if has_request_context() and "part_version" in g:
+        return g.part_version
+    version = db.session.execute(
+        db.select(AppState.value).where(AppState.key == VERSION_KEY)
+    ).scalar() or 0
+    if has_request_context():
+        g.part_version = version
+    return version
+
+
+def get_part_index():
+    """Return the PartIndex, rebuilding it only when the part version moved."""
+    global _index
+    version = part_version()
+    index = _index
+    if index is None or index.version != version:
+        with _index_lock:
+            index = _index
+            if index is None or index.version != version:
+                index = _index = PartIndex(version, db.session.execute(db.select(Part.id, Part.name)).all())
+    return index
+
+
+def set_incident_parts(incident, selected, other=""):
+    """Replace an incident's parts from the form.
+
+    ``selected`` holds part ids from the multi-select (or new names typed
+    into it); ``other`` is the free-text field, where 'Belt x2' sets a
+    quantity. The links and the parts_used text are both updated.
+    """
+    # No flush of the incident's pending edits halfway: one UPDATE per save
+    with db.session.no_autoflush:
+        ids = [int(v) for v in selected if str(v).isdigit()]
+        names = {pid: name for pid, name in db.session.execute(
+            db.select(Part.id, Part.name).where(Part.id.in_(ids))
+        )} if ids else {}
+        items = parse_parts([names[pid] for pid in ids if pid in names] +
+                            [v for v in selected if v and not str(v).isdigit()] +
+                            (other or "").split(","))
+        catalogue = ensure_parts([name for name, _qty in items])
+        incident.usage = [IncidentPart(part_id=catalogue[name.lower()], quantity=qty) for name, qty in items]
+        incident.parts_used = parts_text(items)
+
+
+def split_for_form(incident):
+    """Return (selected ids, other text) to pre-fill the edit form.
+
+    Parts used once are selected in the multi-select; larger quantities go
+    to the free-text field as 'Name xN' so they survive a round trip.
+    """
+    usage = sorted(incident.usage, key=lambda u: u.part.name.lower())
+    selected = [str(u.part_id) for u in usage if u.quantity == 1]
+    other = parts_text([(u.part.name, u.quantity) for u in usage if u.quantity != 1])
+    return selected, other or ""
+
+
+def _usage(by, start, end, filters):
+    """Part links with their group key, of live and archived incidents alike."""
+    selects = []
+    for links, incidents in ((incident_parts, Incident.__table__), (incident_parts_archive, incident_archive)):
+        key = GROUPS[by](incidents) if by else db.literal(None)
+        query = (
+            db.select(key.label("key"), links.c.part_id, links.c.quantity)
+            .select_from(links.join(incidents, incidents.c.id == links.c.incident_id))
+        )
+        if start:
+            query = query.where(incidents.c.created_at >= start)
+        if end:
+            query = query.where(incidents.c.created_at < end)
+        for name, value in filters:
+            query = query.where(GROUPS[name](incidents) == value)
+        selects.append(query)
+    return db.union_all(*selects).subquery("usage")
+
+
+def _top_parts_query(by, start, end, filters, limit):
+    usage = _usage(by, start, end, filters)
+    quantity = db.func.sum(usage.c.quantity).label("quantity")
+    grouped = (
+        db.select(
+            usage.c.key,
+            usage.c.part_id,
+            quantity,
+            db.func.count().label("incidents"),
+            db.func.row_number().over(
+                partition_by=usage.c.key if by else None,
+                order_by=(quantity.desc(), usage.c.part_id),
+            ).label("rank"),
+        )
+        .group_by(usage.c.key, usage.c.part_id)
+        .subquery()
+    )
+    return (
+        db.select(grouped.c.key, grouped.c.part_id, Part.name, grouped.c.quantity, grouped.c.incidents)
+        .join(Part, Part.id == grouped.c.part_id)
+        .where(grouped.c.rank <= limit)
+        .order_by(grouped.c.key, grouped.c.rank)
+    )
+
+
+_cache = OrderedDict()
+_CACHE_SIZE = 64
+_lock = threading.Lock()
+
+
+def top_parts(by=None, start=None, end=None, filters=None, limit=10):
+    """Most-used parts, overall or per ``by`` group.
+
+    Returns rows ``{"key", "part_id", "part", "quantity", "incidents"}``,
+    at most ``limit`` per group, largest quantity first. ``start``/``end``
+    bound incident creation times (end exclusive); ``filters`` maps FILTERS
+    names to required values. Archived incidents count too. Cached per
+    incident data version (relinking parts rewrites parts_used, which moves
+    the version).
+    """
+    if by is not None and by not in GROUPS:
+        raise ValueError(f"Unknown grouping {by!r}")
+    filters = tuple(sorted((k, v) for k, v in (filters or {}).items() if v))
+    key = (incident_data_version(), by, start, end, filters, limit)
+    with _lock:
+        hit = _cache.get(key)
+        if hit is not None:
+            _cache.move_to_end(key)
+            return hit
+    rows = [
+        {"key": r.key, "part_id": r.part_id, "part": r.name, "quantity": r.quantity, "incidents": r.incidents}
+        for r in db.session.execute(_top_parts_query(by, start, end, filters, limit))
+    ]
+    with _lock:
+        _cache[key] = rows
+        while len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+    return rows
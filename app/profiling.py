@@ -0,0 +1,115 @@
+"""
+Opt-in per-request SQL and timing instrumentation.
+
+With SQL_PROFILING on, every statement a request runs is counted and timed
+through SQLAlchemy engine events. Each response gets a Server-Timing header
+(``db`` and ``app`` time, visible in the browser's network panel), and a
+structured JSON line is logged when the request was slow, ran a slow
+statement, or repeated one statement shape often enough to look like an N+1
+loop.
+
+Streamed responses (the CSV export) are measured up to the point the
+headers are sent; statements run while the body streams are not included.
+"""
+
+import json
+import re
+import time
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from . import db
+from .storage import readonly_engine
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+class RequestStats:
+    """SQL statements run during one request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.shapes = {}  # statement text -> times run
+        self.slow = []  # (ms, statement)
+
+    def record(self, statement, seconds, slow_ms):
+        self.queries += 1
+        self.db_seconds += seconds
+        self.shapes[statement] = self.shapes.get(statement, 0) + 1
+        if seconds * 1000 >= slow_ms:
+            self.slow.append((round(seconds * 1000, 2), statement))
+
+    def repeated(self, threshold):
+        """Statements run at least ``threshold`` times (likely N+1 loops)."""
+        return sorted(
+            ((n, sql) for sql, n in self.shapes.items() if n >= threshold),
+            reverse=True,
+        )
+
+
+def _normalise(statement, limit=300):
+    statement = _WHITESPACE.sub(" ", statement).strip()
+    return statement if len(statement) <= limit else statement[:limit] + "..."
+
+
+def instrument_engine(engine, slow_ms):
+    """Attribute statements run on ``engine`` to the current request."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        if has_request_context() and "sql_stats" in g:
+            g.sql_stats.record(_normalise(statement), elapsed, slow_ms)
+
+
+def init_profiling(app):
+    """Register the request hooks and engine listeners if SQL_PROFILING is on."""
+    if not app.config["SQL_PROFILING"]:
+        return
+
+    slow_query_ms = app.config["SLOW_QUERY_MS"]
+    slow_request_ms = app.config["SLOW_REQUEST_MS"]
+    n_plus_one = app.config["N_PLUS_ONE_THRESHOLD"]
+
+    with app.app_context():
+        instrument_engine(db.engine, slow_query_ms)
+        readonly = readonly_engine(app)
+        if readonly is not None and readonly is not db.engine:
+            instrument_engine(readonly, slow_query_ms)
+
+    @app.before_request
+    def _start_stats():
+        g.sql_stats = RequestStats()
+
+    @app.after_request
+    def _report_stats(response):
+        stats = g.pop("sql_stats", None)
+        if stats is None:
+            return response
+        total_ms = (time.perf_counter() - stats.started) * 1000
+        db_ms = stats.db_seconds * 1000
+        response.headers.add(
+            "Server-Timing",
+            f'db;dur={db_ms:.1f};desc="{stats.queries} queries", app;dur={total_ms - db_ms:.1f}',
+        )
+
+        repeated = stats.repeated(n_plus_one)
+        if total_ms >= slow_request_ms or stats.slow or repeated:
+            app.logger.warning(json.dumps({
+                "event": "slow_request",
+                "method": request.method,
+                "path": request.full_path.rstrip("?"),
+                "endpoint": request.endpoint,
+                "status": response.status_code,
+                "duration_ms": round(total_ms, 2),
+                "db_ms": round(db_ms, 2),
+                "queries": stats.queries,
+                "slow_queries": [{"ms": ms, "sql": sql} for ms, sql in stats.slow],
+                "n_plus_one": [{"count": n, "sql": sql} for n, sql in repeated],
+            }))
+        return response
@@ -0,0 +1,208 @@
+"""
+Reference data registry for the incident form.
+
+Customers with their sites, locations and machine models, the machine
+serials at each site, and the fault-code table live in the database
+(models Customer, CustomerOption, Machine, FaultCode). Any write to those
+tables bumps app_state['reference_version'] through triggers.
+
+Each process keeps one parsed snapshot plus its pre-serialised JSON. A
+request only reads the version row and reloads when another process (or the
+CLI) has changed the data. The form fetches the JSON once per version from
+/api/reference, so browsers can cache it instead of getting it inlined into
+every render.
+"""
+
+import json
+import threading
+from flask import g
+from sqlalchemy import text
+from . import db
+from .models import AppState, Customer, CustomerOption, Machine, FaultCode
+
+VERSION_KEY = "reference_version"
+
+_REFERENCE_TABLES = ("customer", "customer_option", "machine", "fault_code")
+
+
+def _bump(table, event):
+    return f"""
+    CREATE TRIGGER IF NOT EXISTS {table}_version_{event} AFTER {event.upper()} ON {table} BEGIN
+        INSERT INTO app_state(key, value) VALUES ('{VERSION_KEY}', 1)
+        ON CONFLICT(key) DO UPDATE SET value = value + 1;
+    END
+    """
+
+
+REFERENCE_DDL = [_bump(t, e) for t in _REFERENCE_TABLES for e in ("insert", "update", "delete")]
+
+
+class ReferenceData:
+    """Read-only snapshot of the reference tables at one version."""
+
+    def __init__(self, version, customer_map, fault_map, site_serial_map):
+        self.version = version
+        self.customer_map = customer_map
+        self.fault_map = fault_map
+        self.site_serial_map = site_serial_map
+        self.json = json.dumps({
+            "version": version,
+            "customer_map": customer_map,
+            "fault_map": fault_map,
+            "site_serial_map": site_serial_map,
+        }, separators=(",", ":"))
+        self._serials = {
+            site: {serial: model for serial, model in pairs}
+            for site, pairs in site_serial_map.items()
+        }
+
+    @property
+    def customers(self):
+        return self.customer_map["customers"]
+
+    def sites_for(self, customer):
+        return self.customer_map["sites"].get(customer, [])
+
+    def locations_for(self, customer):
+        return self.customer_map["locations"].get(customer, [])
+
+    def models_for(self, customer):
+        return self.customer_map["models"].get(customer, [])
+
+    def all_models(self):
+        return sorted({m for models in self.customer_map["models"].values() for m in models})
+
+    def serials_for(self, site):
+        return list(self._serials.get(site, {}))
+
+    def model_for(self, site, serial):
+        return self._serials.get(site, {}).get(serial)
+
+    def fault_descriptions(self):
+        return sorted(set(self.fault_map.values()))
+
+    def validate(self, customer, site=None, location=None, model=None, serial=None,
+                 fault_code=None, fault=None):
+        """Check a customer/site/machine/fault combination.
+
+        Returns {field_name: message} for every rule broken; empty if valid.
+        Field names match IncidentForm so callers can attach the messages.
+        """
+        errors = {}
+        if customer not in self.customers:
+            errors["customer_name"] = "Invalid customer selection."
+        if site and site not in self.sites_for(customer):
+            errors["site_name"] = "Invalid site for selected customer."
+        if location and location not in self.locations_for(customer):
+            errors["location"] = "Invalid location for selected customer."
+        if model and model not in self.models_for(customer):
+            errors["machine_model"] = "Invalid machine model for selected customer."
+        if serial and serial not in self._serials.get(site, {}):
+            errors["machine_serial"] = "Invalid serial for selected site."
+        if fault_code:
+            expected = self.fault_map.get(fault_code)
+            if not expected:
+                errors["fault_code"] = "Unknown fault code."
+            elif fault and fault != expected:
+                errors["fault"] = "Fault description doesn't match the selected code."
+        return errors
+
+
+_cached = None
+_lock = threading.Lock()
+
+
+def current_version():
+    """Return the reference data version from app_state (0 if unset)."""
+    return db.session.execute(
+        db.select(AppState.value).where(AppState.key == VERSION_KEY)
+    ).scalar() or 0
+
+
+def _load(version):
+    customers = Customer.query.order_by(Customer.position, Customer.name).all()
+    names = {c.id: c.name for c in customers}
+    customer_map = {
+        "customers": [c.name for c in customers],
+        "sites": {c.name: [] for c in customers},
+        "locations": {c.name: [] for c in customers},
+        "models": {c.name: [] for c in customers},
+    }
+    kinds = {"site": "sites", "location": "locations", "model": "models"}
+    options = CustomerOption.query.order_by(CustomerOption.position, CustomerOption.id).all()
+    for opt in options:
+        customer_map[kinds[opt.kind]][names[opt.customer_id]].append(opt.value)
+
+    site_serial_map = {}
+    for m in Machine.query.order_by(Machine.site_name, Machine.id).all():
+        site_serial_map.setdefault(m.site_name, []).append([m.serial, m.model])
+
+    fault_map = {f.code: f.description for f in FaultCode.query.order_by(FaultCode.code).all()}
+    return ReferenceData(version, customer_map, fault_map, site_serial_map)
+
+
+def get_reference():
+    """Return the current ReferenceData, reloading only when the version moved.
+
+    The version is checked at most once per request.
+    """
+    global _cached
+    if "reference" in g:
+        return g.reference
+    version = current_version()
+    ref = _cached
+    if ref is None or ref.version != version:
+        with _lock:
+            ref = _cached
+            if ref is None or ref.version != version:
+                ref = _cached = _load(version)
+    g.reference = ref
+    return ref
+
+
+def install_reference_triggers(conn):
+    for ddl in REFERENCE_DDL:
+        conn.execute(text(ddl))
+
+
+def load_reference(conn, customer_map, fault_map, site_serial_map):
+    """Replace the contents of the reference tables with the given maps.
+
+    The maps use the same shape as /api/reference. The triggers bump the
+    version, so every process picks up the new data on its next request.
+    """
+    for table in ("customer_option", "customer", "machine", "fault_code"):
+        conn.execute(text(f"DELETE FROM {table}"))
+
+    for pos, name in enumerate(customer_map["customers"]):
+        customer_id = conn.execute(
+            db.insert(Customer).values(name=name, position=pos).returning(Customer.id)
+        ).scalar_one()
+        options = [
+            {"customer_id": customer_id, "kind": kind, "value": value, "position": opt_pos}
+            for kind, key in (("site", "sites"), ("location", "locations"), ("model", "models"))
+            for opt_pos, value in enumerate(dict.fromkeys(customer_map[key].get(name, [])))
+        ]
+        if options:
+            conn.execute(db.insert(CustomerOption), options)
+
+    machines = {}
+    for site, pairs in site_serial_map.items():
+        for serial, model in pairs:
+            machines.setdefault((site, serial), model)
+    if machines:
+        conn.execute(db.insert(Machine), [
+            {"site_name": site, "serial": serial, "model": model}
+            for (site, serial), model in machines.items()
+        ])
+
+    if fault_map:
+        conn.execute(db.insert(FaultCode), [
+            {"code": code, "description": description} for code, description in fault_map.items()
+        ])
+
+
+def load_default_reference(conn):
+    """Load app/reference_data.py into the reference tables."""
+    from .reference_data import CUSTOMER_MAP, FAULT_MAP, SITE_SERIAL_MAP
+    load_reference(conn, CUSTOMER_MAP, FAULT_MAP, SITE_SERIAL_MAP)
@@ -0,0 +1,108 @@
+# app/reference_data.py
+# Default customer / site / machine / fault-code reference data.
+# Loaded into the reference tables by migration 4 when they are empty;
+# after that the database is the source of truth (see app/reference.py).
+
+CUSTOMER_MAP = {
+    "customers": ["VLTX", "Bol", "Bank Muscat", "TransG"],
+    "sites": {
+        "VLTX": ["Birmingham","London Kings Cross","Tonbridge","Bristol","Woolston","Kilmarnock","Washington"],
+        "Bol": ["Belfast"],
+        "Bank Muscat": ["Muscat"],
+        "TransG": ["Dubai"]
+    },
+    "locations": {
+        "VLTX": ["United Kingdom"],
+        "Bol": ["United Kingdom"],
+        "Bank Muscat": ["Oman"],
+        "TransG": ["UAE"]
+    },
+    "models": {
+        "VLTX": ["7000","V-Series","Cobra"],
+        "Bol": ["7000"],
+        "Bank Muscat": ["7000","V-Series"],
+        "TransG": ["7000"]
+    }
+}
+
+FAULT_MAP = {
+    # code -> description
+    "1CC": "Feedscan Module Card Cage",
+    "1C":  "Feedscan Module Customer",
+    "1D":  "Feedscan Module Detector Name",
+    "1E":  "Feedscan Module Electrical",
+    "1F":  "Feedscan Module Feeder",
+    "1FO": "Feedscan Module Foreign Objects",
+    "1M":  "Feedscan Module Mechanical",
+    "8D":  "Miscellaneous DLR",
+    "8C":  "Miscellaneous Valtex",
+    "6D":  "Network System DLR",
+    "6S":  "Network System SCM",
+    "9FO": "PM (Foreign Object Found)",
+    "10E":"Software Error Message",
+    "3C": "Stacker Module Customer",
+    "3E": "Stacker Module Electrical",
+    "3FO":"Stacker Module Foreign Object",
+    "3M": "Stacker Module Mechanical",
+    "4E2":"Strapper Pocket Electrical",
+    "4E3":"Strapper Pocket Electrical",
+    "4E4":"Strapper Pocket Electrical",
+    "4E6":"Strapper Pocket Electrical",
+    "4E7":"Strapper Pocket Electrical",
+    "4E8":"Strapper Pocket Electrical",
+    "4E9":"Strapper Pocket Electrical",
+    "4E10":"Strapper Pocket Electrical",
+    "4E12":"Strapper Pocket Electrical",
+    "4FO1":"Strapper Pocket Foreign Object",
+    "4FO2":"Strapper Pocket Foreign Object",
+    "4FO3":"Strapper Pocket Foreign Object",
+    "4FO7":"Strapper Pocket Foreign Object",
+    "4FO9":"Strapper Pocket Foreign Object",
+    "4FO9B":"Strapper Pocket Foreign Object",
+    "4F010":"Strapper Pocket Foreign Object",
+    "4F011":"Strapper Pocket Foreign Object",
+    "4M5":"Strapper Pocket Mechanical",
+    "4M6":"Strapper Pocket Mechanical",
+    "4M7":"Strapper Pocket Mechanical",
+    "4M8":"Strapper Pocket Mechanical",
+    "4M9":"Strapper Pocket Mechanical",
+    "4P1":"Strapper Pocket Pneumatic",
+    "4P10":"Strapper Pocket Pneumatic",
+    "4P11":"Strapper Pocket Pneumatic",
+    "4P12":"Strapper Pocket Pneumatic",
+    "4P2":"Strapper Pocket Pneumatic",
+    "4P3":"Strapper Pocket Pneumatic",
+    "4P4":"Strapper Pocket Pneumatic",
+    "4P5":"Strapper Pocket Pneumatic",
+    "4P6":"Strapper Pocket Pneumatic",
+    "4P9":"Strapper Pocket Pneumatic",
+    "5A":"System Air",
+    "5C":"System Customer",
+    "5D":"System DLR",
+    "5E":"System Electrical"
+}
+
+SITE_SERIAL_MAP = {
+    "Birmingham": [
+        ("BIRM27", "7000"),
+        ("BIRM30", "7000"),
+        ("BIRM35", "7000"),
+        ("BIRMV01", "V-Series"),
+        ("BIRMV05", "V-Series"),
+    ],
+    "Bristol": [
+        ("BRIS28", "7000"),
+        ("BRIS31", "7000"),
+        ("BRISV02", "V-Series"),
+    ],
+    "Kilmarnock": [
+        ("KILM105", "Cobra"),
+        ("KILM29", "7000"),
+        ("KILM33", "7000"),
+    ],
+    "London Kings Cross": [
+        ("LOND24", "7000"),
+        ("LOND32", "7000"),
+    ]
+    # Add more sites/rows here as needed
+}
@@ -0,0 +1,276 @@
+"""
+Reliability metrics: mean time to repair (MTTR) and mean time between
+failures (MTBF) per machine serial, machine model, site or customer.
+
+A failure is an incident with a machine serial and a start time that is not
+preventive maintenance. A window function walks each serial's failures in
+start_time order and LAG() gives the end of the previous one; the up-time
+in between is one MTBF interval, and the stored downtime_minutes of a
+closed failure is one repair.
+
+The window results are kept in two tables so reads never re-run the window
+over the whole history:
+
+* reliability_failure: one row per failure with its up-time interval,
+  indexed by start_time for date-range windows;
+* reliability_summary: full-history totals per serial, a few thousand rows
+  however many incidents there are.
+
+Incident triggers put the serial of every relevant write in
+reliability_dirty, and refresh() recomputes just those serials, over live
+and archived incidents, on the write path: after every session commit and
+after each archive batch. Reads never write, so /reliability runs on the
+read-only engine. Results are cached per incident data version, unless
+they were read while serials were still waiting for their refresh.
+"""
+
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from flask import has_app_context
+from sqlalchemy import event, text
+from . import db
+from .archive import ALL_INCIDENTS
+from .counters import incident_data_version
+from .models import ReliabilityDirty, ReliabilityFailure, ReliabilitySummary
+from .storage import RoutingSession
+
+# Grouping name -> column name in both projection tables
+GROUPS = {
+    "serial": "machine_serial",
+    "model": "machine_model",
+    "site": "site_name",
+    "customer": "customer_name",
+}
+SORTS = ("failures", "mttr", "mtbf", "downtime")
+
+# Serials recomputed per statement
+REFRESH_BATCH = 500
+
+_MARK = (
+    "INSERT OR IGNORE INTO reliability_dirty(machine_serial) "
+    "SELECT {row}.machine_serial WHERE coalesce({row}.machine_serial, '') != '';"
+)
+
+RELIABILITY_DDL = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS incident_reliability_ai AFTER INSERT ON incident BEGIN
+        {_MARK.format(row='new')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS incident_reliability_ad AFTER DELETE ON incident BEGIN
+        {_MARK.format(row='old')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS incident_reliability_au
+    AFTER UPDATE OF machine_serial, machine_model, site_name, customer_name,
+                    start_time, end_time, preventive_maintenance ON incident BEGIN
+        {_MARK.format(row='old')}
+        {_MARK.format(row='new')}
+    END
+    """,
+]
+
+_FAILURES_SQL = """
+INSERT INTO reliability_failure (
+    incident_id, machine_serial, machine_model, site_name, customer_name,
+    start_time, downtime_minutes, uptime_minutes)
+SELECT id, machine_serial, machine_model, site_name, customer_name, start_time, downtime_minutes,
+       max(0, (julianday(start_time) - julianday(lag(coalesce(end_time, start_time)) OVER w)) * 1440)
+FROM {incidents}
+WHERE machine_serial IN ({serials})
+  AND start_time IS NOT NULL
+  AND NOT coalesce(preventive_maintenance, 0)
+WINDOW w AS (PARTITION BY machine_serial ORDER BY start_time, id)
+"""
+
+_SUMMARY_SQL = """
+INSERT INTO reliability_summary (
+    machine_serial, machine_model, site_name, customer_name,
+    failures, repairs, downtime_minutes, intervals, uptime_minutes)
+SELECT machine_serial, max(machine_model), max(site_name), max(customer_name),
+       count(*), count(downtime_minutes), coalesce(sum(downtime_minutes), 0),
+       count(uptime_minutes), coalesce(sum(uptime_minutes), 0)
+FROM reliability_failure
+WHERE machine_serial IN ({serials})
+GROUP BY machine_serial
+"""
+
+
+def install_reliability_triggers(conn):
+    for ddl in RELIABILITY_DDL:
+        conn.execute(text(ddl))
+
+
+def _recompute(conn, serials):
+    for i in range(0, len(serials), REFRESH_BATCH):
+        batch = serials[i:i + REFRESH_BATCH]
+        params = {f"s{n}": s for n, s in enumerate(batch)}
+        in_list = ", ".join(f":{name}" for name in params)
+        for table in ("reliability_failure", "reliability_summary"):
+            conn.execute(text(f"DELETE FROM {table} WHERE machine_serial IN ({in_list})"), params)
+        conn.execute(text(_FAILURES_SQL.format(incidents=ALL_INCIDENTS, serials=in_list)), params)
+        conn.execute(text(_SUMMARY_SQL.format(serials=in_list)), params)
+
+
+def refresh(conn):
+    """Recompute the serials marked dirty; return how many there were.
+
+    Run it as the first statement of a transaction: claiming the dirty rows
+    is a write, so concurrent refreshes queue behind each other instead of
+    redoing the same serials.
+    """
+    serials = conn.execute(text("DELETE FROM reliability_dirty RETURNING machine_serial")).scalars().all()
+    if serials:
+        _recompute(conn, serials)
+    return len(serials)
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _refresh_after_commit(session):
+    if not has_app_context():
+        return
+    with db.engine.connect() as conn:
+        if conn.execute(db.select(ReliabilityDirty.machine_serial).limit(1)).first() is None:
+            return
+    with db.engine.begin() as conn:
+        refresh(conn)
+
+
+def rebuild_reliability(conn):
+    """Recompute both projection tables from the incidents, archived ones included."""
+    conn.execute(text("DELETE FROM reliability_dirty"))
+    conn.execute(text("DELETE FROM reliability_failure"))
+    conn.execute(text("DELETE FROM reliability_summary"))
+    serials = conn.execute(text(
+        f"SELECT DISTINCT machine_serial FROM {ALL_INCIDENTS} WHERE coalesce(machine_serial, '') != ''"
+    )).scalars().all()
+    _recompute(conn, serials)
+
+
+def parse_window_bound(value, end=False):
+    """Parse 'YYYY-MM-DD' or 'YYYY-MM-DDTHH:MM'; a bare end date includes that day.
+
+    Returns None for an empty value; raises ValueError for anything else
+    that doesn't parse.
+    """
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.strip().replace("T", " "))
+    except ValueError:
+        raise ValueError(f"Not a date like YYYY-MM-DD or YYYY-MM-DDTHH:MM: {value!r}")
+    if end and len(value.strip()) == 10:
+        parsed += timedelta(days=1)
+    return parsed
+
+
+def _query(by, start, end):
+    if start or end:
+        table = ReliabilityFailure
+        totals = [
+            db.func.count().label("failures"),
+            db.func.count(table.downtime_minutes).label("repairs"),
+            db.func.coalesce(db.func.sum(table.downtime_minutes), 0).label("downtime"),
+            db.func.count(table.uptime_minutes).label("intervals"),
+            db.func.coalesce(db.func.sum(table.uptime_minutes), 0).label("uptime"),
+        ]
+    else:
+        table = ReliabilitySummary
+        totals = [
+            db.func.sum(table.failures).label("failures"),
+            db.func.sum(table.repairs).label("repairs"),
+            db.func.sum(table.downtime_minutes).label("downtime"),
+            db.func.sum(table.intervals).label("intervals"),
+            db.func.sum(table.uptime_minutes).label("uptime"),
+        ]
+    key = getattr(table, GROUPS[by])
+    columns = [key.label("key"), *totals, db.func.count(db.distinct(table.machine_serial)).label("machines")]
+    if by == "serial":
+        columns += [db.func.max(table.machine_model).label("machine_model"),
+                    db.func.max(table.site_name).label("site_name"),
+                    db.func.max(table.customer_name).label("customer_name")]
+    query = db.select(*columns).group_by(key)
+    if start:
+        query = query.where(table.start_time >= start)
+    if end:
+        query = query.where(table.start_time < end)
+    return query
+
+
+def _compute(by, start, end):
+    rows = []
+    for r in db.session.execute(_query(by, start, end)):
+        row = {
+            "key": r.key,
+            "machines": r.machines,
+            "failures": r.failures,
+            "repairs": r.repairs,
+            "downtime_minutes": int(r.downtime),
+            "intervals": r.intervals,
+            "uptime_minutes": round(r.uptime, 1),
+            "mttr_minutes": round(r.downtime / r.repairs, 1) if r.repairs else None,
+            "mtbf_minutes": round(r.uptime / r.intervals, 1) if r.intervals else None,
+        }
+        if by == "serial":
+            row.update(machine_model=r.machine_model, site_name=r.site_name, customer_name=r.customer_name)
+        rows.append(row)
+    return rows
+
+
+def _fleet(rows):
+    """Fleet-wide totals from grouped rows (pooled, not a mean of means)."""
+    total = {k: sum(r[k] for r in rows) for k in ("machines", "failures", "repairs", "intervals")}
+    downtime = sum(r["downtime_minutes"] for r in rows)
+    uptime = sum(r["uptime_minutes"] for r in rows)
+    total.update(
+        downtime_minutes=downtime,
+        uptime_minutes=round(uptime, 1),
+        mttr_minutes=round(downtime / total["repairs"], 1) if total["repairs"] else None,
+        mtbf_minutes=round(uptime / total["intervals"], 1) if total["intervals"] else None,
+    )
+    return total
+
+
+_cache = OrderedDict()
+_CACHE_SIZE = 64
+_lock = threading.Lock()
+
+
+def reliability(by="model", start=None, end=None):
+    """Return {"version", "rows", "fleet"} for one grouping and date window.
+
+    ``start``/``end`` bound the failure start times (end exclusive). Up-time
+    intervals are measured from the previous failure even if it falls
+    before ``start``. Rows are unsorted; see sort_rows().
+    """
+    if by not in GROUPS:
+        raise ValueError(f"Unknown grouping {by!r}")
+    version = incident_data_version()
+    key = (version, by, start, end)
+    with _lock:
+        hit = _cache.get(key)
+        if hit is not None:
+            _cache.move_to_end(key)
+            return hit
+    rows = _compute(by, start, end)
+    result = {"version": version, "rows": rows, "fleet": _fleet(rows)}
+    # A write committed but not yet refreshed: serve the rows as they are,
+    # but let the next request read them again
+    if db.session.execute(db.select(ReliabilityDirty.machine_serial).limit(1)).first() is not None:
+        return result
+    with _lock:
+        _cache[key] = result
+        while len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+    return result
+
+
+def sort_rows(rows, sort="failures"):
+    """Worst first: most failures/downtime, longest MTTR, shortest MTBF."""
+    if sort == "mtbf":
+        return sorted(rows, key=lambda r: (r["mtbf_minutes"] is None, r["mtbf_minutes"] or 0))
+    field = {"failures": "failures", "mttr": "mttr_minutes", "downtime": "downtime_minutes"}[sort]
+    return sorted(rows, key=lambda r: r[field] or 0, reverse=True)
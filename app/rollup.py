@@ -0,0 +1,154 @@
+"""
+Daily incident rollups for trend reporting.
+
+incident_daily holds one row per creation day x customer x site x category
+x severity, and incident_daily_fault one per day x customer x fault code,
+each with the number of incidents, how many of them are resolved, and
+their repair downtime. Triggers move an incident's contribution from its
+old key to its new one whenever it is created, edited, closed or deleted,
+in the same transaction as the write, so a trend over years of history
+reads a few thousand rollup rows rather than the incident table. Moving an
+incident to the archive leaves its contribution in place.
+"""
+
+from datetime import date, timedelta
+from sqlalchemy import text
+from . import db
+from .archive import ALL_INCIDENTS, NOT_ARCHIVED
+from .models import IncidentDaily, IncidentDailyFault
+
+# rollup table -> key columns after the day
+ROLLUPS = {
+    "incident_daily": ("customer_name", "site_name", "category", "severity"),
+    "incident_daily_fault": ("customer_name", "fault_code"),
+}
+
+# Incident columns a rollup row depends on
+WATCHED = ("created_at", "customer_name", "site_name", "category", "severity",
+           "fault_code", "status", "start_time", "end_time")
+
+MEASURES = ("incidents", "resolved", "repairs", "downtime_minutes")
+
+# Trend dimension -> rollup column
+DIMENSIONS = {
+    "customer": "customer_name",
+    "site": "site_name",
+    "category": "category",
+    "severity": "severity",
+    "fault_code": "fault_code",
+}
+
+# Bucket size -> SQL expression over the day column
+INTERVALS = {
+    "day": "{day}",
+    "week": "date({day}, '-6 days', 'weekday 1')",   # Monday of the week
+    "month": "substr({day}, 1, 7)",
+}
+
+MAX_DAYS = 3660
+
+
+def _upsert(table, row, sign):
+    """Statement adding ``row`` ('new' or 'old') to ``table`` with ``sign``."""
+    keys = ROLLUPS[table]
+    columns = ", ".join(("day",) + keys + MEASURES)
+    key_values = ", ".join(f"coalesce({row}.{k}, '')" for k in keys)
+    updates = ", ".join(f"{m} = {m} + excluded.{m}" for m in MEASURES)
+    return f"""
+        INSERT INTO {table}({columns})
+        SELECT date({row}.created_at), {key_values},
+               {sign}, {sign} * ({row}.status = 'Resolved'),
+               {sign} * ({row}.downtime_minutes IS NOT NULL),
+               {sign} * coalesce({row}.downtime_minutes, 0)
+        WHERE {row}.created_at IS NOT NULL
+        ON CONFLICT(day, {", ".join(keys)}) DO UPDATE SET {updates};"""
+
+
+ROLLUP_DDL = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS incident_rollup_ai AFTER INSERT ON incident BEGIN
+        {"".join(_upsert(t, "new", 1) for t in ROLLUPS)}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS incident_rollup_ad AFTER DELETE ON incident
+    WHEN {NOT_ARCHIVED} BEGIN
+        {"".join(_upsert(t, "old", -1) for t in ROLLUPS)}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS incident_rollup_au
+    AFTER UPDATE OF {", ".join(WATCHED)} ON incident BEGIN
+        {"".join(_upsert(t, "old", -1) + _upsert(t, "new", 1) for t in ROLLUPS)}
+    END
+    """,
+]
+
+
+def install_rollup_triggers(conn):
+    for ddl in ROLLUP_DDL:
+        conn.execute(text(ddl))
+
+
+def rebuild_rollups(conn):
+    """Recompute both rollup tables from the incidents, archived ones included."""
+    for table, keys in ROLLUPS.items():
+        key_values = ", ".join(f"coalesce({k}, '')" for k in keys)
+        group_by = ", ".join(str(n) for n in range(1, len(keys) + 2))
+        conn.execute(text(f"DELETE FROM {table}"))
+        conn.execute(text(
+            f"INSERT INTO {table}(day, {', '.join(keys)}, {', '.join(MEASURES)}) "
+            f"SELECT date(created_at), {key_values}, count(*), sum(status = 'Resolved'), "
+            "count(downtime_minutes), coalesce(sum(downtime_minutes), 0) "
+            f"FROM {ALL_INCIDENTS} WHERE created_at IS NOT NULL GROUP BY {group_by}"
+        ))
+
+
+def rollup_status(conn):
+    """Return {table: (rows, first day, last day, incidents)}."""
+    return {
+        table: tuple(conn.execute(text(
+            f"SELECT count(*), min(day), max(day), coalesce(sum(incidents), 0) FROM {table}"
+        )).one())
+        for table in ROLLUPS
+    }
+
+
+def trend(by=None, interval="day", start=None, end=None, filters=None):
+    """Return trend rows ``{"period", "key", <measures>}`` from the rollups.
+
+    ``start``/``end`` are dates (end inclusive) on incident creation days;
+    ``filters`` maps dimension names to required values. Without ``by`` the
+    rows are per period only. Raises ValueError for unknown names.
+    """
+    filters = {k: v for k, v in (filters or {}).items() if v is not None}
+    dims = set(filters) | ({by} if by else set())
+    unknown = dims - set(DIMENSIONS)
+    if unknown or interval not in INTERVALS:
+        raise ValueError(f"Unknown dimension or interval: {sorted(unknown) or interval}")
+    # fault_code lives in its own rollup, which only carries the customer
+    model = IncidentDailyFault if "fault_code" in dims else IncidentDaily
+    if any(not hasattr(model, DIMENSIONS[d]) for d in dims):
+        raise ValueError("fault_code can only be combined with customer")
+
+    keys = [db.literal_column(INTERVALS[interval].format(day=f"{model.__tablename__}.day")).label("period")]
+    if by:
+        keys.append(getattr(model, DIMENSIONS[by]).label("key"))
+    totals = [db.func.sum(getattr(model, m)).label(m) for m in MEASURES]
+    query = db.select(*keys, *totals).group_by(*keys).order_by(*keys)
+    if start:
+        query = query.where(model.day >= start.isoformat())
+    if end:
+        query = query.where(model.day <= end.isoformat())
+    for dim, value in filters.items():
+        query = query.where(getattr(model, DIMENSIONS[dim]) == value)
+    return [dict(row._mapping) for row in db.session.execute(query)]
+
+
+def default_window(start, end, days=90):
+    """Fill in a missing bound: the last ``days`` days up to today."""
+    end = end or date.today()
+    start = start or end - timedelta(days=days - 1)
+    if (end - start).days > MAX_DAYS:
+        start = end - timedelta(days=MAX_DAYS)
+    return start, end
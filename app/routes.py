@@ -1,29 +1,31 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, make_response
-import json
-import csv
-import io
-from datetime import timedelta
+import os
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, make_response, Response, stream_with_context, current_app, abort, send_file
+from sqlalchemy.orm import lazyload
+from datetime import date, datetime, timedelta, timezone
 from . import db
-from .models import Incident, Part
-from .forms import IncidentForm, FilterForm
-# import the list of part names
-from app.parts_data import PARTS  # a python list like ["Belt", "Motor", ...]
-
-def _fmt_dt(dt):
-    """Return 'YYYY-MM-DD HH:MM' or empty string if None."""
-    return dt.strftime("%Y-%m-%d %H:%M") if dt else ""
-
-def _fmt_duration(start, end):
-    """Return 'Xh Ym' if both present, else 'N/A'."""
-    if start and end:
-        mins = int((end - start).total_seconds() // 60)
-        h, m = divmod(mins, 60)
-        return f"{h}h {m}m" if h else f"{m}m"
-    return "N/A"
+from .models import ArchivedIncident, ExportJob, Incident, Part
+from .parts import FILTERS as PART_FILTERS, get_part_index, part_version, set_incident_parts, split_for_form, top_parts
+from .forms import IncidentForm, FilterForm, SEVERITY_CHOICES, STATUS_CHOICES, CATEGORY_CHOICES, SORT_CHOICES
+from .filters import IncidentFilters, filtered_query, ordering
+from .facets import facet_counts, facet_choices
+from .counters import dashboard_counts, incident_state
+from .conditional import validators, not_modified, apply_validators, request_args
+from .reference import get_reference
+from .rollup import DIMENSIONS as TREND_DIMENSIONS, trend, default_window
+from .reliability import GROUPS, SORTS, reliability, sort_rows, parse_window_bound
+from .storage import read_only
+from .fragments import render_rows, render_detail
+from .archive import includes_archive, merged_export_rows, merged_page
+from .bulk import BulkError, bulk_set_status
+from .changes import change_feed
+from .export import export_rows, csv_chunks, gzip_chunks
+from .export_jobs import ExportBusy, export_path, submit_export
+from .pagination import DEFAULT_PER_PAGE, clamp_per_page, keyset_paginate, cached_count
 
 main = Blueprint("main", __name__)
 
 @main.route("/", endpoint="index")
+@read_only
 def index():
     recent_incidents = (
         Incident.query
@@ -31,353 +33,183 @@ def index():
         .limit(5)
         .all()
     )
-    total = Incident.query.count()
-    open_ = Incident.query.filter_by(status="Open").count()
-    high_count = Incident.query.filter_by(severity="High").count()
+    total, open_, high_count = dashboard_counts()
     return render_template("index.html", recent_incidents=recent_incidents, total=total, open_=open_, high_count=high_count)
 
 @main.route("/incidents", endpoint="incidents")
+@read_only
 def incidents():
+    # Unchanged data and query string: answer 304 before any query or render
+    version, changed_at = incident_state()
+    etag, last_modified = validators("list", version, part_version(), request_args(),
+                                     last_modified=datetime.fromtimestamp(changed_at, timezone.utc), live=True)
+    cached = not_modified(etag, last_modified)
+    if cached:
+        return cached
+
     form = FilterForm()
+    filters = IncidentFilters.from_args(request.args)
+    sort = _sort_arg()
     
-    # Populate customer choices for the filter form
-    customers = db.session.query(Incident.customer_name).distinct().filter(Incident.customer_name.isnot(None)).all()
-    customer_choices = [("", "All Customers")] + [(c[0], c[0]) for c in customers if c[0]]
-    form.customer.choices = customer_choices
-    
-    # Get query parameters and populate form
-    q = request.args.get('q', '').strip()
-    customer = request.args.get('customer', '')
-    severity = request.args.get('severity', '')
-    status = request.args.get('status', '')
-    date_from = request.args.get('date_from', '')
-    date_to = request.args.get('date_to', '')
+    # Filter choices with per-value counts, from the cached facet service
+    facets = facet_counts(filters)
+    form.customer.choices = facet_choices(facets["customer"], "All Customers", filters.customer)
+    form.severity.choices = facet_choices(facets["severity"], "All Severities", filters.severity, SEVERITY_CHOICES)
+    form.status.choices = facet_choices(facets["status"], "All Statuses", filters.status, STATUS_CHOICES)
+    form.category.choices = facet_choices(facets["category"], "All Categories", filters.category, CATEGORY_CHOICES)
     
     # Pre-populate form with current filter values
-    form.q.data = q
-    form.customer.data = customer
-    form.severity.data = severity
-    form.status.data = status
-    if date_from:
-        try:
-            from datetime import datetime
-            form.date_from.data = datetime.fromisoformat(date_from.replace('T', ' '))
-        except:
-            pass
-    if date_to:
-        try:
-            from datetime import datetime
-            form.date_to.data = datetime.fromisoformat(date_to.replace('T', ' '))
-        except:
-            pass
+    form.q.data = filters.q
+    form.customer.data = filters.customer
+    form.severity.data = filters.severity
+    form.status.data = filters.status
+    form.category.data = filters.category
+    form.date_from.data = filters.date_from_dt
+    form.date_to.data = filters.date_to_dt
+    form.duration.data = filters.duration
+    form.sort.data = sort
     
-    # Build query with filters
-    query = Incident.query
+    # Pagination parameters (page size is capped server-side)
+    per_page = clamp_per_page(request.args.get('per_page', DEFAULT_PER_PAGE, type=int))
+    page = request.args.get('page', type=int)
+    show_total = request.args.get('count', '1') != '0'
+
+    # A date range reaching back into archived history reads both tables
+    archive = includes_archive(filters)
+    if archive:
+        cursor_mode = not page and not sort
+        pagination = merged_page(filters, per_page, sort, page=page,
+                                 after=request.args.get('after'), before=request.args.get('before'),
+                                 count=show_total)
+        items = pagination.items
+        return _incidents_response(items, pagination, cursor_mode, per_page, form, filters, sort,
+                                   archive, etag, last_modified)
+
+    query, rank = filtered_query(filters)
+    # Parts are only needed to render rows missing from the render cache
+    query = query.options(lazyload(Incident.parts), lazyload(Incident.usage))
     
-    # Text search filter
-    if q:
-        query = query.filter(
-            db.or_(
-                Incident.title.icontains(q),
-                Incident.description.icontains(q)
-            )
+    # Ranked search results, duration sorts and explicit ?page= links use
+    # page numbers; the chronological list uses cursors so deep pages stay cheap.
+    cursor_mode = not page and rank is None and not sort
+    if cursor_mode:
+        pagination = keyset_paginate(
+            query,
+            per_page,
+            after=request.args.get('after'),
+            before=request.args.get('before'),
+        )
+        if show_total:
+            pagination.total = cached_count(query)
+    else:
+        pagination = query.order_by(*ordering(rank, sort)).paginate(
+            page=page or 1, 
+            per_page=per_page, 
+            error_out=False,
+            count=show_total
         )
-    
-    # Customer filter
-    if customer:
-        query = query.filter(Incident.customer_name == customer)
-    
-    # Status filter
-    if status:
-        query = query.filter(Incident.status == status)
-    
-    # Severity filter - only filter if severity is one of the valid choices
-    if severity and severity in ['Low', 'Medium', 'High']:
-        query = query.filter(Incident.severity == severity)
-    
-    # Date range filters
-    if date_from:
-        try:
-            from datetime import datetime
-            date_from_obj = datetime.fromisoformat(date_from.replace('T', ' '))
-            query = query.filter(Incident.created_at >= date_from_obj)
-        except:
-            pass
-    
-    if date_to:
-        try:
-            from datetime import datetime
-            date_to_obj = datetime.fromisoformat(date_to.replace('T', ' '))
-            query = query.filter(Incident.created_at <= date_to_obj)
-        except:
-            pass
-    
-    # Pagination parameters
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 10, type=int)
-    
-    # Paginate the query
-    pagination = query.order_by(Incident.created_at.desc()).paginate(
-        page=page, 
-        per_page=per_page, 
-        error_out=False
-    )
     items = pagination.items
-    
-    return render_template("incidents.html", 
+    return _incidents_response(items, pagination, cursor_mode, per_page, form, filters, sort,
+                               archive, etag, last_modified)
+
+def _incidents_response(items, pagination, cursor_mode, per_page, form, filters, sort, archive, etag, last_modified):
+    response = make_response(render_template("incidents.html", 
                          items=items, 
+                         rows=render_rows(items),
                          pagination=pagination,
+                         cursor_mode=cursor_mode,
+                         per_page=per_page,
                          form=form,
-                         q=q, 
-                         customer=customer,
-                         status=status, 
-                         severity=severity,
-                         date_from=date_from,
-                         date_to=date_to)
+                         archive=archive,
+                         filter_args=dict(filters.as_args(), **({'sort': sort} if sort else {})),
+                         bulk_filter=filters.as_args(),
+                         status_choices=STATUS_CHOICES,
+                         status_badges={value: current_app.jinja_env.filters['status_badge'](value)
+                                        for value, _label in STATUS_CHOICES}))
+    return apply_validators(response, etag, last_modified)
+
+def _sort_arg():
+    """The ?sort= value if it is one of SORT_CHOICES, else '' (default order)."""
+    sort = request.args.get('sort', '')
+    return sort if sort in dict(SORT_CHOICES) else ''
+
+def _reference_choices(form, ref, customer=None, site=None, fault_code=None):
+    """Set the choices of the reference-backed select fields.
+
+    Dependent lists are narrowed to the given customer, site and fault code
+    so WTForms' choice validation only accepts valid combinations; the
+    browser fills them in from /api/reference as the user picks.
+    """
+    def pairs(values):
+        return [(v, v) for v in values]
+
+    form.customer_name.choices = [("", "Select customer...")] + pairs(ref.customers)
+    form.site_name.choices = [("", "Select site...")] + pairs(ref.sites_for(customer))
+    form.location.choices = [("", "Select location...")] + pairs(ref.locations_for(customer))
+    models = ref.models_for(customer) if customer else ref.all_models()
+    form.machine_model.choices = [("", "Select model...")] + pairs(models)
+    form.machine_serial.choices = [("", "Select serial...")] + pairs(ref.serials_for(site))
+
+    form.fault_code.choices = [("", "Select fault code...")] + pairs(sorted(ref.fault_map))
+    mapped_desc = ref.fault_map.get(fault_code)
+    descriptions = [mapped_desc] if mapped_desc else ref.fault_descriptions()
+    form.fault.choices = [("", "Select fault description...")] + pairs(descriptions)
+
+def _reference_errors(form, ref):
+    """Run the reference rules on a submitted form; return True if any failed."""
+    errors = ref.validate(
+        form.customer_name.data,
+        site=form.site_name.data,
+        location=form.location.data,
+        model=form.machine_model.data,
+        serial=form.machine_serial.data,
+        fault_code=form.fault_code.data,
+        fault=form.fault.data,
+    )
+    for field, message in errors.items():
+        getattr(form, field).errors.append(message)
+    return bool(errors)
+
+def _part_choices(selected):
+    """Options for just the selected parts; select2 searches the rest."""
+    ids = [int(v) for v in selected if str(v).isdigit()]
+    names = dict(db.session.execute(db.select(Part.id, Part.name).where(Part.id.in_(ids))).all()) if ids else {}
+    choices = []
+    for v in selected:
+        if str(v).isdigit():
+            if int(v) in names:
+                choices.append((str(v), names[int(v)]))
+        elif v:
+            choices.append((v, v))  # a new name typed into select2
+    return choices
+
+def _render_incident_form(form, ref, **context):
+    return render_template("incident_form.html", form=form, ref_version=ref.version, **context)
 
 @main.route("/incident/new", methods=["GET","POST"], endpoint="new_incident")
 def new_incident():
     form = IncidentForm()
+    ref = get_reference()
+
+    # Populate dependent choices BEFORE validate_on_submit
+    _reference_choices(
+        form, ref,
+        customer=request.form.get("customer_name", ""),
+        site=request.form.get("site_name", ""),
+        fault_code=request.form.get("fault_code", ""),
+    )
 
-    # Customer mapping as specified
-    customer_map = {
-        "customers": ["VLTX", "Bol", "Bank Muscat", "TransG"],
-        "sites": {
-            "VLTX": ["Birmingham","London Kings Cross","Tonbridge","Bristol","Woolston","Kilmarnock","Washington"],
-            "Bol": ["Belfast"],
-            "Bank Muscat": ["Muscat"],
-            "TransG": ["Dubai"]
-        },
-        "locations": {
-            "VLTX": ["United Kingdom"],
-            "Bol": ["United Kingdom"],
-            "Bank Muscat": ["Oman"],
-            "TransG": ["UAE"]
-        },
-        "models": {
-            "VLTX": ["7000","V-Series","Cobra"],
-            "Bol": ["7000"],
-            "Bank Muscat": ["7000","V-Series"],
-            "TransG": ["7000"]
-        }
-    }
-
-    FAULT_MAP = {
-        # code -> description
-        "1CC": "Feedscan Module Card Cage",
-        "1C":  "Feedscan Module Customer",
-        "1D":  "Feedscan Module Detector Name",
-        "1E":  "Feedscan Module Electrical",
-        "1F":  "Feedscan Module Feeder",
-        "1FO": "Feedscan Module Foreign Objects",
-        "1M":  "Feedscan Module Mechanical",
-        "8D":  "Miscellaneous DLR",
-        "8C":  "Miscellaneous Valtex",
-        "6D":  "Network System DLR",
-        "6S":  "Network System SCM",
-        "9FO": "PM (Foreign Object Found)",
-        "10E":"Software Error Message",
-        "3C": "Stacker Module Customer",
-        "3E": "Stacker Module Electrical",
-        "3FO":"Stacker Module Foreign Object",
-        "3M": "Stacker Module Mechanical",
-        "4E2":"Strapper Pocket Electrical",
-        "4E3":"Strapper Pocket Electrical",
-        "4E4":"Strapper Pocket Electrical",
-        "4E6":"Strapper Pocket Electrical",
-        "4E7":"Strapper Pocket Electrical",
-        "4E8":"Strapper Pocket Electrical",
-        "4E9":"Strapper Pocket Electrical",
-        "4E10":"Strapper Pocket Electrical",
-        "4E12":"Strapper Pocket Electrical",
-        "4FO1":"Strapper Pocket Foreign Object",
-        "4FO2":"Strapper Pocket Foreign Object",
-        "4FO3":"Strapper Pocket Foreign Object",
-        "4FO7":"Strapper Pocket Foreign Object",
-        "4FO9":"Strapper Pocket Foreign Object",
-        "4FO9B":"Strapper Pocket Foreign Object",
-        "4F010":"Strapper Pocket Foreign Object",
-        "4F011":"Strapper Pocket Foreign Object",
-        "4M5":"Strapper Pocket Mechanical",
-        "4M6":"Strapper Pocket Mechanical",
-        "4M7":"Strapper Pocket Mechanical",
-        "4M8":"Strapper Pocket Mechanical",
-        "4M9":"Strapper Pocket Mechanical",
-        "4P1":"Strapper Pocket Pneumatic",
-        "4P10":"Strapper Pocket Pneumatic",
-        "4P11":"Strapper Pocket Pneumatic",
-        "4P12":"Strapper Pocket Pneumatic",
-        "4P2":"Strapper Pocket Pneumatic",
-        "4P3":"Strapper Pocket Pneumatic",
-        "4P4":"Strapper Pocket Pneumatic",
-        "4P5":"Strapper Pocket Pneumatic",
-        "4P6":"Strapper Pocket Pneumatic",
-        "4P9":"Strapper Pocket Pneumatic",
-        "5A":"System Air",
-        "5C":"System Customer",
-        "5D":"System DLR",
-        "5E":"System Electrical"
-    }
-
-    SITE_SERIAL_MAP = {
-        "Birmingham": [
-            ("BIRM27", "7000"),
-            ("BIRM30", "7000"),
-            ("BIRM35", "7000"),
-            ("BIRMV01", "V-Series"),
-            ("BIRMV01", "V-Series"),
-            ("BIRMV05", "V-Series"),
-            ("BIRMV05", "V-Series"),
-        ],
-        "Bristol": [
-            ("BRIS28", "7000"),
-            ("BRIS31", "7000"),
-            ("BRISV02", "V-Series"),
-        ],
-        "Kilmarnock": [
-            ("KILM105", "Cobra"),
-            ("KILM29", "7000"),
-            ("KILM33", "7000"),
-        ],
-        "London Kings Cross": [
-            ("LOND24", "7000"),
-            ("LOND32", "7000"),
-        ]
-        # Add more sites/rows here as needed
-    }
-
-    def serial_choices_for(site):
-        pairs = SITE_SERIAL_MAP.get(site, [])
-        return [(s, s) for (s, _m) in pairs]
-
-    def model_for(site, serial):
-        for s, m in SITE_SERIAL_MAP.get(site, []):
-            if s == serial:
-                return m
-        return None
-
-    # Always set customer choices so WTForms can validate it
-    form.customer_name.choices = [(c, c) for c in customer_map["customers"]]
-
-    # Always set fault_code choices (sorted by code)
-    form.fault_code.choices = [("", "Select fault code...")] + [(k, k) for k in sorted(FAULT_MAP.keys())]
-    # Fault description choices mirror the map values
-    form.fault.choices = [("", "Select fault description...")] + [(v, v) for v in sorted(set(FAULT_MAP.values()))]
-
-    # ensure choices are always present
-    part_choices = [(p, p) for p in PARTS] if PARTS else []
-    form.parts_used.choices = part_choices
-
-    # Fallback: if no parts loaded, show a hint choice so the field is usable
-    if not form.parts_used.choices:
-        form.parts_used.choices = [("","-- No parts list loaded: use 'Other Parts' field --")]
-
-    # Ensure machine_model choices are at least present
-    # We'll restrict via server guard and also set the final value from the mapping
-    all_models = sorted({m for pairs in SITE_SERIAL_MAP.values() for (_s, m) in pairs})
-    form.machine_model.choices = [("", "Select model...")] + [(m, m) for m in all_models]
-
-    # If posting, populate dependent choices BEFORE validate_on_submit
-    if request.method == "POST":
-        c = request.form.get("customer_name", "")
-        sites     = customer_map["sites"].get(c, [])
-        locations = customer_map["locations"].get(c, [])
-        models    = customer_map["models"].get(c, [])
-
-        form.site_name.choices   = [(v, v) for v in sites]
-        form.location.choices    = [(v, v) for v in locations]
-        form.machine_model.choices = [(v, v) for v in models]
-
-        # Build dependent choices for site-serial mapping BEFORE validate_on_submit
-        posted_site = request.form.get("site_name", "")
-        form.machine_serial.choices = [("", "Select serial...")] + serial_choices_for(posted_site)
-
-        # Also ensure the submitted fault pair is valid before validate_on_submit
-        posted_code = request.form.get("fault_code") or ""
-        posted_desc = request.form.get("fault") or ""
-
-        # Rebuild choices so WTForms validate_choice passes
-        if posted_code and posted_code in FAULT_MAP:
-            # Set description choices to include exactly the mapped description for the selected code
-            mapped_desc = FAULT_MAP[posted_code]
-            form.fault.choices = [("", "Select fault description..."), (mapped_desc, mapped_desc)]
-        # else keep the generic list for GET or empty code
+    # Part ids (or typed names) as submitted; select2 fetches the catalogue
+    form.parts_used.choices = _part_choices(request.form.getlist("parts_used"))
 
     if form.validate_on_submit():
-        # Ensure parts choices are available for error paths
-        parts = Part.query.order_by(Part.name.asc()).all()
-        form.parts_used.choices = [(p.id, p.name) for p in parts]
-        
-        c = form.customer_name.data
-        
-        # (optional) extra guardrails for customer mapping
-        if form.site_name.data and form.site_name.data not in customer_map["sites"].get(c, []):
-            form.site_name.errors.append("Invalid site for selected customer.")
-            return render_template("incident_form.html", form=form,
-                                   customer_map=json.dumps(customer_map),
-                                   fault_map=json.dumps(FAULT_MAP),
-                                   site_serial_map=json.dumps(SITE_SERIAL_MAP))
-
-        if form.location.data and form.location.data not in customer_map["locations"].get(c, []):
-            form.location.errors.append("Invalid location for selected customer.")
-            return render_template("incident_form.html", form=form,
-                                   customer_map=json.dumps(customer_map),
-                                   fault_map=json.dumps(FAULT_MAP),
-                                   site_serial_map=json.dumps(SITE_SERIAL_MAP))
-
-        if form.machine_model.data and form.machine_model.data not in customer_map["models"].get(c, []):
-            form.machine_model.errors.append("Invalid machine model for selected customer.")
-            return render_template("incident_form.html", form=form,
-                                   customer_map=json.dumps(customer_map),
-                                   fault_map=json.dumps(FAULT_MAP),
-                                   site_serial_map=json.dumps(SITE_SERIAL_MAP))
-
-        # Server guard: if a code is provided, description must match FAULT_MAP[code]
-        if form.fault_code.data:
-            expected = FAULT_MAP.get(form.fault_code.data)
-            if not expected:
-                form.fault_code.errors.append("Unknown fault code.")
-                return render_template("incident_form.html", form=form,
-                                       customer_map=json.dumps(customer_map),
-                                       fault_map=json.dumps(FAULT_MAP),
-                                       site_serial_map=json.dumps(SITE_SERIAL_MAP))
-            if form.fault.data and form.fault.data != expected:
-                form.fault.errors.append("Fault description doesn't match the selected code.")
-                return render_template("incident_form.html", form=form,
-                                       customer_map=json.dumps(customer_map),
-                                       fault_map=json.dumps(FAULT_MAP),
-                                       site_serial_map=json.dumps(SITE_SERIAL_MAP))
-
-        # Site-serial validation
-        site = form.site_name.data
-        serial = form.machine_serial.data
-
-        # If a serial is provided, it must belong to the selected site
-        if serial:
-            valid_serials = {s for (s, _m) in SITE_SERIAL_MAP.get(site, [])}
-            if serial not in valid_serials:
-                form.machine_serial.errors.append("Invalid serial for selected site.")
-                return render_template("incident_form.html", form=form,
-                                       customer_map=json.dumps(customer_map),
-                                       fault_map=json.dumps(FAULT_MAP),
-                                       site_serial_map=json.dumps(SITE_SERIAL_MAP))
-
-            # Force the model to the one tied to this serial
-            mapped_model = model_for(site, serial)
-            form.machine_model.data = mapped_model
-        
-        # Build parts_used string from selected parts and other parts
-        selected = [p for p in (form.parts_used.data or []) if p and p != ""]  # guard the hint value
-        parts_list = []
-        
-        if selected:
-            selected_parts = Part.query.filter(Part.id.in_(selected)).all()
-            parts_list.extend([p.name for p in selected_parts])
-        
-        if form.parts_other.data and form.parts_other.data.strip():
-            # Add other parts (split by comma and clean up)
-            other_parts = [p.strip() for p in form.parts_other.data.split(',') if p.strip()]
-            parts_list.extend(other_parts)
+        # Customer / site / serial / fault guardrails
+        if _reference_errors(form, ref):
+            return _render_incident_form(form, ref)
+
+        # Force the model to the one tied to this serial
+        if form.machine_serial.data:
+            form.machine_model.data = ref.model_for(form.site_name.data, form.machine_serial.data)
         
         # If validation passes, create the incident
         i = Incident(
@@ -393,32 +225,45 @@ def new_incident():
             start_time=form.start_time.data,
             end_time=form.end_time.data,
             preventive_maintenance=form.preventive_maintenance.data,
-            parts_used=", ".join(parts_list) if parts_list else None,
             category=form.category.data,
             severity=form.severity.data,
             status=form.status.data,
         )
         
-        # Map selected part IDs to Part objects
-        if selected:
-            i.parts = Part.query.filter(Part.id.in_(selected)).all()
+        # Link selected and free-text parts (new names join the catalogue)
+        set_incident_parts(i, form.parts_used.data or [], form.parts_other.data)
         
         db.session.add(i)
         db.session.commit()
         flash("✅ Incident submitted successfully.", "success")
         return redirect(url_for("main.incidents"))
     
-    return render_template("incident_form.html", form=form,
-                           customer_map=json.dumps(customer_map),
-                           fault_map=json.dumps(FAULT_MAP),
-                           site_serial_map=json.dumps(SITE_SERIAL_MAP))
+    return _render_incident_form(form, ref)
 
 @main.route("/incident/<int:incident_id>", endpoint="incident_detail")
+@read_only
 def incident_detail(incident_id):
-    i = Incident.query.get_or_404(incident_id)
-    # Parse parts_used safely for display
-    parts_list = i.parts_used.split(", ") if i.parts_used else []
-    return render_template("incident_detail.html", i=i, parts_list=parts_list)
+    # Validators from one narrow primary-key read; 304 skips loading the rest.
+    # Incidents not in the live table may have been archived.
+    for model in (Incident, ArchivedIncident):
+        state = db.session.execute(
+            db.select(model.row_version, model.updated_at, model.start_time, model.end_time)
+            .where(model.id == incident_id)
+        ).first()
+        if state is not None:
+            break
+    else:
+        abort(404)
+    etag, last_modified = validators("detail", incident_id, model.archived, state.row_version, part_version(),
+                                     last_modified=state.updated_at,
+                                     live=state.start_time is not None and state.end_time is None)
+    cached = not_modified(etag, last_modified)
+    if cached:
+        return cached
+
+    i = db.session.get(model, incident_id, options=[lazyload(model.parts), lazyload(model.usage)])
+    response = make_response(render_template("incident_detail.html", i=i, body=render_detail(i)))
+    return apply_validators(response, etag, last_modified)
 
 @main.route("/incident/<int:incident_id>/status", methods=["POST"], endpoint="incident_status")
 def incident_status(incident_id):
@@ -430,6 +275,45 @@ def incident_status(incident_id):
         flash(f"✅ Incident #{i.id} status updated to {new_status}.", "success")
     return redirect(url_for("main.incidents"))
 
+@main.route("/api/incidents/status", methods=["POST"], endpoint="api_bulk_status")
+def api_bulk_status():
+    """Move many incidents to one status in a single UPDATE.
+
+    JSON body: {"status": "Resolved", "ids": [1, 2, 3]}, or a list filter
+    instead of ids: {"status": "Resolved", "filter": {"customer": "Bol"}}.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Send a JSON object"}), 400
+    try:
+        result = bulk_set_status(
+            data.get("status"),
+            ids=data.get("ids"),
+            filters=data.get("filter"),
+            limit=current_app.config['BULK_STATUS_MAX'],
+        )
+    except BulkError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(dict(status=data["status"], **result))
+
+@main.route("/api/incidents/changes", endpoint="api_incident_changes")
+@read_only
+def api_incident_changes():
+    """Incidents changed since a resume token, as NDJSON.
+
+    ?since=<token> from the last line of the previous response (omit it to
+    start from the beginning), ?limit= up to CHANGES_MAX_BATCH. The last
+    line is {"next": <token>, "more": true|false}; keep asking with that
+    token while "more" is true.
+    """
+    since = request.args.get('since', '0')
+    limit = request.args.get('limit', 1000, type=int)
+    if not since.isdigit() or limit < 1:
+        return jsonify({"error": "since must be a token from this feed and limit a positive number"}), 400
+    next_token, more, lines = change_feed(int(since), min(limit, current_app.config['CHANGES_MAX_BATCH']))
+    headers = {'X-Next-Since': next_token, 'X-More': 'true' if more else 'false'}
+    return Response(stream_with_context(lines), mimetype='application/x-ndjson', headers=headers)
+
 @main.route("/incident/<int:id>/start", methods=["POST"], endpoint="incident_start")
 def incident_start(id):
     i = Incident.query.get_or_404(id)
@@ -451,91 +335,22 @@ def incident_edit(id):
     i = Incident.query.get_or_404(id)
     form = IncidentForm()
 
-    # Customer mapping as specified
-    customer_map = {
-        "customers": ["VLTX", "Bol", "Bank Muscat", "TransG"],
-        "sites": {
-            "VLTX": ["Birmingham","London Kings Cross","Tonbridge","Bristol","Woolston","Kilmarnock","Washington"],
-            "Bol": ["Wolverhampton","Northampton","Portsmouth","Reading","Swindon","Oxford","Milton Keynes"],
-            "Bank Muscat": ["Muscat","Nizwa","Sur","Sohar","Khasab","Ibra","Rustaq"],
-            "TransG": ["Manchester","Liverpool","Preston","Bolton","Blackburn","Wigan","Salford"]
-        },
-        "locations": {
-            "VLTX": ["Production Floor","Warehouse","Office Area","Loading Bay"],
-            "Bol": ["Assembly Line","Quality Control","Maintenance Shop","Storage"],
-            "Bank Muscat": ["Banking Hall","ATM Area","Server Room","Office"],
-            "TransG": ["Dispatch Center","Vehicle Bay","Parts Store","Admin Office"]
-        },
-        "models": {
-            "VLTX": ["7000","V-Series","X-Pro"],
-            "Bol": ["7000","V-Series","Industrial-5000"],
-            "Bank Muscat": ["Security-2000","7000","Compact-300"],
-            "TransG": ["Heavy-Duty-8000","7000","Fleet-Manager"]
-        }
-    }
-
-    FAULT_MAP = {
-        "E001": "Motor overheating detected",
-        "E002": "Hydraulic pressure loss",
-        "E003": "Sensor calibration error",
-        "E004": "Communication timeout",
-        "E005": "Emergency stop activated",
-        "W001": "Low fluid level warning",
-        "W002": "Filter replacement due",
-        "W003": "Scheduled maintenance required"
-    }
-
-    SITE_SERIAL_MAP = {
-        "Birmingham": [
-            ("BIRM27", "7000"),
-            ("BIRM30", "7000"),
-            ("BIRM35", "7000"),
-            ("BIRMV01", "V-Series"),
-            ("BIRMV05", "V-Series"),
-        ],
-        "Bristol": [
-            ("BRIS28", "7000"),
-            ("BRIS31", "7000"),
-            ("BRISV02", "V-Series"),
-        ],
-        "London Kings Cross": [
-            ("LKC40", "7000"),
-            ("LKC45", "7000"),
-            ("LKCX01", "X-Pro"),
-        ],
-        "Wolverhampton": [
-            ("WOLV12", "7000"),
-            ("WOLV15", "Industrial-5000"),
-            ("WOLV18", "V-Series"),
-        ],
-        "Northampton": [
-            ("NORT22", "7000"),
-            ("NORT25", "Industrial-5000"),
-        ],
-        "Muscat": [
-            ("MUS001", "Security-2000"),
-            ("MUS002", "7000"),
-            ("MUS003", "Compact-300"),
-        ],
-        "Manchester": [
-            ("MAN100", "Heavy-Duty-8000"),
-            ("MAN101", "7000"),
-            ("MAN102", "Fleet-Manager"),
-        ]
-    }
+    ref = get_reference()
 
-    # Populate form choices
-    form.customer_name.choices = [('', 'Select customer...')] + [(c, c) for c in customer_map["customers"]]
-    form.site_name.choices = [('', 'Select site...')]
-    form.location.choices = [('', 'Select location...')]
-    form.machine_model.choices = [('', 'Select model...')]
-    form.machine_serial.choices = [('', 'Select serial...')]
-    form.fault_code.choices = [('', 'Select fault code...')] + [(code, code) for code in FAULT_MAP.keys()]
-    form.fault.choices = [('', 'Select fault description...')]
+    # Populate form choices: dependent lists follow the submitted values on
+    # POST and the stored incident on GET
+    if request.method == 'GET':
+        _reference_choices(form, ref, customer=i.customer_name, site=i.site_name, fault_code=i.fault_code)
+    else:
+        _reference_choices(
+            form, ref,
+            customer=request.form.get("customer_name", ""),
+            site=request.form.get("site_name", ""),
+            fault_code=request.form.get("fault_code", ""),
+        )
 
-    # Load parts for the multi-select
-    parts = Part.query.order_by(Part.name.asc()).all()
-    form.parts_used.choices = [(p.id, p.name) for p in parts]
+    # Only the selected parts are rendered; select2 fetches the rest
+    form.parts_used.choices = _part_choices(request.form.getlist("parts_used"))
 
     # Pre-populate form with existing data on GET request
     if request.method == 'GET':
@@ -551,67 +366,17 @@ def incident_edit(id):
         form.start_time.data = i.start_time
         form.end_time.data = i.end_time
         form.preventive_maintenance.data = i.preventive_maintenance
-        form.parts_used.data = [p.id for p in i.parts]
-        
-        # Extract other parts from legacy parts_used field
-        if i.parts_used:
-            parts_in_legacy = set(i.parts_used.split(", "))
-            parts_in_relation = {p.name for p in i.parts}
-            other_parts = parts_in_legacy - parts_in_relation
-            if other_parts:
-                form.parts_other.data = ", ".join(sorted(other_parts))
+        # Single parts pre-select; quantities come back as 'Name xN' text
+        form.parts_used.data, form.parts_other.data = split_for_form(i)
+        form.parts_used.choices = _part_choices(form.parts_used.data)
         
         form.category.data = i.category
         form.severity.data = i.severity
         form.status.data = i.status
 
-        # Populate dependent choices based on selected customer
-        if i.customer_name:
-            form.site_name.choices = [('', 'Select site...')] + [(s, s) for s in customer_map["sites"].get(i.customer_name, [])]
-            form.location.choices = [('', 'Select location...')] + [(l, l) for l in customer_map["locations"].get(i.customer_name, [])]
-            form.machine_model.choices = [('', 'Select model...')] + [(m, m) for m in customer_map["models"].get(i.customer_name, [])]
-
-        # Populate serial choices based on selected site
-        if i.site_name:
-            pairs = SITE_SERIAL_MAP.get(i.site_name, [])
-            serials = [s for (s, _m) in pairs]
-            form.machine_serial.choices = [('', 'Select serial...')] + [(s, s) for s in serials]
-
-        # Populate fault description based on selected fault code
-        if i.fault_code and i.fault_code in FAULT_MAP:
-            form.fault.choices = [('', 'Select fault description...'), (FAULT_MAP[i.fault_code], FAULT_MAP[i.fault_code])]
-
     if form.validate_on_submit():
-        # Validation logic (reused from new incident route)
-        customer = form.customer_name.data
-        site = form.site_name.data
-        location = form.location.data
-        model = form.machine_model.data
-        serial = form.machine_serial.data
-        fault_code = form.fault_code.data
-        fault_desc = form.fault.data
-
-        # Server-side validation
-        if customer and customer not in customer_map["customers"]:
-            form.customer_name.errors.append("Invalid customer selection.")
-        if customer and site and site not in customer_map["sites"].get(customer, []):
-            form.site_name.errors.append("Invalid site for selected customer.")
-        if customer and location and location not in customer_map["locations"].get(customer, []):
-            form.location.errors.append("Invalid location for selected customer.")
-        if customer and model and model not in customer_map["models"].get(customer, []):
-            form.machine_model.errors.append("Invalid model for selected customer.")
-        if site:
-            valid_serials = {s for (s, _m) in SITE_SERIAL_MAP.get(site, [])}
-            if serial and serial not in valid_serials:
-                form.machine_serial.errors.append("Invalid serial for selected site.")
-        if fault_code and fault_code not in FAULT_MAP:
-            form.fault_code.errors.append("Invalid fault code.")
-        if fault_code and fault_desc and fault_desc != FAULT_MAP.get(fault_code, ""):
-            form.fault.errors.append("Fault description doesn't match selected code.")
-
-        # Check if there are validation errors
-        if not any([form.customer_name.errors, form.site_name.errors, form.location.errors, 
-                   form.machine_model.errors, form.machine_serial.errors, form.fault_code.errors, form.fault.errors]):
+        # Customer / site / serial / fault guardrails (same rules as new incidents)
+        if not _reference_errors(form, ref):
             
             # Update incident with form data
             i.title = form.title.data
@@ -627,116 +392,217 @@ def incident_edit(id):
             i.end_time = form.end_time.data
             i.preventive_maintenance = form.preventive_maintenance.data
             
-            # Build parts_used string from selected parts and other parts
-            selected = [p for p in (form.parts_used.data or []) if p and p != ""]  # guard the hint value
-            parts_list = []
-            
-            if selected:
-                selected_parts = Part.query.filter(Part.id.in_(selected)).all()
-                parts_list.extend([p.name for p in selected_parts])
-            
-            if form.parts_other.data and form.parts_other.data.strip():
-                # Add other parts (split by comma and clean up)
-                other_parts = [p.strip() for p in form.parts_other.data.split(',') if p.strip()]
-                parts_list.extend(other_parts)
-            
-            i.parts_used = ", ".join(parts_list) if parts_list else None
             i.category = form.category.data
             i.severity = form.severity.data
             i.status = form.status.data
 
-            # Update parts relationship
-            if selected:
-                i.parts = Part.query.filter(Part.id.in_(selected)).all()
-            else:
-                i.parts = []
+            # Relink selected and free-text parts
+            set_incident_parts(i, form.parts_used.data or [], form.parts_other.data)
 
             db.session.commit()
             flash(f"✅ Incident #{i.id} has been updated successfully.", "success")
             return redirect(url_for("main.incident_detail", incident_id=i.id))
 
-    return render_template("incident_form.html", form=form, is_edit=True, incident=i,
-                          customer_map=json.dumps(customer_map),
-                          fault_map=json.dumps(FAULT_MAP),
-                          site_serial_map=json.dumps(SITE_SERIAL_MAP))
+    return _render_incident_form(form, ref, is_edit=True, incident=i)
 
 @main.route("/incidents/export.csv", endpoint="incidents_export")
+@read_only
 def incidents_export():
-    # Get the same query parameters as the incidents route
-    q = request.args.get('q', '').strip()
-    customer = request.args.get('customer', '')
-    severity = request.args.get('severity', '')
-    status = request.args.get('status', '')
-    date_from = request.args.get('date_from', '')
-    date_to = request.args.get('date_to', '')
-    
-    # Build query with the same filtering logic as incidents route
-    query = Incident.query
+    gzip = bool(current_app.config.get('EXPORT_GZIP') and request.accept_encodings['gzip'])
+    version, changed_at = incident_state()
+    etag, last_modified = validators("export", version, gzip, request_args(),
+                                     last_modified=datetime.fromtimestamp(changed_at, timezone.utc), live=True)
+    cached = not_modified(etag, last_modified)
+    if cached:
+        cached.headers['Vary'] = 'Accept-Encoding'
+        return cached
+
+    # Same filters as the incidents route, archive included for old date ranges
+    filters = IncidentFilters.from_args(request.args)
+    if includes_archive(filters):
+        rows = merged_export_rows(filters, _sort_arg())
+    else:
+        query, rank = filtered_query(filters)
+        rows = export_rows(query.order_by(*ordering(rank, _sort_arg())))
     
-    # Text search filter
-    if q:
-        query = query.filter(
-            db.or_(
-                Incident.title.icontains(q),
-                Incident.description.icontains(q)
-            )
-        )
-    
-    # Customer filter
-    if customer:
-        query = query.filter(Incident.customer_name == customer)
-    
-    # Status filter
-    if status:
-        query = query.filter(Incident.status == status)
-    
-    # Severity filter - only filter if severity is one of the valid choices
-    if severity and severity in ['Low', 'Medium', 'High']:
-        query = query.filter(Incident.severity == severity)
-    
-    # Date range filters
-    if date_from:
-        try:
-            from datetime import datetime
-            date_from_obj = datetime.fromisoformat(date_from.replace('T', ' '))
-            query = query.filter(Incident.created_at >= date_from_obj)
-        except:
-            pass
-    
-    if date_to:
-        try:
-            from datetime import datetime
-            date_to_obj = datetime.fromisoformat(date_to.replace('T', ' '))
-            query = query.filter(Incident.created_at <= date_to_obj)
-        except:
-            pass
-    
-    # Get the filtered incidents
-    incidents = query.order_by(Incident.created_at.desc()).all()
-    
-    # Create CSV content
-    output = io.StringIO()
-    writer = csv.writer(output)
+    # Stream the rows out in chunks instead of building the file in memory
+    chunks = csv_chunks(rows)
     
-    # Write header row
-    writer.writerow(["ID","Title","Customer","Severity","Status","Created","Duration","Parts Used"])
-    
-    # Write data rows
-    for i in incidents:
-        writer.writerow([
-            i.id,
-            i.title or "",
-            i.customer_name or "",
-            i.severity or "",
-            i.status or "",
-            _fmt_dt(i.created_at),
-            _fmt_duration(i.start_time, i.end_time),
-            (", ".join(i.parts_used) if isinstance(i.parts_used, (list, tuple)) else (i.parts_used or "")),
-        ])
-    
-    # Create response
-    response = make_response(output.getvalue())
-    response.headers['Content-Type'] = 'text/csv'
-    response.headers['Content-Disposition'] = 'attachment; filename="incidents.csv"'
+    headers = {
+        'Content-Disposition': 'attachment; filename="incidents.csv"',
+        'Vary': 'Accept-Encoding',
+    }
+    if gzip:
+        chunks = gzip_chunks(chunks)
+        headers['Content-Encoding'] = 'gzip'
     
+    response = Response(stream_with_context(chunks), mimetype='text/csv', headers=headers)
+    return apply_validators(response, etag, last_modified)
+
+def _export_job_json(job):
+    body = {
+        "id": job.id,
+        "status": job.status,
+        "rows": job.rows,
+        "error": job.error,
+        "created_at": job.created_at.isoformat(),
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        "status_url": url_for("main.api_export_status", job_id=job.id),
+    }
+    if job.status == "done":
+        body["download_url"] = url_for("main.export_download", job_id=job.id)
+    return body
+
+@main.route("/api/exports", methods=["POST"], endpoint="api_export_create")
+def api_export_create():
+    """Queue a background CSV export of the list filters in the query string.
+
+    Answers 202 with the job; poll its status_url until it is done, then
+    fetch download_url.
+    """
+    try:
+        job_id = submit_export(request.args)
+    except ExportBusy as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "30"}
+    body = _export_job_json(db.session.get(ExportJob, job_id))
+    return jsonify(body), 202, {"Location": body["status_url"]}
+
+@main.route("/api/exports/<job_id>", endpoint="api_export_status")
+@read_only
+def api_export_status(job_id):
+    job = db.session.get(ExportJob, job_id)
+    if job is None:
+        abort(404)
+    return jsonify(_export_job_json(job))
+
+@main.route("/exports/<job_id>/incidents.csv", endpoint="export_download")
+@read_only
+def export_download(job_id):
+    job = db.session.get(ExportJob, job_id)
+    if job is None or job.status != "done" or not os.path.exists(export_path(job.id)):
+        abort(404)
+    return send_file(export_path(job.id), mimetype="text/csv", as_attachment=True,
+                     download_name="incidents.csv", max_age=0)
+
+@main.route("/api/reference", endpoint="api_reference")
+@read_only
+def api_reference():
+    """Customer/site/machine/fault reference data for the incident form.
+
+    The form requests it with ?v=<version>, so that URL can be cached for
+    good; other requests revalidate against the version ETag.
+    """
+    ref = get_reference()
+    etag = f"ref-{ref.version}"
+    if request.if_none_match.contains(etag):
+        response = make_response("", 304)
+    else:
+        response = make_response(ref.json)
+        response.mimetype = "application/json"
+    response.set_etag(etag)
+    if request.args.get("v") == str(ref.version):
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    else:
+        response.headers["Cache-Control"] = "no-cache"
     return response
+
+def _reliability_args():
+    by = request.args.get("by", "model")
+    if by not in GROUPS:
+        by = "model"
+    sort = request.args.get("sort", "failures")
+    if sort not in SORTS:
+        sort = "failures"
+    start = parse_window_bound(request.args.get("from"))
+    end = parse_window_bound(request.args.get("to"), end=True)
+    limit = min(max(request.args.get("limit", 100, type=int), 1), 10000)
+    data = reliability(by, start, end)
+    return by, sort, start, end, data, sort_rows(data["rows"], sort)[:limit]
+
+@main.route("/reliability", endpoint="reliability")
+@read_only
+def reliability_view():
+    try:
+        by, sort, start, end, data, rows = _reliability_args()
+    except ValueError as e:
+        abort(400, str(e))
+    return render_template(
+        "reliability.html", by=by, sort=sort, groups=GROUPS, sorts=SORTS,
+        rows=rows, fleet=data["fleet"], total_groups=len(data["rows"]),
+        date_from=request.args.get("from", ""), date_to=request.args.get("to", ""),
+    )
+
+@main.route("/api/reliability", endpoint="api_reliability")
+@read_only
+def api_reliability():
+    """MTTR/MTBF per ?by=serial|model|site|customer, optionally ?from=&to=."""
+    try:
+        by, sort, start, end, data, rows = _reliability_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({
+        "by": by,
+        "from": start.isoformat() if start else None,
+        "to": end.isoformat() if end else None,
+        "version": data["version"],
+        "fleet": data["fleet"],
+        "rows": rows,
+    })
+
+@main.route("/api/trends", endpoint="api_trends")
+@read_only
+def api_trends():
+    """Incidents per day/week/month from the daily rollups.
+
+    ?by= splits the series by customer, site, category, severity or
+    fault_code; those names also work as filters (?severity=High).
+    ?from=/?to= are creation dates, the last 90 days by default.
+    """
+    try:
+        start = date.fromisoformat(request.args["from"]) if request.args.get("from") else None
+        end = date.fromisoformat(request.args["to"]) if request.args.get("to") else None
+        start, end = default_window(start, end)
+        filters = {name: request.args.get(name) for name in TREND_DIMENSIONS}
+        rows = trend(request.args.get("by") or None, request.args.get("interval", "day"), start, end, filters)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({
+        "by": request.args.get("by") or None,
+        "interval": request.args.get("interval", "day"),
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "rows": rows,
+    })
+
+@main.route("/api/parts/top", endpoint="api_parts_top")
+@read_only
+def api_parts_top():
+    """Most-used parts, optionally ?by=month|customer|site|model|fault_code.
+
+    ?from=/?to= bound incident creation dates; ?customer=, ?site=, ?model=
+    and ?fault_code= filter; ?limit= is per group (default 10).
+    """
+    by = request.args.get("by") or None
+    limit = min(max(request.args.get("limit", 10, type=int), 1), 100)
+    filters = {name: request.args.get(name) for name in PART_FILTERS}
+    try:
+        start = parse_window_bound(request.args.get("from"))
+        end = parse_window_bound(request.args.get("to"), end=True)
+        rows = top_parts(by, start, end, filters, limit)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({
+        "by": by,
+        "from": start.isoformat() if start else None,
+        "to": end.isoformat() if end else None,
+        "rows": rows,
+    })
+
+@main.route("/api/parts/search", endpoint="api_parts_search")
+@read_only
+def api_parts_search():
+    """Parts typeahead for select2: ?q= words match name-word prefixes."""
+    limit = min(max(request.args.get("limit", 20, type=int), 1), 100)
+    parts = get_part_index().search(request.args.get("q", ""), limit)
+    return jsonify({"results": [{"id": str(pid), "text": name} for pid, name in parts]})
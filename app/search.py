@@ -0,0 +1,149 @@
+"""
+Full-text search over incidents backed by an SQLite FTS5 index.
+
+The index is an external-content FTS5 table over incident.title, description,
+fault and parts_used. Triggers on the incident table keep it in sync on
+insert, update and delete, so every write path (forms, CLI, raw SQL) is
+covered without extra application code.
+"""
+
+import re
+from sqlalchemy import text
+from . import db
+
+FTS_TABLE = "incident_fts"
+FTS_COLUMNS = ("title", "description", "fault", "parts_used")
+
+# Column weights for bm25(): a hit in the title counts most.
+FTS_WEIGHTS = (10.0, 4.0, 2.0, 1.0)
+
+_cols = ", ".join(FTS_COLUMNS)
+_new_cols = ", ".join(f"new.{c}" for c in FTS_COLUMNS)
+_old_cols = ", ".join(f"old.{c}" for c in FTS_COLUMNS)
+
+SEARCH_DDL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        {_cols},
+        content='incident', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON incident BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, {_cols}) VALUES (new.id, {_new_cols});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON incident BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_cols}) VALUES ('delete', old.id, {_old_cols});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF {_cols} ON incident BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_cols}) VALUES ('delete', old.id, {_old_cols});
+        INSERT INTO {FTS_TABLE}(rowid, {_cols}) VALUES (new.id, {_new_cols});
+    END
+    """,
+]
+
+# "quoted phrase" | bare-word (optionally ending in *)
+_TOKEN_RE = re.compile(r'"([^"]*)"|(\S+)')
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def search_available():
+    """Return True when the bound database can serve FTS5 queries."""
+    return db.engine.dialect.name == "sqlite"
+
+
+def install_search_index(conn):
+    """Create the FTS5 table and sync triggers, backfilling if newly created."""
+    existed = conn.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :n"),
+        {"n": FTS_TABLE},
+    ).first()
+    for ddl in SEARCH_DDL:
+        conn.execute(text(ddl))
+    if not existed:
+        rebuild_search_index(conn)
+
+
+def drop_search_index(conn):
+    """Drop the FTS table and its triggers."""
+    for suffix in ("ai", "ad", "au"):
+        conn.execute(text(f"DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}"))
+    conn.execute(text(f"DROP TABLE IF EXISTS {FTS_TABLE}"))
+
+
+def rebuild_search_index(conn):
+    """Re-read every incident row into the FTS index."""
+    conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+
+
+def build_match_expression(q):
+    """Turn a search-box string into a safe FTS5 MATCH expression.
+
+    - ``"drive belt"`` is matched as a phrase
+    - ``belt*`` and bare words are matched as prefixes, so ``conv`` finds
+      "conveyor" the way the old substring search did
+    Everything else FTS5 treats as syntax (AND/OR/NEAR, column filters,
+    parentheses) is neutralised by quoting. Returns None if nothing searchable
+    is left.
+    """
+    terms = []
+    for phrase, word in _TOKEN_RE.findall(q or ""):
+        if phrase:
+            words = _WORD_RE.findall(phrase)
+            if words:
+                terms.append('"' + " ".join(words) + '"')
+            continue
+        for w in _WORD_RE.findall(word):
+            terms.append(f'"{w}"*')
+    return " ".join(terms) if terms else None
+
+
+def ranked_matches(q):
+    """Return a subquery of (id, rank) rows for incidents matching ``q``.
+
+    ``rank`` is bm25 with column weights; lower is better. Returns None when
+    ``q`` has no searchable terms.
+    """
+    expr = build_match_expression(q)
+    if expr is None:
+        return None
+    weights = ", ".join(str(w) for w in FTS_WEIGHTS)
+    return (
+        db.select(
+            db.literal_column("rowid").label("id"),
+            db.literal_column(f"bm25({FTS_TABLE}, {weights})").label("rank"),
+        )
+        .select_from(db.table(FTS_TABLE))
+        .where(db.text(f"{FTS_TABLE} MATCH :fts_q").bindparams(fts_q=expr))
+        .subquery("fts")
+    )
+
+
+def apply_search(query, q, model=None):
+    """Filter an Incident query by ``q``; return (query, rank_column).
+
+    With FTS available the query is joined to the ranked matches and
+    ``rank_column`` can be used to order by relevance. Otherwise, and for
+    the archive (``model`` ArchivedIncident, which the index doesn't
+    cover), it falls back to a case-insensitive substring match and
+    ``rank_column`` is None. A ``q`` with no searchable terms matches
+    nothing.
+    """
+    from .models import Incident
+
+    model = model or Incident
+    if model is not Incident or not search_available():
+        like = db.or_(*(getattr(model, c).icontains(q) for c in FTS_COLUMNS))
+        return query.filter(like), None
+
+    matches = ranked_matches(q)
+    if matches is None:
+        # Nothing searchable in q (e.g. only punctuation): no incident matches
+        return query.filter(db.false()), None
+    return query.join(matches, matches.c.id == Incident.id), matches.c.rank
@@ -0,0 +1,118 @@
+"""
+SQLite storage profile and read/write session routing.
+
+Every new SQLite connection gets the profile from the app config: WAL
+journal (readers no longer block on a writer and vice versa), a busy
+timeout so writers queue instead of failing with "database is locked", a
+synchronous level, memory-mapped I/O and a larger page cache.
+
+Read-only views are wrapped in @read_only. For the rest of that request the
+session sends its queries to a second engine whose connections are opened
+with ``PRAGMA query_only``; under WAL those reads run against a snapshot and
+never wait for a writer. READONLY_DATABASE_URL can point that engine
+elsewhere (e.g. a replica); by default it is the same database. Flushes and
+INSERT/UPDATE/DELETE statements always go to the primary engine.
+
+Both engines are disposed in a forked child (gunicorn --preload), so a
+worker never shares a pooled connection its parent opened.
+"""
+
+import os
+import weakref
+from functools import wraps
+from flask import current_app, g, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event
+from sqlalchemy.sql.dml import UpdateBase
+
+READONLY_ENGINE = "muims.readonly_engine"
+
+
+def _is_memory(url):
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+
+def apply_sqlite_profile(engine, config, read_only=False):
+    """Run the SQLITE_* pragmas on every new connection of ``engine``."""
+    if engine.dialect.name != "sqlite":
+        return
+    pragmas = [
+        f"busy_timeout = {int(config['SQLITE_BUSY_TIMEOUT_MS'])}",
+        f"synchronous = {config['SQLITE_SYNCHRONOUS']}",
+        f"mmap_size = {int(config['SQLITE_MMAP_SIZE'])}",
+        f"cache_size = {int(config['SQLITE_CACHE_SIZE'])}",
+        "temp_store = MEMORY",
+    ]
+    if read_only:
+        pragmas.append("query_only = ON")
+    elif not _is_memory(engine.url):
+        # Persistent in the database file; set by the writer side only
+        pragmas.insert(0, f"journal_mode = {config['SQLITE_JOURNAL_MODE']}")
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(f"PRAGMA {pragma}")
+        cursor.close()
+
+
+def configure_storage(app, db):
+    """Apply the storage profile and create the read-only engine."""
+    with app.app_context():
+        primary = db.engine
+        apply_sqlite_profile(primary, app.config)
+
+        url = app.config["READONLY_DATABASE_URL"] or primary.url
+        if _is_memory(primary.url) and not app.config["READONLY_DATABASE_URL"]:
+            # A second engine would see a different in-memory database
+            readonly = primary
+        else:
+            options = dict(app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {}))
+            readonly = create_engine(url, **options)
+            apply_sqlite_profile(readonly, app.config, read_only=True)
+    app.extensions[READONLY_ENGINE] = readonly
+    _dispose_after_fork(primary, readonly)
+
+
+def _dispose_after_fork(*engines):
+    refs = [weakref.ref(engine) for engine in set(engines)]
+
+    def dispose():
+        for ref in refs:
+            engine = ref()
+            if engine is not None:
+                # Drop the parent's connections without closing them under it
+                engine.dispose(close=False)
+
+    os.register_at_fork(after_in_child=dispose)
+
+
+def readonly_engine(app=None):
+    return (app or current_app).extensions.get(READONLY_ENGINE)
+
+
+def read_only(view):
+    """Run a view's queries on the read-only engine."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.read_only = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+class RoutingSession(Session):
+    """Session that reads from the read-only engine inside @read_only views."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (
+            bind is None
+            and not self._flushing
+            and not isinstance(clause, UpdateBase)
+            and has_app_context()
+            and g.get("read_only")
+        ):
+            engine = readonly_engine()
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
@@ -0,0 +1,212 @@
+"""
+Synthetic fleet data for load testing and profiling.
+
+Generates a reproducible (seeded) fleet: customers with sites, locations and
+machine models, machine serials at each site, and a failure history per
+machine with realistic fault codes, repair durations, parts and status mix.
+The fleet is merged into the reference tables so generated incidents pass
+the same validation as real ones.
+
+Incidents are written with set-based executemany INSERTs using pre-assigned
+ids. Incident triggers are suspended during the load and the search index,
+counters and versions are rebuilt afterwards in one pass, which is what
+makes million-row databases quick to build. Run it against a database
+nothing else is writing to.
+"""
+
+import random
+from itertools import accumulate
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from . import db
+from .derived import rebuild_derived, triggers_suspended
+from .models import Incident, Part, incident_parts
+from .parts_data import PARTS
+from .reference import get_reference, load_reference
+from .reference_data import FAULT_MAP
+
+_CUSTOMER_NAMES = [
+    "Acme Logistics", "Northwind", "Globex", "Initech", "Umbrella Freight",
+    "Stark Parcel", "Wayne Post", "Tyrell Mail", "Cyberdyne Sorting", "Soylent Express",
+    "Hooli Depot", "Vandelay Imports", "Wonka Distribution", "Oscorp Cargo", "Aperture Hub",
+]
+_CITIES = [
+    ("Leeds", "United Kingdom"), ("Glasgow", "United Kingdom"), ("Cardiff", "United Kingdom"),
+    ("Dublin", "Ireland"), ("Rotterdam", "Netherlands"), ("Hamburg", "Germany"),
+    ("Lyon", "France"), ("Milan", "Italy"), ("Madrid", "Spain"), ("Warsaw", "Poland"),
+    ("Doha", "Qatar"), ("Riyadh", "Saudi Arabia"), ("Abu Dhabi", "UAE"), ("Salalah", "Oman"),
+    ("Nairobi", "Kenya"), ("Lagos", "Nigeria"), ("Johannesburg", "South Africa"),
+    ("Mumbai", "India"), ("Singapore", "Singapore"), ("Sydney", "Australia"),
+]
+_MODELS = ["7000", "V-Series", "Cobra", "X-Pro"]
+
+# (value, weight) mixes
+_SEVERITIES = [("Low", 5), ("Medium", 4), ("High", 1)]
+_CATEGORIES = [("mechanical", 6), ("electrical", 3), ("software", 1)]
+
+_TITLES = {
+    "mechanical": ["Belt slipping", "Jam in feeder", "Bearing noise", "Roller worn", "Gearbox vibration"],
+    "electrical": ["Sensor not responding", "Power supply trip", "Motor overload", "Cable fault", "UPS alarm"],
+    "software": ["PLC fault", "HMI frozen", "Sorting logic error", "Network timeout", "Label printer offline"],
+}
+
+
+def _weighted(rnd, pairs):
+    values, weights = zip(*pairs)
+    return rnd.choices(values, weights)[0]
+
+
+def build_fleet(rnd, machines, customers=None):
+    """Return (customer_map, site_serial_map, machine list) for a fleet.
+
+    Each machine is a dict with customer, site, location, model and serial.
+    """
+    customers = customers or max(1, min(len(_CUSTOMER_NAMES), machines // 50 or 1))
+    names = [
+        _CUSTOMER_NAMES[i] if i < len(_CUSTOMER_NAMES) else f"Customer {i + 1:03d}"
+        for i in range(customers)
+    ]
+    customer_map = {"customers": names, "sites": {}, "locations": {}, "models": {}}
+    sites = []
+    for name in names:
+        cities = rnd.sample(_CITIES, rnd.randint(1, 4))
+        site_names = [f"{name} {city}" for city, _country in cities]
+        customer_map["sites"][name] = site_names
+        customer_map["locations"][name] = sorted({country for _city, country in cities})
+        customer_map["models"][name] = sorted(rnd.sample(_MODELS, rnd.randint(1, 3)))
+        sites += [(name, site, country) for site, (_city, country) in zip(site_names, cities)]
+
+    site_serial_map = {}
+    fleet = []
+    for n in range(machines):
+        customer, site, country = sites[n % len(sites)]
+        model = rnd.choice(customer_map["models"][customer])
+        serial = f"{model[:2].upper()}{n + 1:06d}"
+        site_serial_map.setdefault(site, []).append([serial, model])
+        fleet.append({"customer": customer, "site": site, "location": country,
+                      "model": model, "serial": serial})
+    return customer_map, site_serial_map, fleet
+
+
+def _merge_reference(conn, ref, customer_map, site_serial_map):
+    """Add the synthetic fleet to the existing reference data ``ref``."""
+    merged = {
+        "customers": list(dict.fromkeys(ref.customers + customer_map["customers"])),
+        "sites": {**ref.customer_map["sites"], **customer_map["sites"]},
+        "locations": {**ref.customer_map["locations"], **customer_map["locations"]},
+        "models": {**ref.customer_map["models"], **customer_map["models"]},
+    }
+    serials = {**ref.site_serial_map, **site_serial_map}
+    load_reference(conn, merged, ref.fault_map or FAULT_MAP, serials)
+    return ref.fault_map or FAULT_MAP
+
+
+def _ensure_parts(conn):
+    """Make sure the parts catalogue is populated; return its ids."""
+    ids = [pid for (pid,) in conn.execute(db.select(Part.id))]
+    if not ids:
+        now = datetime.utcnow()
+        conn.execute(db.insert(Part), [{"name": name, "created_at": now} for name in dict.fromkeys(PARTS)])
+        ids = [pid for (pid,) in conn.execute(db.select(Part.id))]
+    return ids
+
+
+def generate_incidents(rnd, fleet, fault_map, part_ids, count, days, now):
+    """Yield (incident_row, part_ids) tuples, oldest first."""
+    codes = sorted(fault_map)
+    start = now - timedelta(days=days)
+    span = (now - start).total_seconds()
+    # A few machines fail much more often than the rest
+    cum_weights = list(accumulate(rnd.paretovariate(1.5) for _ in fleet))
+    offsets = sorted(rnd.random() * span for _ in range(count))
+    for offset in offsets:
+        m = rnd.choices(fleet, cum_weights=cum_weights)[0]
+        category = _weighted(rnd, _CATEGORIES)
+        code = rnd.choice(codes)
+        started = start + timedelta(seconds=offset)
+        age_days = (now - started).days
+        # Repairs are lognormal around ~1.5h; the newest incidents may still be open
+        duration = timedelta(minutes=max(5, int(rnd.lognormvariate(4.5, 0.9))))
+        if age_days < 2 and rnd.random() < 0.5:
+            status, ended = rnd.choice(["Open", "In Progress"]), None
+        elif age_days < 7 and rnd.random() < 0.1:
+            status, ended = "In Progress", None
+        else:
+            status, ended = "Resolved", min(started + duration, now)
+        row = {
+            "title": rnd.choice(_TITLES[category]),
+            "description": f"{fault_map[code]} reported on {m['serial']}.",
+            "customer_name": m["customer"],
+            "site_name": m["site"],
+            "location": m["location"],
+            "machine_model": m["model"],
+            "machine_serial": m["serial"],
+            "fault_code": code,
+            "fault": fault_map[code],
+            "start_time": started,
+            "end_time": ended,
+            "preventive_maintenance": rnd.random() < 0.1,
+            "category": category,
+            "severity": _weighted(rnd, _SEVERITIES),
+            "status": status,
+            "created_at": started + timedelta(minutes=rnd.randint(0, 30)),
+        }
+        row["updated_at"] = max(row["created_at"], ended) if ended else row["created_at"]
+        used = rnd.sample(part_ids, min(len(part_ids), rnd.choice([0, 0, 1, 1, 2, 3])))
+        yield row, used
+
+
+def seed_synthetic(incidents, machines, customers=None, days=730, seed=42,
+                   batch_size=20000, log=print):
+    """Generate a synthetic fleet and ``incidents`` incidents; return the count.
+
+    The same seed gives the same rows; timestamps are relative to now.
+    """
+    rnd = random.Random(seed)
+    now = datetime.utcnow().replace(microsecond=0)
+    customer_map, site_serial_map, fleet = build_fleet(rnd, machines, customers)
+    started = time.monotonic()
+    ref = get_reference()
+    # Release the session's read transaction before writing on another connection
+    db.session.rollback()
+
+    with db.engine.begin() as conn:
+        fault_map = _merge_reference(conn, ref, customer_map, site_serial_map)
+        part_ids = _ensure_parts(conn)
+        part_names = dict(conn.execute(db.select(Part.id, Part.name)).all())
+        # Past every id handed out before, archived and deleted ones included
+        next_id = conn.execute(text(
+            "SELECT max(coalesce((SELECT max(id) FROM incident), 0),"
+            " coalesce((SELECT seq FROM sqlite_sequence WHERE name = 'incident'), 0)) + 1"
+        )).scalar()
+    log(f"Fleet: {len(customer_map['customers'])} customers, {len(site_serial_map)} sites, {len(fleet)} machines")
+
+    table = Incident.__table__
+    written = 0
+    with db.engine.begin() as conn:
+        with triggers_suspended(conn):
+            rows, links = [], []
+            for row, used in generate_incidents(rnd, fleet, fault_map, part_ids, incidents, days, now):
+                row["id"] = next_id
+                row["parts_used"] = ", ".join(part_names[p] for p in used) or None
+                links += [{"incident_id": next_id, "part_id": p} for p in used]
+                rows.append(row)
+                next_id += 1
+                if len(rows) >= batch_size:
+                    conn.execute(table.insert(), rows)
+                    if links:
+                        conn.execute(incident_parts.insert(), links)
+                    written += len(rows)
+                    rows, links = [], []
+                    log(f"{written:,} incidents ({written / (time.monotonic() - started):,.0f}/s)")
+            if rows:
+                conn.execute(table.insert(), rows)
+                if links:
+                    conn.execute(incident_parts.insert(), links)
+                written += len(rows)
+        log("Rebuilding search index and counters...")
+        rebuild_derived(conn)
+        conn.execute(text("ANALYZE"))
+    log(f"Wrote {written:,} incidents in {time.monotonic() - started:.1f}s")
+    return written
@@ -0,0 +1,51 @@
+"""
+Cold-start work done before the first request.
+
+A fresh worker otherwise compiles each template, and loads the reference
+data and part index, on the first request that needs them. warmup() does
+that up front. With WARMUP_ON_START under `gunicorn --preload` it runs once
+in the master and every forked worker inherits the result; `flask warmup`
+at deploy time fills the Jinja bytecode cache on disk, so a worker that does
+compile a template only loads its bytecode.
+
+The schema is not created or upgraded here (that is `flask db-upgrade`); a
+database with pending migrations gets a warning and no cache priming.
+"""
+
+import time
+from sqlalchemy.exc import SQLAlchemyError
+from . import migrations
+from .parts import get_part_index
+from .reference import get_reference
+
+
+def compile_templates(app):
+    """Compile every HTML template; return their names."""
+    names = [name for name in app.jinja_env.list_templates() if name.endswith(".html")]
+    for name in names:
+        app.jinja_env.get_template(name)
+    return names
+
+
+def warmup(app):
+    """Compile the templates and prime the reference caches.
+
+    Returns {"templates", "pending", "seconds"}; ``pending`` is the number
+    of migrations not yet applied, or None if the database has no schema.
+    """
+    started = time.perf_counter()
+    templates = compile_templates(app)
+    with app.app_context():
+        try:
+            pending = len(migrations.pending())
+        except SQLAlchemyError:
+            pending = None
+        if pending == 0:
+            get_reference()
+            get_part_index()
+        else:
+            app.logger.warning(
+                "Database schema is not up to date (%s); run `flask db-upgrade`",
+                "not created" if pending is None else f"{pending} migration(s) pending",
+            )
+    return {"templates": len(templates), "pending": pending, "seconds": time.perf_counter() - started}
@@ -0,0 +1,350 @@
+"""
+Benchmarks for the hot request paths.
+
+Runs offline through Flask's test client against synthetic databases
+(see app/synthetic.py) of one or more sizes, and reports per endpoint:
+latency percentiles, SQL statements per request, response size and peak
+Python memory of one traced request.
+
+    python -m benchmarks.run                       # 10k and 100k incidents
+    python -m benchmarks.run --sizes 10k,100k,1m --repeat 50
+    python -m benchmarks.run --compare benchmarks/results/<old>.json
+
+Databases are built once per size and seed under --data-dir and copied to
+a scratch file for each run, so POSTs never change the cached copy. Each
+size runs in a fresh process so module-level caches and memory peaks do not
+leak between sizes. Results are written as JSON (default
+benchmarks/results/<commit>.json); --compare prints the change against an
+earlier file and exits non-zero when a case got slower than --threshold or
+issues more queries.
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from multiprocessing import get_context
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+DATA_DIR = os.path.join(ROOT, "instance", "bench")
+
+# Export reads every row, so it gets fewer iterations than page requests
+EXPORT_REPEAT_DIVISOR = 5
+
+
+def parse_size(value):
+    value = value.strip().lower()
+    scale = {"k": 1_000, "m": 1_000_000}.get(value[-1:], 1)
+    return int(float(value.rstrip("km")) * scale)
+
+
+def git_commit():
+    def git(*args):
+        return subprocess.run(["git", *args], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    return git("rev-parse", "--short", "HEAD") or "unknown", bool(git("status", "--porcelain", "--untracked-files=no"))
+
+
+def url(path, **args):
+    return f"{path}?{urlencode(args)}" if args else path
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+    if len(ordered) > 1:
+        cuts = statistics.quantiles(ordered, n=100, method="inclusive")
+        p50, p90, p95, p99 = cuts[49], cuts[89], cuts[94], cuts[98]
+    else:
+        p50 = p90 = p95 = p99 = ordered[0]
+    return {
+        "min": ordered[0], "p50": p50, "p90": p90, "p95": p95, "p99": p99,
+        "max": ordered[-1], "mean": statistics.fmean(ordered),
+    }
+
+
+# --------------------------------------------------------------------------
+# Per-size worker (runs in its own process)
+# --------------------------------------------------------------------------
+
+def _database(size, seed, data_dir, log):
+    """Return the path of the pristine database for ``size``, building it if needed."""
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f"incidents-{size}-seed{seed}.db")
+    if os.path.exists(path):
+        return path
+    tmp = f"{path}.building"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp}"
+    from app import create_app
+    from app.migrations import upgrade
+    from app.synthetic import seed_synthetic
+
+    app = create_app()
+    with app.app_context():
+        upgrade()
+        seed_synthetic(size, machines=max(200, size // 100), seed=seed, log=log)
+        from app import db
+        db.session.remove()
+        db.engine.dispose()
+    os.replace(tmp, path)
+    return path
+
+
+def _cases(app, seed):
+    """Return [(name, method, url_or_urls, data, repeat_divisor)] for the loaded database."""
+    import random
+    from app import db
+    from app.models import Incident
+    from app.pagination import encode_cursor
+    from app.reference import get_reference
+    from sqlalchemy import String, type_coerce
+
+    rnd = random.Random(seed)
+    with app.test_request_context():
+        ref = get_reference()
+        top_customer = db.session.execute(
+            db.select(Incident.customer_name, db.func.count())
+            .group_by(Incident.customer_name).order_by(db.func.count().desc()).limit(1)
+        ).scalar() or ""
+        max_id = db.session.execute(db.select(db.func.max(Incident.id))).scalar() or 1
+        created_raw, cursor_id = db.session.execute(
+            db.select(type_coerce(Incident.created_at, String), Incident.id)
+            .order_by(Incident.created_at.desc(), Incident.id.desc()).offset(1000).limit(1)
+        ).first() or ("", 0)
+        latest = db.session.execute(db.select(db.func.max(Incident.created_at))).scalar() or datetime.utcnow()
+
+        # A valid new-incident form for the first customer with a machine
+        customer = next(c for c in ref.customers if any(ref.serials_for(s) for s in ref.sites_for(c)))
+        site = next(s for s in ref.sites_for(customer) if ref.serials_for(s))
+        serial = ref.serials_for(site)[0]
+        fault_code = sorted(ref.fault_map)[0]
+        new_incident = {
+            "title": "Benchmark incident",
+            "description": "Created by the benchmark suite.",
+            "customer_name": customer,
+            "site_name": site,
+            "location": (ref.locations_for(customer) or [""])[0],
+            "machine_model": ref.model_for(site, serial),
+            "machine_serial": serial,
+            "fault_code": fault_code,
+            "fault": ref.fault_map[fault_code],
+            "start_time": (latest - timedelta(hours=2)).strftime("%Y-%m-%dT%H:%M"),
+            "end_time": (latest - timedelta(hours=1)).strftime("%Y-%m-%dT%H:%M"),
+            "category": "mechanical",
+            "severity": "Medium",
+            "status": "Resolved",
+        }
+
+    month_ago = (latest - timedelta(days=30)).strftime("%Y-%m-%dT%H:%M")
+    details = [f"/incident/{rnd.randint(1, max_id)}" for _ in range(200)]
+    return [
+        ("index", "GET", "/", None, 1),
+        ("incidents", "GET", "/incidents", None, 1),
+        ("incidents_q", "GET", url("/incidents", q="belt"), None, 1),
+        ("incidents_q_phrase", "GET", url("/incidents", q='"power supply"'), None, 1),
+        ("incidents_customer", "GET", url("/incidents", customer=top_customer), None, 1),
+        ("incidents_severity", "GET", url("/incidents", severity="High"), None, 1),
+        ("incidents_status", "GET", url("/incidents", status="Open"), None, 1),
+        ("incidents_category", "GET", url("/incidents", category="software"), None, 1),
+        ("incidents_date_range", "GET", url("/incidents", date_from=month_ago), None, 1),
+        ("incidents_combined", "GET",
+         url("/incidents", customer=top_customer, status="Resolved", severity="High"), None, 1),
+        ("incidents_cursor_deep", "GET",
+         url("/incidents", after=encode_cursor(created_raw, cursor_id)), None, 1),
+        ("incidents_offset_deep", "GET", url("/incidents", page=100), None, 1),
+        ("incidents_export", "GET", "/incidents/export.csv", None, EXPORT_REPEAT_DIVISOR),
+        ("incidents_export_filtered", "GET",
+         url("/incidents/export.csv", customer=top_customer, severity="High"), None, EXPORT_REPEAT_DIVISOR),
+        ("incident_detail", "GET", details, None, 1),
+        ("new_incident_form", "GET", "/incident/new", None, 1),
+        ("new_incident_post", "POST", "/incident/new", new_incident, 1),
+    ]
+
+
+def _request(client, method, url, data):
+    response = client.open(url, method=method, data=data)
+    size = sum(len(chunk) for chunk in response.response)  # drains streamed bodies
+    response.close()
+    # A form POST that does not redirect failed validation
+    if response.status_code >= 400 or (method == "POST" and response.status_code != 302):
+        raise RuntimeError(f"{method} {url} returned {response.status_code}")
+    return size
+
+
+def run_size(size, seed, repeat, warmup, data_dir, only=None):
+    """Benchmark every case against a ``size``-incident database; return the results."""
+    def log(message):
+        print(f"[{size:,}] {message}", flush=True)
+
+    started = time.monotonic()
+    pristine = _database(size, seed, data_dir, log)
+    build_seconds = time.monotonic() - started
+    scratch = os.path.join(data_dir, f"scratch-{os.getpid()}.db")
+    shutil.copyfile(pristine, scratch)
+
+    try:
+        os.environ["DATABASE_URL"] = f"sqlite:///{scratch}"
+        from sqlalchemy import event
+        from app import create_app, db
+        from app.migrations import upgrade
+
+        app = create_app()
+        with app.app_context():
+            upgrade()  # databases built before a newer migration
+        app.config["WTF_CSRF_ENABLED"] = False
+        client = app.test_client()
+
+        statements = 0
+
+        def count(*_args):
+            nonlocal statements
+            statements += 1
+
+        with app.app_context():
+            from app.storage import readonly_engine
+            for engine in {db.engine, readonly_engine(app) or db.engine}:
+                event.listen(engine, "before_cursor_execute", count)
+
+        results = {}
+        for name, method, urls, data, divisor in _cases(app, seed):
+            if only and name not in only:
+                continue
+            urls = urls if isinstance(urls, list) else [urls]
+            n = max(3, repeat // divisor)
+            for i in range(warmup):
+                _request(client, method, urls[i % len(urls)], data)
+
+            timings, queries = [], []
+            size_bytes = 0
+            for i in range(n):
+                statements = 0
+                t0 = time.perf_counter()
+                size_bytes = _request(client, method, urls[i % len(urls)], data)
+                timings.append((time.perf_counter() - t0) * 1000)
+                queries.append(statements)
+
+            # Peak memory from one extra request, kept out of the timings
+            tracemalloc.start()
+            _request(client, method, urls[0], data)
+            _current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            results[name] = {
+                "method": method,
+                "url": urls[0],
+                "iterations": n,
+                "latency_ms": percentiles(timings),
+                "queries": {"median": statistics.median(queries), "max": max(queries)},
+                "response_bytes": size_bytes,
+                "peak_memory_kib": round(peak / 1024, 1),
+            }
+            log(f"{name:<28} p50 {results[name]['latency_ms']['p50']:9.2f} ms"
+                f"  p95 {results[name]['latency_ms']['p95']:9.2f} ms"
+                f"  {results[name]['queries']['median']:>4g} queries"
+                f"  {results[name]['peak_memory_kib']:>10,.0f} KiB")
+
+        with app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+    finally:
+        for suffix in ("", "-wal", "-shm", "-journal"):
+            if os.path.exists(scratch + suffix):
+                os.remove(scratch + suffix)
+
+    return {"incidents": size, "build_seconds": round(build_seconds, 2), "cases": results}
+
+
+# --------------------------------------------------------------------------
+# Comparison
+# --------------------------------------------------------------------------
+
+def compare(old, new, threshold):
+    """Print per-case changes between two result files; return the regressions."""
+    regressions = []
+    for size, run in new["sizes"].items():
+        before = old.get("sizes", {}).get(size)
+        if not before:
+            continue
+        print(f"\n{int(size):,} incidents: {old['meta']['commit']} -> {new['meta']['commit']}")
+        print(f"{'case':<28} {'p50 ms':>19} {'p95 ms':>19} {'queries':>9}")
+        for name, case in run["cases"].items():
+            prev = before["cases"].get(name)
+            if not prev:
+                continue
+            p50_old, p50_new = prev["latency_ms"]["p50"], case["latency_ms"]["p50"]
+            p95_old, p95_new = prev["latency_ms"]["p95"], case["latency_ms"]["p95"]
+            q_old, q_new = prev["queries"]["median"], case["queries"]["median"]
+            change = (p50_new - p50_old) / p50_old if p50_old else 0.0
+            flag = ""
+            if change > threshold or q_new > q_old:
+                flag = "  REGRESSION"
+                regressions.append((size, name))
+            print(f"{name:<28} {p50_old:8.2f} -> {p50_new:8.2f} {p95_old:8.2f} -> {p95_new:8.2f}"
+                  f" {q_old:>3g} -> {q_new:<3g} {change:+7.0%}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--sizes", default="10k,100k", help="Comma separated incident counts (e.g. 10k,100k,1m).")
+    parser.add_argument("--repeat", type=int, default=20, help="Timed requests per case.")
+    parser.add_argument("--warmup", type=int, default=2, help="Untimed requests per case.")
+    parser.add_argument("--seed", type=int, default=42, help="Synthetic data seed.")
+    parser.add_argument("--cases", help="Comma separated case names to run (default: all).")
+    parser.add_argument("--data-dir", default=DATA_DIR, help="Where the generated databases are kept.")
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/<commit>.json).")
+    parser.add_argument("--compare", help="Earlier results file to compare against.")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Relative p50 slowdown counted as a regression by --compare.")
+    args = parser.parse_args(argv)
+
+    sizes = [parse_size(s) for s in args.sizes.split(",") if s.strip()]
+    only = {c.strip() for c in args.cases.split(",")} if args.cases else None
+    commit, dirty = git_commit()
+    results = {
+        "meta": {
+            "commit": commit,
+            "dirty": dirty,
+            "timestamp": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "repeat": args.repeat,
+        },
+        "sizes": {},
+    }
+
+    for size in sizes:
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+            run = pool.submit(run_size, size, args.seed, args.repeat, args.warmup, args.data_dir, only)
+            results["sizes"][str(size)] = run.result()
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit}{'-dirty' if dirty else ''}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressions = compare(json.load(f), results, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s).")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,16 @@
+"""
+Gunicorn settings for MUIMS: `gunicorn run:app` picks this file up.
+
+The app is loaded once in the master and forked into the workers, with the
+templates compiled and reference caches loaded beforehand (WARMUP_ON_START),
+so a new worker answers its first request without that cold-start work.
+Run `flask db-upgrade` before starting; workers no longer touch the schema.
+"""
+
+import os
+
+os.environ.setdefault("WARMUP_ON_START", "True")
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:5001")
+workers = int(os.environ.get("WEB_CONCURRENCY", 4))
+preload_app = True
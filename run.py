@@ -10,6 +10,12 @@ from app import create_app
 app = create_app()
 
 if __name__ == '__main__':
+    # The development server brings the schema up to date itself; deployments
+    # run `flask db-upgrade` once instead of on every worker start
+    with app.app_context():
+        from app.migrations import upgrade
+        upgrade()
+
     debug_mode = os.environ.get('FLASK_DEBUG', 'False').lower() == 'true'
     port = int(os.environ.get('FLASK_RUN_PORT', 5001))
     app.run(debug=debug_mode, host='0.0.0.0', port=port)
@@ -0,0 +1,66 @@
+"""Shared fixtures: an app on a fresh, fully migrated database per test."""
+
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import create_app, db, facets, parts, reference, reliability
+from app.migrations import upgrade
+from app.models import Incident
+from app.storage import readonly_engine
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'muims.db'}")
+    monkeypatch.setenv("JINJA_CACHE_DIR", "")
+    monkeypatch.setenv("METRICS_ENABLED", "False")
+    monkeypatch.setenv("RENDER_CACHE_SIZE", "0")
+    monkeypatch.setenv("INCIDENTS_COUNT_TTL", "0")
+    # Process-wide caches are keyed on versions that restart with every database
+    monkeypatch.setattr(reference, "_cached", None)
+    monkeypatch.setattr(parts, "_index", None)
+    for module in (facets, parts, reliability):
+        monkeypatch.setattr(module, "_cache", OrderedDict())
+
+    app = create_app()
+    app.config["WTF_CSRF_ENABLED"] = False
+    with app.app_context():
+        upgrade()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        readonly_engine(app).dispose()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def make_incident(app):
+    """Insert an incident and return its id; keywords override the defaults."""
+    def make(**values):
+        values.setdefault("title", "Incident")
+        values.setdefault("customer_name", "VLTX")
+        with app.app_context():
+            incident = Incident(**values)
+            db.session.add(incident)
+            db.session.commit()
+            return incident.id
+    return make
+
+
+@pytest.fixture
+def make_old_resolved(make_incident):
+    """Insert an incident resolved and untouched for a year, ready to archive."""
+    def make(**values):
+        created = values.pop("created_at", datetime.utcnow() - timedelta(days=400))
+        return make_incident(
+            status="Resolved", created_at=created, start_time=created,
+            end_time=created + timedelta(hours=2), updated_at=created + timedelta(hours=2), **values,
+        )
+    return make
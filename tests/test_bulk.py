@@ -0,0 +1,56 @@
+"""POST /api/incidents/status: bulk status transitions."""
+
+from app import db
+from app.models import Incident
+
+URL = "/api/incidents/status"
+
+
+def _status(app, ident):
+    with app.app_context():
+        incident = db.session.get(Incident, ident)
+        return incident.status, incident.row_version
+
+
+def test_ids(app, client, make_incident):
+    open_id = make_incident(status="Open")
+    done_id = make_incident(status="Resolved")
+    response = client.post(URL, json={"status": "Resolved", "ids": [open_id, done_id, 9999]})
+    assert response.status_code == 200
+    assert response.json == {"status": "Resolved", "updated": [open_id],
+                             "unchanged": [done_id], "not_found": [9999]}
+    assert _status(app, open_id) == ("Resolved", 2)
+    assert _status(app, done_id) == ("Resolved", 1)
+
+
+def test_filter(app, client, make_incident):
+    bol = [make_incident(customer_name="Bol", status="Open") for _ in range(2)]
+    other = make_incident(customer_name="VLTX", status="Open")
+    response = client.post(URL, json={"status": "In Progress", "filter": {"customer": "Bol"}})
+    assert response.status_code == 200
+    assert response.json["updated"] == bol
+    assert _status(app, other)[0] == "Open"
+
+
+def test_filter_matching_everything_is_rejected(app, client, make_incident):
+    ident = make_incident(status="Open")
+    for body in ({"filter": {}}, {"filter": {"sort": "duration_desc"}}, {"filter": {"date_from": "garbage"}}):
+        response = client.post(URL, json={"status": "Resolved", **body})
+        assert response.status_code == 400, body
+        assert "no conditions" in response.json["error"]
+    assert _status(app, ident) == ("Open", 1)
+
+
+def test_bad_requests(client, make_incident):
+    ident = make_incident()
+    for body in ({"status": "Gone", "ids": [ident]}, {"status": "Resolved"},
+                 {"status": "Resolved", "ids": []}, {"status": "Resolved", "ids": ["x"]},
+                 {"status": "Resolved", "filter": "customer=Bol"}):
+        assert client.post(URL, json=body).status_code == 400, body
+
+
+def test_bad_json_body(client):
+    for data in ("[1, 2]", '"Resolved"', "null", "{not json"):
+        response = client.post(URL, data=data, content_type="application/json")
+        assert response.status_code == 400, data
+        assert response.json == {"error": "Send a JSON object"}
@@ -0,0 +1,78 @@
+"""GET /api/incidents/changes: the NDJSON change feed."""
+
+import json
+from datetime import timedelta
+
+from app import db
+from app.archive import archive_incidents
+from app.models import Incident
+from app.parts import set_incident_parts
+
+URL = "/api/incidents/changes"
+
+
+def _feed(client, since=None, limit=None):
+    args = {k: v for k, v in (("since", since), ("limit", limit)) if v is not None}
+    response = client.get(URL, query_string=args)
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    last = lines.pop()
+    assert last["next"] == response.headers["X-Next-Since"]
+    assert last["more"] == (response.headers["X-More"] == "true")
+    return lines, last
+
+
+def test_since_and_limit(client, make_incident):
+    ids = [make_incident(title=f"Incident {n}") for n in range(5)]
+    lines, last = _feed(client, limit=2)
+    assert [line["id"] for line in lines] == ids[:2]
+    assert last == {"next": lines[-1]["seq"], "more": True}
+    assert lines[0]["incident"]["title"] == "Incident 0"
+
+    seen = [line["id"] for line in lines]
+    while last["more"]:
+        lines, last = _feed(client, since=last["next"], limit=2)
+        seen += [line["id"] for line in lines]
+    assert seen == ids
+    assert _feed(client, since=last["next"]) == ([], {"next": last["next"], "more": False})
+
+
+def test_edits_move_to_the_end(app, client, make_incident):
+    first, second = make_incident(), make_incident()
+    _lines, last = _feed(client)
+    with app.app_context():
+        incident = db.session.get(Incident, first)
+        incident.title = "Renamed"
+        set_incident_parts(incident, [], "Belt x2")
+        db.session.commit()
+    lines, _last = _feed(client, since=last["next"])
+    assert [line["id"] for line in lines] == [first]
+    assert lines[0]["incident"]["title"] == "Renamed"
+    assert [(p["name"], p["quantity"]) for p in lines[0]["incident"]["parts"]] == [("Belt", 2)]
+    assert [line["id"] for line in _feed(client)[0]] == [second, first]
+
+
+def test_deletes_are_tombstones(app, client, make_incident):
+    ident = make_incident()
+    _lines, last = _feed(client)
+    with app.app_context():
+        db.session.delete(db.session.get(Incident, ident))
+        db.session.commit()
+    lines, _last = _feed(client, since=last["next"])
+    assert lines == [{"seq": lines[0]["seq"], "id": ident, "deleted": True}]
+
+
+def test_archived_rows_keep_their_line(app, client, make_old_resolved):
+    ident = make_old_resolved(title="Gearbox rebuild")
+    before, last = _feed(client)
+    with app.app_context():
+        assert archive_incidents(timedelta(days=30)) == 1
+    assert _feed(client, since=last["next"])[0] == []
+    lines, _last = _feed(client)
+    assert [(line["seq"], line["id"], line["deleted"]) for line in lines] == [(before[0]["seq"], ident, False)]
+    assert lines[0]["incident"]["title"] == "Gearbox rebuild"
+
+
+def test_bad_arguments(client):
+    for args in ({"since": "abc"}, {"since": "-1"}, {"limit": "0"}):
+        assert client.get(URL, query_string=args).status_code == 400, args
@@ -0,0 +1,77 @@
+"""Conditional GET: 304s for the incident list, detail page and CSV export."""
+
+from datetime import datetime, timezone
+
+import pytest
+
+from app import conditional, db
+from app.models import Incident, Part
+from app.parts import set_incident_parts
+
+
+@pytest.fixture(autouse=True)
+def frozen_minute(monkeypatch):
+    # Responses that can show an open incident's duration change every minute
+    monkeypatch.setattr(conditional, "current_minute", lambda: datetime(2024, 5, 1, 12, 0, tzinfo=timezone.utc))
+
+
+def _revalidate(client, url):
+    """GET ``url``; return its ETag and a function that re-requests it with that ETag."""
+    first = client.get(url)
+    assert first.status_code == 200
+    assert first.headers["Cache-Control"] == "private, no-cache"
+    etag = first.headers["ETag"]
+    return etag, lambda: client.get(url, headers={"If-None-Match": etag}).status_code
+
+
+def _edit(app, ident, **values):
+    with app.app_context():
+        incident = db.session.get(Incident, ident)
+        for name, value in values.items():
+            setattr(incident, name, value)
+        db.session.commit()
+
+
+@pytest.mark.parametrize("url", ["/incidents", "/incidents?customer=VLTX", "/incidents/export.csv", "/incident/{id}"])
+def test_not_modified_until_edited(app, client, make_incident, url):
+    ident = make_incident(title="Conveyor belt torn")
+    _etag, again = _revalidate(client, url.format(id=ident))
+    assert again() == 304
+    _edit(app, ident, title="Conveyor belt replaced")
+    assert again() == 200
+
+
+def test_other_query_string_is_modified(client, make_incident):
+    make_incident()
+    etag, _again = _revalidate(client, "/incidents")
+    assert client.get("/incidents?customer=Bol", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_if_modified_since(client, make_incident):
+    ident = make_incident(status="Resolved", start_time=datetime(2024, 1, 1, 8), end_time=datetime(2024, 1, 1, 9))
+    first = client.get(f"/incident/{ident}")
+    since = first.headers["Last-Modified"]
+    assert client.get(f"/incident/{ident}", headers={"If-Modified-Since": since}).status_code == 304
+
+
+def test_part_rename(app, client, make_incident):
+    ident = make_incident()
+    with app.app_context():
+        set_incident_parts(db.session.get(Incident, ident), [], "Belt")
+        db.session.commit()
+    detail = _revalidate(client, f"/incident/{ident}")[1]
+    listing = _revalidate(client, "/incidents")[1]
+    assert detail() == 304 and listing() == 304
+    with app.app_context():
+        db.session.execute(db.select(Part).filter_by(name="Belt")).scalar_one().name = "Drive belt"
+        db.session.commit()
+    assert detail() == 200 and listing() == 200
+    assert "Drive belt" in client.get(f"/incident/{ident}").get_data(as_text=True)
+
+
+def test_minute_rolls_over_for_open_incidents(client, make_incident, monkeypatch):
+    ident = make_incident(start_time=datetime(2024, 5, 1, 11, 0))
+    again = _revalidate(client, f"/incident/{ident}")[1]
+    assert again() == 304
+    monkeypatch.setattr(conditional, "current_minute", lambda: datetime(2024, 5, 1, 12, 1, tzinfo=timezone.utc))
+    assert again() == 200
@@ -0,0 +1,83 @@
+"""Bulk import from CSV and JSON Lines."""
+
+import json
+from datetime import datetime
+
+import pytest
+
+from app import db, importer
+from app.importer import import_incidents, read_checkpoint
+from app.models import Incident
+
+
+def _write_jsonl(path, records):
+    path.write_text("".join(r if isinstance(r, str) else json.dumps(r) + "\n" for r in records))
+    return str(path)
+
+
+def _titles():
+    return db.session.execute(db.select(Incident.title).order_by(Incident.id)).scalars().all()
+
+
+def test_csv(app, tmp_path):
+    path = tmp_path / "incidents.csv"
+    path.write_text(
+        "title,customer_name,start_time,end_time,status,parts_used\n"
+        "Belt torn,VLTX,2024-01-02 08:00,2024-01-02 09:30,Resolved,Belt x2\n"
+    )
+    with app.app_context():
+        assert import_incidents(str(path), log=lambda msg: None) == (1, 0)
+        incident = db.session.execute(db.select(Incident)).scalar_one()
+        assert incident.created_at == datetime(2024, 1, 2, 8, 0)
+        assert incident.updated_at == datetime(2024, 1, 2, 9, 30)
+        assert [(p.part.name, p.quantity) for p in incident.usage] == [("Belt", 2)]
+
+
+def test_rejects(app, tmp_path):
+    path = _write_jsonl(tmp_path / "incidents.jsonl", [
+        {"title": "Good", "customer_name": "VLTX", "start_time": "2024-01-02T10:00:00+02:00"},
+        {"title": "", "customer_name": "Nobody"},
+        {"title": "Backwards", "customer_name": "VLTX", "start_time": "2024-01-02 10:00", "end_time": "2024-01-02 09:00"},
+        {"title": "Bad time", "customer_name": "VLTX", "start_time": 5},
+        "[1, 2]\n",
+        "{not json\n",
+    ])
+    rejects = tmp_path / "rejects.jsonl"
+    with app.app_context():
+        assert import_incidents(path, rejects=str(rejects), log=lambda msg: None) == (1, 5)
+        assert _titles() == ["Good"]
+        # Offsets are stored as naive UTC
+        assert db.session.execute(db.select(Incident.start_time)).scalar() == datetime(2024, 1, 2, 8, 0)
+
+    lines = [json.loads(line) for line in rejects.read_text().splitlines()]
+    assert [line["row"] for line in lines] == [2, 3, 4, 5, 6]
+    assert set(lines[0]["errors"]) == {"title", "customer_name"}
+    assert lines[1]["errors"] == {"end_time": "End time cannot be before start time."}
+    assert lines[2]["errors"] == {"start_time": "Not a valid datetime value."}
+    assert lines[3] == {"row": 5, "errors": {"record": "Not a JSON object."}, "record": [1, 2]}
+    assert lines[4]["record"] == "{not json"
+
+
+def test_resume_after_crash(app, tmp_path, monkeypatch):
+    records = [{"title": f"Incident {n}", "customer_name": "VLTX"} for n in range(1, 6)]
+    path = _write_jsonl(tmp_path / "incidents.jsonl", records[:3] + ["[]\n"] + records[3:])
+    insert_batch = importer.insert_batch
+    calls = []
+
+    def crash_on_second_batch(*args):
+        calls.append(1)
+        if len(calls) == 2:
+            raise RuntimeError("power cut")
+        return insert_batch(*args)
+
+    with app.app_context():
+        monkeypatch.setattr(importer, "insert_batch", crash_on_second_batch)
+        with pytest.raises(RuntimeError):
+            import_incidents(path, batch_size=2, log=lambda msg: None)
+        assert _titles() == ["Incident 1", "Incident 2"]
+        assert read_checkpoint(path) == (2, 2)
+
+        monkeypatch.setattr(importer, "insert_batch", insert_batch)
+        assert import_incidents(path, batch_size=2, resume=True, log=lambda msg: None) == (3, 1)
+        assert _titles() == [f"Incident {n}" for n in range(1, 6)]
+        assert read_checkpoint(path) == (6, 5)
@@ -0,0 +1,41 @@
+"""Schema upgrades from the database shipped before any migration existed."""
+
+import os
+import shutil
+import sqlite3
+
+from app import create_app, db
+from app.migrations import MIGRATIONS, pending, upgrade
+
+BASELINE = os.path.join(os.path.dirname(__file__), os.pardir, "instance", "muims.db")
+
+
+def _app(monkeypatch, path):
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{path}")
+    monkeypatch.setenv("JINJA_CACHE_DIR", "")
+    monkeypatch.setenv("METRICS_ENABLED", "False")
+    return create_app()
+
+
+def test_upgrade_baseline_database(tmp_path, monkeypatch):
+    path = tmp_path / "baseline.db"
+    shutil.copy(BASELINE, path)
+    incidents, dated = sqlite3.connect(path).execute(
+        "SELECT count(*), count(created_at) FROM incident"
+    ).fetchone()
+
+    app = _app(monkeypatch, path)
+    with app.app_context():
+        assert [m.version for m in upgrade()] == [m.version for m in MIGRATIONS]
+        assert pending() == []
+        with db.engine.connect() as conn:
+            assert conn.execute(db.text("SELECT count(*) FROM incident")).scalar() == incidents
+            assert conn.execute(db.text("SELECT sum(incidents) FROM incident_daily")).scalar() == dated
+        db.engine.dispose()
+
+
+def test_status_of_empty_database(tmp_path, monkeypatch):
+    app = _app(monkeypatch, tmp_path / "empty.db")
+    with app.app_context():
+        assert pending() == MIGRATIONS
+        db.engine.dispose()
@@ -0,0 +1,62 @@
+"""Keyset pagination of the incident list."""
+
+from datetime import datetime, timedelta
+
+from app.models import Incident
+from app.pagination import decode_cursor, encode_cursor, keyset_paginate
+
+NOW = datetime(2024, 5, 1, 12, 0)
+
+
+def _walk(per_page):
+    """Page forward to the end, then back to the start; return both id lists."""
+    forward, page = [], keyset_paginate(Incident.query, per_page)
+    assert not page.has_prev
+    while True:
+        forward.append([i.id for i in page.items])
+        if not page.has_next:
+            break
+        page = keyset_paginate(Incident.query, per_page, after=page.next_cursor)
+    backward = [forward[-1]]
+    while page.has_prev:
+        page = keyset_paginate(Incident.query, per_page, before=page.prev_cursor)
+        backward.insert(0, [i.id for i in page.items])
+    return forward, backward
+
+
+def test_pages_forward_and_back(app, make_incident):
+    ids = [make_incident(created_at=NOW + timedelta(minutes=n)) for n in range(7)]
+    with app.app_context():
+        forward, backward = _walk(3)
+    assert forward == [ids[6:3:-1], ids[3:0:-1], ids[:1]]
+    assert backward == forward
+
+
+def test_ties_on_created_at_are_stable(app, make_incident):
+    ids = [make_incident(created_at=NOW) for _ in range(5)]
+    ids += [make_incident(created_at=NOW - timedelta(days=1)) for _ in range(3)]
+    with app.app_context():
+        forward, backward = _walk(2)
+    flat = [i for page in forward for i in page]
+    assert flat == sorted(ids[:5], reverse=True) + sorted(ids[5:], reverse=True)
+    assert backward == forward
+
+
+def test_first_and_last_pages(app, make_incident):
+    for n in range(3):
+        make_incident(created_at=NOW + timedelta(minutes=n))
+    with app.app_context():
+        page = keyset_paginate(Incident.query, 3)
+        assert len(page.items) == 3
+        assert not page.has_next and not page.has_prev
+        assert keyset_paginate(Incident.query, 5, after=encode_cursor("0000", 0)).items == []
+
+
+def test_bad_cursor_is_the_first_page(app, client, make_incident):
+    newest = make_incident(title="Newest incident", created_at=NOW)
+    assert decode_cursor("not a cursor") is None
+    assert decode_cursor(encode_cursor("2024", 1)) == ("2024", 1)
+    with app.app_context():
+        page = keyset_paginate(Incident.query, 1, after="not a cursor")
+        assert [i.id for i in page.items] == [newest]
+    assert "Newest incident" in client.get("/incidents?after=%%%").get_data(as_text=True)
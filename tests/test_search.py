@@ -0,0 +1,49 @@
+"""Incident search: FTS5 phrases and prefixes, and the archive's substring fallback."""
+
+from datetime import timedelta
+
+from app import db
+from app.archive import archive_incidents
+from app.filters import IncidentFilters, filtered_query
+from app.models import ArchivedIncident, Incident
+from app.search import build_match_expression
+
+
+def _ids(q, model=Incident):
+    query, _rank = filtered_query(IncidentFilters(q=q), db.select(model.id), model=model)
+    return sorted(db.session.execute(query).scalars())
+
+
+def test_match_expression_quotes_syntax():
+    assert build_match_expression("conv") == '"conv"*'
+    assert build_match_expression('"drive belt" pump') == '"drive belt" "pump"*'
+    assert build_match_expression('title:pump OR (belt') == '"title"* "pump"* "OR"* "belt"*'
+    assert build_match_expression("!! --") is None
+
+
+def test_prefix_and_phrase(app, make_incident):
+    torn = make_incident(title="Conveyor belt torn")
+    jammed = make_incident(title="Belt conveyor jammed")
+    pump = make_incident(title="Hydraulic pump leak", description="Seal worn")
+    with app.app_context():
+        assert _ids("conv") == [torn, jammed]
+        assert _ids('"belt torn"') == [torn]
+        assert _ids("seal") == [pump]
+        assert _ids("pump OR belt") == []
+
+
+def test_query_without_terms_matches_nothing(app, client, make_incident):
+    make_incident(title="Conveyor belt torn")
+    with app.app_context():
+        assert _ids("!!") == []
+    page = client.get("/incidents?q=!!").get_data(as_text=True)
+    assert "Conveyor belt torn" not in page
+
+
+def test_archive_falls_back_to_substring(app, make_old_resolved, make_incident):
+    archived = make_old_resolved(title="Gearbox rebuild")
+    make_incident(title="Gearbox check")
+    with app.app_context():
+        assert archive_incidents(timedelta(days=30)) == 1
+        assert _ids("box rebu", ArchivedIncident) == [archived]
+        assert _ids("box rebu") == []